@@ -18,6 +18,16 @@ class TitleList(BaseModel):
 
 load_dotenv()
 
+LLM_MODEL = "google/gemini-3-pro"
+
+# Bump when a prompt changes so cached analyses (services/video_knowledge.py) are regenerated
+PROMPT_VERSIONS = {
+    "outline": 1,
+    "script_structure": 1,
+    "summary": 1,
+    "thumbnail_analysis": 1,
+}
+
 THUMBNAIL_ANALYSIS_PROMPT = """YOU ARE A WORLD-CLASS VISUAL ANALYST, CINEMATOGRAPHER, AND DIGITAL MEDIA STRATEGIST. YOU HAVE PROFESSIONAL-LEVEL EXPERTISE IN CAMERA SYSTEMS, LENS THEORY, LIGHTING DESIGN, ANIMATION STYLES, COMPOSITING, AND YOUTUBE THUMBNAIL OPTIMIZATION.
 
 YOUR TASK IS TO **ANALYZE A PROVIDED IMAGE AND/OR YOUTUBE THUMBNAIL** AT BOTH A **PSYCHOLOGICAL** AND **TECHNICAL / CINEMATIC** LEVEL, THEN DELIVER CLEAR, ACTIONABLE, EXPERT-GRADE INSIGHTS.
@@ -327,7 +337,7 @@ Format the output as a clean Markdown outline."""
         def api_call():
             output = ""
             for event in request_client.stream(
-                "google/gemini-3-pro",
+                LLM_MODEL,
                 input={
                     "prompt": user_prompt,
                     "system_instruction": system_prompt,
@@ -380,7 +390,7 @@ Format the output as a clean Markdown outline."""
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
@@ -436,7 +446,7 @@ The new titles must:
         def api_call():
             output = ""
             for event in request_client.stream(
-                "google/gemini-3-pro",
+                LLM_MODEL,
                 input={
                     "prompt": user_prompt,
                     "system_instruction": system_prompt,
@@ -510,7 +520,7 @@ The new titles must:
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
@@ -560,7 +570,7 @@ to fit a NEW 'Main Concept'.
         def api_call():
             output = ""
             for event in request_client.stream(
-                "google/gemini-3-pro",
+                LLM_MODEL,
                 input={
                     "prompt": user_prompt,
                     "system_instruction": system_prompt,
@@ -610,7 +620,7 @@ to fit a NEW 'Main Concept'.
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
@@ -666,7 +676,7 @@ Guidelines:
         def api_call():
             output = ""
             for event in request_client.stream(
-                "google/gemini-3-pro",
+                LLM_MODEL,
                 input={
                     "prompt": user_prompt,
                     "system_instruction": system_prompt,
@@ -723,7 +733,7 @@ Guidelines:
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
@@ -766,7 +776,7 @@ def extract_title_structure(title: str) -> str:
         def api_call():
             output = ""
             for event in request_client.stream(
-                "google/gemini-3-pro",
+                LLM_MODEL,
                 input={
                     "prompt": user_prompt,
                     "system_instruction": system_prompt,
@@ -809,7 +819,7 @@ async def extract_title_structure_async(title: str, webhook_url: str) -> Any:
     
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
@@ -838,7 +848,7 @@ def extract_thumbnail_description(image_url: str) -> str:
         def api_call():
             output = ""
             for event in request_client.stream(
-                 "google/gemini-3-pro",
+                 LLM_MODEL,
                  input={
                      "prompt": "Describe the structural template of this thumbnail.",
                      "system_instruction": system_prompt,
@@ -868,7 +878,7 @@ async def extract_thumbnail_description_async(image_url: str, webhook_url: str)
     
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": "Describe the structural template of this thumbnail.",
             "system_instruction": system_prompt,
@@ -912,7 +922,7 @@ def summarize_video(transcript: str) -> str:
         def api_call():
             output = ""
             for event in request_client.stream(
-                "google/gemini-3-pro",
+                LLM_MODEL,
                 input={
                     "prompt": user_prompt,
                     "system_instruction": system_prompt,
@@ -962,7 +972,7 @@ async def summarize_video_async(transcript: Optional[str], webhook_url: str, vid
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input=input_payload,
         webhook=webhook_url,
         webhook_events_filter=["completed"]
@@ -983,7 +993,7 @@ async def summarize_video_async(transcript: Optional[str], webhook_url: str, vid
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
@@ -1033,7 +1043,7 @@ async def generate_thumbnail_concepts_async(concept_data: Dict[str, Any], titles
 
     client = replicate.Client(api_token=api_key)
     return await client.predictions.async_create(
-        version="google/gemini-3-pro",
+        version=LLM_MODEL,
         input={
             "prompt": user_prompt,
             "system_instruction": system_prompt,
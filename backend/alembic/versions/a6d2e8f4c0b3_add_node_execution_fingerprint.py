@@ -0,0 +1,28 @@
+"""Add node configuration fingerprint to node executions
+
+Revision ID: a6d2e8f4c0b3
+Revises: f5c1a7e3b9d2
+Create Date: 2026-10-19 18:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d2e8f4c0b3'
+down_revision: Union[str, Sequence[str], None] = 'f5c1a7e3b9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('nodeexecution', sa.Column('fingerprint', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('nodeexecution', 'fingerprint')
@@ -0,0 +1,37 @@
+"""Add video stats snapshots
+
+Revision ID: b3e1f0c2d4a6
+Revises: 4aa773e21e0c
+Create Date: 2026-10-19 10:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1f0c2d4a6'
+down_revision: Union[str, Sequence[str], None] = '4aa773e21e0c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('videostatssnapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('video_id', sa.String(), nullable=False),
+        sa.Column('captured_at', sa.BigInteger(), nullable=False),
+        sa.Column('view_count', sa.BigInteger(), nullable=False),
+        sa.Column('subscriber_count', sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_videostatssnapshot_video_captured', 'videostatssnapshot', ['video_id', 'captured_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_videostatssnapshot_video_captured', table_name='videostatssnapshot')
+    op.drop_table('videostatssnapshot')
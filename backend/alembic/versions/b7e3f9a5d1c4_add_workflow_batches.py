@@ -0,0 +1,54 @@
+"""Add workflow batches
+
+Revision ID: b7e3f9a5d1c4
+Revises: a6d2e8f4c0b3
+Create Date: 2026-10-19 21:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3f9a5d1c4'
+down_revision: Union[str, Sequence[str], None] = 'a6d2e8f4c0b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('workflowbatch',
+        sa.Column('id', sa.Uuid(), nullable=False),
+        sa.Column('workflow_id', sa.Uuid(), nullable=False),
+        sa.Column('user_id', sa.Uuid(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('parallelism', sa.Integer(), nullable=False),
+        sa.Column('credits_reserved', sa.Integer(), nullable=False),
+        sa.Column('credits_used', sa.Integer(), nullable=False),
+        sa.Column('completed_rows', sa.Integer(), nullable=False),
+        sa.Column('failed_rows', sa.Integer(), nullable=False),
+        sa.Column('execution_time_ms', sa.Integer(), nullable=True),
+        sa.Column('row_time_ms', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.BigInteger(), nullable=False),
+        sa.Column('completed_at', sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(['workflow_id'], ['aiworkflow.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.add_column('workflowexecution', sa.Column('batch_id', sa.Uuid(), nullable=True))
+    op.add_column('workflowexecution', sa.Column('batch_index', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_workflowexecution_batch_id'), 'workflowexecution', ['batch_id'], unique=False)
+    op.create_foreign_key('fk_workflowexecution_batch_id', 'workflowexecution', 'workflowbatch', ['batch_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_workflowexecution_batch_id', 'workflowexecution', type_='foreignkey')
+    op.drop_index(op.f('ix_workflowexecution_batch_id'), table_name='workflowexecution')
+    op.drop_column('workflowexecution', 'batch_index')
+    op.drop_column('workflowexecution', 'batch_id')
+    op.drop_table('workflowbatch')
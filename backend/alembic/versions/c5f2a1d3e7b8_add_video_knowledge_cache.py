@@ -0,0 +1,42 @@
+"""Add video knowledge cache
+
+Revision ID: c5f2a1d3e7b8
+Revises: b3e1f0c2d4a6
+Create Date: 2026-10-19 11:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f2a1d3e7b8'
+down_revision: Union[str, Sequence[str], None] = 'b3e1f0c2d4a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('videoknowledge',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('video_id', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('prompt_version', sa.Integer(), nullable=False),
+        sa.Column('input_hash', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.BigInteger(), nullable=False),
+        sa.Column('hit_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('video_id', 'kind', 'model', 'prompt_version', 'input_hash', name='unique_video_knowledge_key')
+    )
+    op.create_index(op.f('ix_videoknowledge_video_id'), 'videoknowledge', ['video_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_videoknowledge_video_id'), table_name='videoknowledge')
+    op.drop_table('videoknowledge')
@@ -0,0 +1,52 @@
+"""Add perceptual image hashes
+
+Revision ID: d7a3c9e1f2b4
+Revises: c5f2a1d3e7b8
+Create Date: 2026-10-19 14:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3c9e1f2b4'
+down_revision: Union[str, Sequence[str], None] = 'c5f2a1d3e7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('imagehash',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('item_type', sa.String(), nullable=False),
+        sa.Column('item_id', sa.Uuid(), nullable=False),
+        sa.Column('user_id', sa.Uuid(), nullable=True),
+        sa.Column('source_hash', sa.String(), nullable=False),
+        sa.Column('ahash', sa.BigInteger(), nullable=False),
+        sa.Column('dhash', sa.BigInteger(), nullable=False),
+        sa.Column('phash', sa.BigInteger(), nullable=False),
+        sa.Column('phash_band0', sa.Integer(), nullable=False),
+        sa.Column('phash_band1', sa.Integer(), nullable=False),
+        sa.Column('phash_band2', sa.Integer(), nullable=False),
+        sa.Column('phash_band3', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('item_type', 'item_id', name='unique_image_hash_item')
+    )
+    op.create_index(op.f('ix_imagehash_item_id'), 'imagehash', ['item_id'], unique=False)
+    op.create_index(op.f('ix_imagehash_user_id'), 'imagehash', ['user_id'], unique=False)
+    for band in range(4):
+        op.create_index(op.f(f'ix_imagehash_phash_band{band}'), 'imagehash', [f'phash_band{band}'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for band in range(4):
+        op.drop_index(op.f(f'ix_imagehash_phash_band{band}'), table_name='imagehash')
+    op.drop_index(op.f('ix_imagehash_user_id'), table_name='imagehash')
+    op.drop_index(op.f('ix_imagehash_item_id'), table_name='imagehash')
+    op.drop_table('imagehash')
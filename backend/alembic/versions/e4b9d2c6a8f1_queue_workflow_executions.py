@@ -0,0 +1,38 @@
+"""Queue workflow executions for background workers
+
+Revision ID: e4b9d2c6a8f1
+Revises: d7a3c9e1f2b4
+Create Date: 2026-10-19 16:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b9d2c6a8f1'
+down_revision: Union[str, Sequence[str], None] = 'd7a3c9e1f2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('workflowexecution', sa.Column('target_node_ids', sa.Text(), nullable=True))
+    op.add_column('workflowexecution', sa.Column('use_cache', sa.Boolean(), nullable=False, server_default=sa.true()))
+    op.add_column('workflowexecution', sa.Column('started_at', sa.BigInteger(), nullable=True))
+    op.add_column('workflowexecution', sa.Column('heartbeat_at', sa.BigInteger(), nullable=True))
+    op.add_column('workflowexecution', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.create_index('ix_workflowexecution_status_created', 'workflowexecution', ['status', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_workflowexecution_status_created', table_name='workflowexecution')
+    op.drop_column('workflowexecution', 'attempts')
+    op.drop_column('workflowexecution', 'heartbeat_at')
+    op.drop_column('workflowexecution', 'started_at')
+    op.drop_column('workflowexecution', 'use_cache')
+    op.drop_column('workflowexecution', 'target_node_ids')
@@ -0,0 +1,45 @@
+"""Add per-node execution records
+
+Revision ID: f5c1a7e3b9d2
+Revises: e4b9d2c6a8f1
+Create Date: 2026-10-19 17:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5c1a7e3b9d2'
+down_revision: Union[str, Sequence[str], None] = 'e4b9d2c6a8f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('nodeexecution',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('execution_id', sa.Uuid(), nullable=False),
+        sa.Column('node_id', sa.String(), nullable=False),
+        sa.Column('node_type', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('cached', sa.Boolean(), nullable=False),
+        sa.Column('output', sa.Text(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('credits_used', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.BigInteger(), nullable=False),
+        sa.Column('completed_at', sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(['execution_id'], ['workflowexecution.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('execution_id', 'node_id', name='unique_node_execution')
+    )
+    op.create_index(op.f('ix_nodeexecution_execution_id'), 'nodeexecution', ['execution_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_nodeexecution_execution_id'), table_name='nodeexecution')
+    op.drop_table('nodeexecution')
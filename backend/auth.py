@@ -1,3 +1,4 @@
+import os
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -12,9 +13,12 @@ from models import User
 SECRET_KEY = "supersecretkey"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 7 days
+# Comma-separated emails allowed to manage shared, cross-user data such as caches
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -66,6 +70,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: Session
         raise credentials_exception
     return user
 
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme), session: Session = Depends(get_session)) -> Optional[User]:
+    """The signed-in user, or None for anonymous requests and invalid tokens."""
+    if not token:
+        return None
+    try:
+        return await get_current_user(token=token, session=session)
+    except HTTPException:
+        return None
+
 async def get_active_subscriber(current_user: User = Depends(get_current_user)):
     if current_user.subscription_status not in ['active', 'trialing']:
         raise HTTPException(
@@ -74,6 +87,14 @@ async def get_active_subscriber(current_user: User = Depends(get_current_user)):
         )
     return current_user
 
+async def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return current_user
+
 import secrets
 import hashlib
 
@@ -0,0 +1,256 @@
+"""
+Benchmark for the viral tracker fetch pipeline.
+Replays recorded YouTube Data API responses with simulated network latency and
+compares the old sequential fetch loop with the concurrent pipeline.
+
+    python benchmark_viral.py                          # synthetic fixtures
+    python benchmark_viral.py --fixtures viral.json    # recorded fixtures
+    python benchmark_viral.py --record viral.json      # record from the live API (uses YOUTUBE_API_KEY)
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from services.youtube_quota import YouTubeQuota
+from services.viral_tracker import fetch_viral_candidates
+
+load_dotenv()
+
+FETCH_TARGET = 200
+
+
+def search_params():
+    published_after = (datetime.utcnow() - timedelta(days=1)).isoformat("T") + "Z"
+    return {
+        "part": "id,snippet",
+        "type": "video",
+        "publishedAfter": published_after,
+        "order": "viewCount",
+        "relevanceLanguage": "en",
+        "regionCode": "US",
+        "safeSearch": "moderate"
+    }
+
+
+def synthetic_fixtures(pages=4, per_page=50, channels=120):
+    fixtures = {"search_pages": [], "videos": {}, "channels": {}}
+    for page in range(pages):
+        items = []
+        for i in range(per_page):
+            video_id = f"vid{page:02d}{i:03d}"
+            channel_id = f"chan{(page * per_page + i) % channels:04d}"
+            items.append({"id": {"videoId": video_id}})
+            fixtures["videos"][video_id] = {
+                "id": video_id,
+                "snippet": {
+                    "channelId": channel_id,
+                    "title": f"Video {video_id}",
+                    "publishedAt": "2026-01-01T00:00:00Z",
+                    "defaultAudioLanguage": "en",
+                    "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+                },
+                "statistics": {"viewCount": str(1000000 - page * per_page - i)},
+            }
+            fixtures["channels"][channel_id] = {
+                "id": channel_id,
+                "snippet": {"title": f"Channel {channel_id}", "country": "US"},
+                "statistics": {"subscriberCount": "50000"},
+            }
+        page_response = {"items": items}
+        if page < pages - 1:
+            page_response["nextPageToken"] = f"page{page + 1}"
+        fixtures["search_pages"].append(page_response)
+    return fixtures
+
+
+class ReplayRequest:
+    def __init__(self, response, latency):
+        self.response = response
+        self.latency = latency
+
+    def execute(self):
+        time.sleep(self.latency)
+        return self.response
+
+
+class ReplayResource:
+    def __init__(self, fixtures, kind, latency):
+        self.fixtures = fixtures
+        self.kind = kind
+        self.latency = latency
+
+    def list(self, **params):
+        if self.kind == "search":
+            token = params.get("pageToken")
+            index = int(token[len("page"):]) if token else 0
+            return ReplayRequest(self.fixtures["search_pages"][index], self.latency)
+        items = [self.fixtures[self.kind][i] for i in params["id"].split(",") if i in self.fixtures[self.kind]]
+        return ReplayRequest({"items": items}, self.latency)
+
+
+class ReplayYouTube:
+    def __init__(self, fixtures, latency):
+        self.fixtures = fixtures
+        self.latency = latency
+
+    def search(self):
+        return ReplayResource(self.fixtures, "search", self.latency)
+
+    def videos(self):
+        return ReplayResource(self.fixtures, "videos", self.latency)
+
+    def channels(self):
+        return ReplayResource(self.fixtures, "channels", self.latency)
+
+
+def replay_quota(fixtures, latency):
+    quota = YouTubeQuota(["benchmark"], daily_budget=10 ** 9)
+    client = ReplayYouTube(fixtures, latency)
+    quota._client = lambda key: client
+    return quota
+
+
+def fetch_sequential(quota, params, fetch_target):
+    """The original one-call-at-a-time loop from get_viral_videos."""
+    video_ids = []
+    next_page_token = None
+    while len(video_ids) < fetch_target:
+        page_params = dict(params, maxResults=min(fetch_target - len(video_ids), 50))
+        if next_page_token:
+            page_params["pageToken"] = next_page_token
+        search_response = quota.execute("search.list", lambda yt: yt.search().list(**page_params))
+        if not search_response.get("items"):
+            break
+        video_ids.extend(item["id"]["videoId"] for item in search_response["items"])
+        next_page_token = search_response.get("nextPageToken")
+        if not next_page_token:
+            break
+
+    videos = []
+    for i in range(0, len(video_ids), 50):
+        batch = video_ids[i:i + 50]
+        videos.extend(quota.execute("videos.list", lambda yt: yt.videos().list(
+            part="statistics,snippet", id=",".join(batch))).get("items", []))
+
+    channel_ids = list(set(video["snippet"]["channelId"] for video in videos))
+    channels = {}
+    for i in range(0, len(channel_ids), 50):
+        batch = channel_ids[i:i + 50]
+        for channel in quota.execute("channels.list", lambda yt: yt.channels().list(
+                part="statistics,snippet", id=",".join(batch))).get("items", []):
+            channels[channel["id"]] = channel
+    return videos, channels
+
+
+def record_fixtures(path):
+    """Run the sequential loop against the live API and save every response."""
+    quota = YouTubeQuota.from_env()
+    if not quota.configured:
+        raise SystemExit("Set YOUTUBE_API_KEY to record fixtures")
+
+    fixtures = {"search_pages": [], "videos": {}, "channels": {}}
+    # Real page tokens are replaced by "page<N>" so replays can index search_pages
+    real_tokens = []
+    real_client = quota._client
+
+    class RecordingRequest:
+        def __init__(self, kind, request):
+            self.kind = kind
+            self.request = request
+
+        def execute(self):
+            response = self.request.execute()
+            if self.kind == "search":
+                if response.get("nextPageToken"):
+                    real_tokens.append(response["nextPageToken"])
+                    response = dict(response, nextPageToken=f"page{len(real_tokens)}")
+                fixtures["search_pages"].append(response)
+            else:
+                for item in response.get("items", []):
+                    fixtures[self.kind][item["id"]] = item
+            return response
+
+    class RecordingResource:
+        def __init__(self, kind, resource):
+            self.kind = kind
+            self.resource = resource
+
+        def list(self, **params):
+            token = params.get("pageToken")
+            if token:
+                params["pageToken"] = real_tokens[int(token[len("page"):]) - 1]
+            return RecordingRequest(self.kind, self.resource.list(**params))
+
+    class RecordingYouTube:
+        def __init__(self, client):
+            self.client = client
+
+        def search(self):
+            return RecordingResource("search", self.client.search())
+
+        def videos(self):
+            return RecordingResource("videos", self.client.videos())
+
+        def channels(self):
+            return RecordingResource("channels", self.client.channels())
+
+    quota._client = lambda key: RecordingYouTube(real_client(key))
+    fetch_sequential(quota, search_params(), FETCH_TARGET)
+
+    with open(path, "w") as f:
+        json.dump(fixtures, f)
+    print(f"Recorded {len(fixtures['search_pages'])} search pages, {len(fixtures['videos'])} videos, "
+          f"{len(fixtures['channels'])} channels to {path}")
+
+
+def run_benchmark(fixtures, latency, runs):
+    params = search_params()
+
+    sequential_times = []
+    for _ in range(runs):
+        quota = replay_quota(fixtures, latency)
+        start = time.perf_counter()
+        videos, channels = fetch_sequential(quota, params, FETCH_TARGET)
+        sequential_times.append(time.perf_counter() - start)
+    calls = quota.snapshot()["keys"][0]["calls"]
+
+    pipeline_times = []
+    for _ in range(runs):
+        quota = replay_quota(fixtures, latency)
+        start = time.perf_counter()
+        pipeline_videos, pipeline_channels = asyncio.run(fetch_viral_candidates(quota, params, FETCH_TARGET))
+        pipeline_times.append(time.perf_counter() - start)
+    pipeline_calls = quota.snapshot()["keys"][0]["calls"]
+
+    assert [v["id"] for v in videos] == [v["id"] for v in pipeline_videos], "pipeline changed video order"
+    assert set(channels) == set(pipeline_channels), "pipeline missed channels"
+
+    sequential = min(sequential_times)
+    pipeline = min(pipeline_times)
+    print(f"Simulated latency per call: {latency * 1000:.0f} ms, best of {runs} runs")
+    print(f"Sequential: {sequential:.2f}s  calls={calls}")
+    print(f"Pipeline:   {pipeline:.2f}s  calls={pipeline_calls}")
+    print(f"Speedup:    {sequential / pipeline:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", help="Recorded fixtures JSON to replay")
+    parser.add_argument("--record", help="Record live API responses to this path and exit")
+    parser.add_argument("--latency", type=float, default=0.25, help="Simulated seconds per API call")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record)
+    else:
+        if args.fixtures:
+            with open(args.fixtures) as f:
+                fixtures = json.load(f)
+        else:
+            fixtures = synthetic_fixtures()
+        run_benchmark(fixtures, args.latency, args.runs)
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, HTTPException
-from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from typing import List, Optional
 import uuid
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,6 +7,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import yt_dlp
+from yt_dlp.utils import download_range_func
 import os
 from pathlib import Path
 import shutil
@@ -17,16 +18,17 @@ from sqlalchemy.exc import IntegrityError
 # Load environment variables first
 load_dotenv()
 
-import threading
+import asyncio
 import time
 import json
+import math
 import statistics
 from sqlmodel import Session, select
 from database import get_session, engine, create_db_and_tables
 from models import Clip, Tag, ClipTagLink, User, Note, RefreshToken, Image, ImageTagLink
-from fastapi import Depends, status, Body
+from fastapi import Depends, status, Body, Query
 from fastapi.security import OAuth2PasswordRequestForm
-from auth import get_password_hash, verify_password, create_access_token, get_current_user, get_active_subscriber, ACCESS_TOKEN_EXPIRE_MINUTES, create_refresh_token, hash_token, REFRESH_TOKEN_EXPIRE_DAYS
+from auth import get_password_hash, verify_password, create_access_token, get_current_user, get_optional_user, get_active_subscriber, ACCESS_TOKEN_EXPIRE_MINUTES, create_refresh_token, hash_token, REFRESH_TOKEN_EXPIRE_DAYS
 from routers import ideation as ideation_router
 from routers import billing as billing_router
 from routers import users as users_router
@@ -42,8 +44,24 @@ from routers import webhooks
 from routers import jobs
 from routers import sparks
 from routers import transcribe
+from routers import metrics
+from routers import derivatives
 from dependencies import get_current_space
 from models import Space
+from services.youtube_quota import get_youtube_quota, QuotaExhausted
+from services.viral_tracker import fetch_viral_candidates
+from services.progress import get_progress_broker
+from services.media_cache import init_media_cache, run_media_cache_janitor, media_key
+from services.frame_capture import get_stream_url_cache, extract_frame, extract_frames
+from services.image_derivatives import derivative_urls
+from services.storyboards import get_storyboard_cache, tile_at
+from services.workflow_runner import get_workflow_runner
+from services.perceptual_hash import run_image_hash_indexer, ensure_hash, forget_hash, find_similar, describe_items, DEFAULT_SIMILAR_DISTANCE
+from services.media_governor import get_media_governor, MediaTimeout, YTDLP_SOCKET_TIMEOUT
+from services.download_manager import init_download_manager, DownloadQueueFull, PRIORITY_HIGH, PRIORITY_NORMAL
+from services.clip_stats import run_clip_stats_refresher, apply_clip_metrics, views_per_day, record_snapshot
+from services.video_knowledge import flush_hits as flush_knowledge_hits
+from services.trending import run_trending_refresher, read_cached_keywords, FALLBACK_KEYWORDS as TRENDING_FALLBACK_KEYWORDS
 
 # Valid base tags
 BASE_TAGS = {
@@ -95,7 +113,20 @@ async def lifespan(app: FastAPI):
             print("Replicate model cache initialized")
         except Exception as e:
             print(f"Warning: Could not initialize Replicate model cache: {e}")
+    
+    trending_task = asyncio.create_task(run_trending_refresher())
+    clip_stats_task = asyncio.create_task(run_clip_stats_refresher())
+    media_cache_task = asyncio.create_task(run_media_cache_janitor(media_cache))
+    image_hash_task = asyncio.create_task(run_image_hash_indexer())
+    workflow_runner = get_workflow_runner()
+    workflow_runner.start()
     yield
+    await workflow_runner.stop()
+    flush_knowledge_hits()
+    trending_task.cancel()
+    clip_stats_task.cancel()
+    media_cache_task.cancel()
+    image_hash_task.cancel()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -142,12 +173,21 @@ app.include_router(webhooks.router)
 app.include_router(jobs.router)
 app.include_router(sparks.router)
 app.include_router(transcribe.router)
+app.include_router(metrics.router)
+app.include_router(derivatives.router)
 
 # Ensure temp directory exists
 # forcing reload for env vars 2
 TEMP_DIR = Path(__file__).parent / "temp"
 TEMP_DIR.mkdir(exist_ok=True)
 
+# Index of downloaded videos and captured frames, bounded by size and age
+media_cache = init_media_cache(TEMP_DIR)
+
+# Resolved YouTube stream URLs for frame capture
+stream_urls = get_stream_url_cache()
+media_governor = get_media_governor()
+
 # Serve static files from temp directory
 app.mount("/temp", StaticFiles(directory=str(TEMP_DIR)), name="temp")
 
@@ -159,8 +199,11 @@ app.mount("/temp", StaticFiles(directory=str(TEMP_DIR)), name="temp")
 # else:
 #     print("WARNING: YOUTUBE_API_KEY not found in environment variables. Viral tracker will not work.")
 
-# Global progress storage
-download_progress = {}
+# Download progress pub/sub; finished tasks are evicted after a short retention
+progress_broker = get_progress_broker()
+
+# Bounded yt-dlp worker pool; queue positions are published as progress events
+download_manager = init_download_manager(publish=progress_broker.publish)
 
 class DownloadRequest(BaseModel):
     videoId: str
@@ -179,26 +222,27 @@ def progress_hook(d, task_id):
             elif '_percent_str' in d:
                 p = d.get('_percent_str', '0%').replace('%', '')
                 progress = float(p)
-            
-            # Debug log for progress
-            print(f"DEBUG: Task {task_id} - Progress: {progress}% - Keys: {list(d.keys())}")
+
         except Exception as e:
             print(f"Error calculating progress: {e}")
             progress = 0
         
-        download_progress[task_id] = {
+        progress_broker.publish(task_id, {
             "status": "downloading",
             "progress": progress,
             "speed": d.get('_speed_str', 'N/A'),
             "eta": d.get('_eta_str', 'N/A')
-        }
+        })
     elif d['status'] == 'finished':
-        print(f"DEBUG: Task {task_id} - Finished")
-        download_progress[task_id] = {
+        progress_broker.publish(task_id, {
             "status": "processing",
             "progress": 100,
             "message": "Processing video..."
-        }
+        })
+
+OUTLIER_SCORE_TIMEOUT = 45.0
+VIDEO_INFO_TIMEOUT = 60.0
+FALLBACK_SECTION_TIMEOUT = 120.0
 
 def calculate_outlier_score(video_view_count: int, channel_id: str):
     """
@@ -218,6 +262,7 @@ def calculate_outlier_score(video_view_count: int, channel_id: str):
             'playlistend': 30,    # Last 30 videos
             'quiet': True,
             'no_warnings': True,
+            'socket_timeout': YTDLP_SOCKET_TIMEOUT,
         }
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -248,6 +293,18 @@ def calculate_outlier_score(video_view_count: int, channel_id: str):
         print(f"Error calculating outlier score: {e}")
         return None, None
 
+async def governed_outlier_score(video_view_count: int, channel_id: str):
+    """calculate_outlier_score (a yt-dlp channel listing) in an "extract" slot; a slow listing yields no score."""
+    try:
+        return await media_governor.run_in_thread(
+            "extract",
+            lambda: calculate_outlier_score(video_view_count, channel_id),
+            timeout=OUTLIER_SCORE_TIMEOUT
+        )
+    except MediaTimeout as e:
+        print(f"Error calculating outlier score: {e}")
+        return None, None
+
 def run_download(video_id, task_id, output_template):
     video_url = f"https://www.youtube.com/watch?v={video_id}"
     
@@ -262,46 +319,98 @@ def run_download(video_id, task_id, output_template):
         # 'concurrent_fragment_downloads': 4, # Removed as it might cause throttling
         'extractor_args': {'youtube': {'player_client': ['android', 'web']}}, # Use android client for better speed
         'progress_hooks': [lambda d: progress_hook(d, task_id)],
+        'socket_timeout': YTDLP_SOCKET_TIMEOUT,
     }
     
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with media_governor.slot("download"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(video_url, download=True)
             filename = ydl.prepare_filename(info)
             basename = os.path.basename(filename)
             
-            print(f"DEBUG: Generated filename: {filename}")
-            print(f"DEBUG: Basename: {basename}")
+            # yt-dlp writes .part files and renames on completion, so the file is whole here
+            media_cache.add(video_id, "video", Path(filename))
             
-            download_progress[task_id] = {
+            progress_broker.publish(task_id, {
                 "status": "completed",
                 "progress": 100,
                 "url": f"/temp/{basename}",
                 "filename": basename
-            }
+            })
     except Exception as e:
         print(f"Download failed: {str(e)}")
-        download_progress[task_id] = {
+        progress_broker.publish(task_id, {
             "status": "error",
             "error": str(e)
-        }
+        })
+        # Let the worker pool count the failure
+        raise
+
+SEGMENT_QUALITIES = (360, 480, 720, 1080)
+
+def segment_format(start: int, end: int, quality: int, precise: bool) -> str:
+    """Media cache format key for an exported clip range."""
+    return f"segment:{start}-{end}:{quality}p" + (":precise" if precise else "")
+
+def run_segment_export(video_id, start, end, quality, precise, task_id):
+    """
+    Download only [start, end] of a video. By default streams are copied, so the cut
+    snaps to the surrounding keyframes; `precise` re-encodes at the cut points instead.
+    """
+    video_url = f"https://www.youtube.com/watch?v={video_id}"
+    base_name = f"{video_id}_{start}-{end}_{quality}p" + ("_precise" if precise else "")
+    
+    ydl_opts = {
+        'format': f'bestvideo[height<={quality}][ext=mp4]+bestaudio[ext=m4a]/best[height<={quality}][ext=mp4]/best[height<={quality}]',
+        'outtmpl': str(TEMP_DIR / f"{base_name}.%(ext)s"),
+        'merge_output_format': 'mp4',
+        'download_ranges': download_range_func(None, [(start, end)]),
+        'force_keyframes_at_cuts': precise,
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+        'extractor_args': {'youtube': {'player_client': ['android', 'web']}},
+        'progress_hooks': [lambda d: progress_hook(d, task_id)],
+        'socket_timeout': YTDLP_SOCKET_TIMEOUT,
+    }
+    
+    try:
+        with media_governor.slot("download"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(video_url, download=True)
+            downloads = info.get('requested_downloads') or []
+            filename = downloads[0]['filepath'] if downloads and downloads[0].get('filepath') else ydl.prepare_filename(info)
+            basename = os.path.basename(filename)
+            
+            media_cache.add(video_id, segment_format(start, end, quality, precise), Path(filename))
+            
+            progress_broker.publish(task_id, {
+                "status": "completed",
+                "progress": 100,
+                "url": f"/temp/{basename}",
+                "filename": basename
+            })
+    except Exception as e:
+        print(f"Segment export failed: {str(e)}")
+        progress_broker.publish(task_id, {
+            "status": "error",
+            "error": str(e)
+        })
+        raise
 
 @app.get("/api/info")
 async def get_video_info(videoId: str):
     if not videoId:
         raise HTTPException(status_code=400, detail="Missing videoId")
     
-    # Try using YouTube Data API first if key is available
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if api_key:
+    # Try using YouTube Data API first if a key with budget is available
+    quota = get_youtube_quota()
+    if quota.configured and quota.has_budget("videos.list", calls=2):
         try:
-            youtube = build("youtube", "v3", developerKey=api_key)
-            
             # Get video details
-            video_response = youtube.videos().list(
+            video_response = quota.execute("videos.list", lambda yt: yt.videos().list(
                 part="snippet,statistics,contentDetails",
                 id=videoId
-            ).execute()
+            ))
             
             if video_response.get("items"):
                 video_item = video_response["items"][0]
@@ -310,21 +419,17 @@ async def get_video_info(videoId: str):
                 channel_id = snippet["channelId"]
                 
                 # Get channel details for subscriber count
-                channel_response = youtube.channels().list(
+                channel_response = quota.execute("channels.list", lambda yt: yt.channels().list(
                     part="statistics",
                     id=channel_id
-                ).execute()
+                ))
                 
                 subscriber_count = 0
                 if channel_response.get("items"):
                     subscriber_count = int(channel_response["items"][0]["statistics"].get("subscriberCount", 0))
                 
                 # Calculate Outlier Score
-                loop = asyncio.get_event_loop()
-                outlier_score, channel_avg_views = await loop.run_in_executor(
-                    None, 
-                    lambda: calculate_outlier_score(int(statistics.get("viewCount", 0)), channel_id)
-                )
+                outlier_score, channel_avg_views = await governed_outlier_score(int(statistics.get("viewCount", 0)), channel_id)
 
                 return JSONResponse({
                     "title": snippet["title"],
@@ -347,12 +452,16 @@ async def get_video_info(videoId: str):
         'quiet': True,
         'no_warnings': True,
         'skip_download': True,
+        'socket_timeout': YTDLP_SOCKET_TIMEOUT,
     }
     
     try:
-        # Run in executor to avoid blocking the event loop
-        loop = asyncio.get_event_loop()
-        info = await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).extract_info(video_url, download=False))
+        # Run in a governed thread to avoid blocking the event loop
+        info = await media_governor.run_in_thread(
+            "extract",
+            lambda: yt_dlp.YoutubeDL(ydl_opts).extract_info(video_url, download=False),
+            timeout=VIDEO_INFO_TIMEOUT
+        )
 
 
         # Calculate Outlier Score
@@ -364,10 +473,7 @@ async def get_video_info(videoId: str):
         # Since we are already async, let's just call it.
         # Wait, calculate_outlier_score is blocking IO (yt-dlp). We should run it in executor.
         
-        outlier_score, channel_avg_views = await loop.run_in_executor(
-            None, 
-            lambda: calculate_outlier_score(view_count, channel_id)
-        )
+        outlier_score, channel_avg_views = await governed_outlier_score(view_count, channel_id)
 
         return JSONResponse({
             "title": info.get('title'),
@@ -384,69 +490,82 @@ async def get_video_info(videoId: str):
         print(f"Error fetching video info: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch video info")
 
+def _download_owner(http_request: Request, user: Optional[User]):
+    """
+    Identify who a download counts against for per-user limits: the signed-in user
+    when a valid bearer token is sent, otherwise the client address.
+    Returns (owner, authenticated).
+    """
+    if user is not None:
+        return f"user:{user.id}", True
+    client_host = http_request.client.host if http_request.client else "unknown"
+    return f"ip:{client_host}", False
+
 @app.post("/api/download")
-async def start_download(request: DownloadRequest):
+async def start_download(request: DownloadRequest, http_request: Request, current_user: Optional[User] = Depends(get_optional_user)):
     video_id = request.videoId
     if not video_id:
         raise HTTPException(status_code=400, detail="Missing videoId")
     
     # Check if file already exists
-    existing_files = [f for f in os.listdir(TEMP_DIR) if video_id in f and not f.endswith('.part')]
-    print(f"DEBUG: Checking for existing files with ID {video_id}. Found: {existing_files}")
-    
-    if existing_files:
+    cached_path = media_cache.lookup(video_id, "video")
+    if cached_path:
         return JSONResponse({
             "status": "exists",
-            "url": f"/temp/{existing_files[0]}",
-            "filename": existing_files[0]
+            "url": f"/temp/{cached_path.name}",
+            "filename": cached_path.name
         })
     
-    task_id = f"{video_id}_{int(time.time())}"
+    new_task_id = f"{video_id}_{int(time.time())}"
     output_template = str(TEMP_DIR / "%(title)s-%(id)s.%(ext)s")
     
-    # Initialize progress
-    download_progress[task_id] = {"status": "starting", "progress": 0}
-    
-    # Start background thread
-    thread = threading.Thread(
-        target=run_download,
-        args=(video_id, task_id, output_template)
-    )
-    thread.start()
+    # Queue on the bounded worker pool; signed-in users are served ahead of anonymous clients
+    owner, authenticated = _download_owner(http_request, current_user)
+    # A download of the same video already in flight is shared rather than repeated
+    try:
+        task_id, position = download_manager.submit(
+            new_task_id,
+            owner,
+            lambda: run_download(video_id, new_task_id, output_template),
+            priority=PRIORITY_HIGH if authenticated else PRIORITY_NORMAL,
+            key=media_key(video_id, "video")
+        )
+    except DownloadQueueFull:
+        raise HTTPException(status_code=429, detail="Too many downloads queued, try again shortly")
     
-    return JSONResponse({"taskId": task_id})
-
-import asyncio
+    return JSONResponse({"taskId": task_id, "queuePosition": position})
 
 @app.get("/api/download/progress/{task_id}")
 async def get_download_progress(task_id: str):
     async def event_generator():
-        while True:
-            if task_id in download_progress:
-                data = download_progress[task_id]
-                yield f"data: {json.dumps(data)}\n\n"
-                
-                if data["status"] in ["completed", "error"]:
-                    break
-            else:
-                yield f"data: {json.dumps({'status': 'error', 'error': 'Task not found'})}\n\n"
-                break
-            
-            await asyncio.sleep(0.1)
+        found = False
+        async for data in progress_broker.subscribe(task_id):
+            found = True
+            yield f"data: {json.dumps(data)}\n\n"
+        if not found:
+            yield f"data: {json.dumps({'status': 'error', 'error': 'Task not found'})}\n\n"
             
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+# Cache for viral feeds, keyed by (timeFilter, maxResults, q)
+viral_cache = {}
+VIRAL_CACHE_TTL = 15 * 60
+
 @app.get("/api/youtube/viral")
-def get_viral_videos(timeFilter: str = "today", maxResults: int = 50, q: str = None):
-    # Initialize client per request to ensure thread safety and fresh connections
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
+async def get_viral_videos(timeFilter: str = "today", maxResults: int = 50, q: str = None):
+    quota = get_youtube_quota()
+    if not quota.configured:
         raise HTTPException(status_code=503, detail="YouTube API not configured. Please set YOUTUBE_API_KEY.")
     
+    cache_key = (timeFilter, maxResults, q)
+    cached = viral_cache.get(cache_key)
+    if cached:
+        age = time.time() - cached["timestamp"]
+        # When the quota runs low, stop refreshing and serve whatever we have
+        if age < VIRAL_CACHE_TTL or quota.is_low():
+            return JSONResponse({"videos": cached["videos"], "cached": True})
+    
     try:
-        # Build service inside the request
-        youtube = build("youtube", "v3", developerKey=api_key)
-        
         # Calculate publishedAfter timestamp based on timeFilter
         now = datetime.utcnow()
         time_filters = {
@@ -462,78 +581,29 @@ def get_viral_videos(timeFilter: str = "today", maxResults: int = 50, q: str = N
         
         published_after = time_filters[timeFilter].isoformat("T") + "Z"
         
-        # Step 1: Search for recent videos (handling pagination for > 50 results)
-        video_ids = []
-        next_page_token = None
-        # Fetch more videos initially to allow for filtering
-        initial_fetch_target = 200
-        
-        while len(video_ids) < initial_fetch_target:
-            # Calculate how many more we need, capped at 50 per request
-            remaining = initial_fetch_target - len(video_ids)
-            current_limit = min(remaining, 50)
-            
-            search_params = {
-                "part": "id,snippet",
-                "type": "video",
-                "publishedAfter": published_after,
-                "order": "viewCount",
-                "maxResults": current_limit,
-                "relevanceLanguage": "en",
-                "regionCode": "US",
-                "safeSearch": "moderate"
-            }
-            
-            if q:
-                search_params["q"] = q
-            
-            if next_page_token:
-                search_params["pageToken"] = next_page_token
-                
-            search_response = youtube.search().list(**search_params).execute()
-            
-            if not search_response.get("items"):
-                break
-                
-            # Extract video IDs
-            new_ids = [item["id"]["videoId"] for item in search_response["items"]]
-            video_ids.extend(new_ids)
-            
-            next_page_token = search_response.get("nextPageToken")
-            if not next_page_token:
-                break
+        search_params = {
+            "part": "id,snippet",
+            "type": "video",
+            "publishedAfter": published_after,
+            "order": "viewCount",
+            "relevanceLanguage": "en",
+            "regionCode": "US",
+            "safeSearch": "moderate"
+        }
         
-        if not video_ids:
-            return JSONResponse({"videos": []})
+        if q:
+            search_params["q"] = q
         
-        # Step 2: Get video statistics (batching in chunks of 50)
-        all_videos_items = []
-        for i in range(0, len(video_ids), 50):
-            batch_ids = video_ids[i:i+50]
-            videos_response = youtube.videos().list(
-                part="statistics,snippet",
-                id=",".join(batch_ids)
-            ).execute()
-            all_videos_items.extend(videos_response.get("items", []))
+        # Fetch more videos initially to allow for filtering.
+        # Each search page costs 100 units, so fetch a single page when budget is low.
+        initial_fetch_target = 50 if quota.is_low() else 200
         
-        # Extract channel IDs
-        channel_ids = list(set([video["snippet"]["channelId"] for video in all_videos_items]))
+        # Steps 1-3: search pages, video statistics and channel statistics,
+        # fanned out concurrently as soon as the IDs they depend on are known
+        all_videos_items, channels = await fetch_viral_candidates(quota, search_params, initial_fetch_target)
         
-        # Step 3: Get channel statistics (batching in chunks of 50)
-        channels = {}
-        for i in range(0, len(channel_ids), 50):
-            batch_channel_ids = channel_ids[i:i+50]
-            channels_response = youtube.channels().list(
-                part="statistics,snippet",
-                id=",".join(batch_channel_ids)
-            ).execute()
-            
-            for channel in channels_response.get("items", []):
-                channels[channel["id"]] = {
-                    "subscriberCount": int(channel["statistics"].get("subscriberCount", 1)),
-                    "channelTitle": channel["snippet"]["title"],
-                    "country": channel["snippet"].get("country", "")
-                }
+        if not all_videos_items:
+            return JSONResponse({"videos": []})
         
         # Step 4: Filter, Calculate viral ratio and build response
         viral_videos = []
@@ -584,8 +654,17 @@ def get_viral_videos(timeFilter: str = "today", maxResults: int = 50, q: str = N
         # Now sort these 100 by viral ratio
         viral_videos.sort(key=lambda x: x["viralRatio"], reverse=True)
         
-        return JSONResponse({"videos": viral_videos})
+        viral_cache[cache_key] = {"timestamp": time.time(), "videos": viral_videos}
         
+        return JSONResponse({"videos": viral_videos})
+    
+    except HTTPException:
+        raise
+    except QuotaExhausted as e:
+        print(f"YouTube quota exhausted: {e}")
+        if cached:
+            return JSONResponse({"videos": cached["videos"], "cached": True})
+        raise HTTPException(status_code=503, detail="YouTube API quota exhausted for today. Please try again later.")
     except Exception as e:
         print(f"YouTube API error: {str(e)}")
         # Log the full traceback for debugging if needed
@@ -593,136 +672,13 @@ def get_viral_videos(timeFilter: str = "today", maxResults: int = 50, q: str = N
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"YouTube API error: {str(e)}")
 
-# Cache for trending keywords
-trending_cache = {
-    "timestamp": 0,
-    "keywords": []
-}
-
 @app.get("/api/youtube/trending-keywords")
 def get_trending_keywords():
-    # Check cache (1 hour)
-    if time.time() - trending_cache["timestamp"] < 3600 and trending_cache["keywords"]:
-        return JSONResponse({"keywords": trending_cache["keywords"]})
-
-    try:
-        # Scrape YouTube Trending (Gaming & Music) to get a mix
-        # Gaming: 4gIcGhpnYW1pbmdfY29ycHVzX21vc3RfcG9wdWxhcg%3D%3D
-        # Music:  4gIcGhptdXNpY19jb3JwdXNfbW9zdF9wb3B1bGFy
-        urls = [
-            "https://www.youtube.com/feed/trending?bp=4gIcGhpnYW1pbmdfY29ycHVzX21vc3RfcG9wdWxhcg%3D%3D", # Gaming
-            "https://www.youtube.com/feed/trending?bp=4gIcGhptdXNpY19jb3JwdXNfbW9zdF9wb3B1bGFy" # Music
-        ]
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept-Language": "en-US,en;q=0.9"
-        }
-        
-        import urllib.request
-        import re
-        from collections import Counter
-        
-        all_titles = []
-        
-        for url in urls:
-            try:
-                req = urllib.request.Request(url, headers=headers)
-                with urllib.request.urlopen(req, timeout=10) as response:
-                    html = response.read().decode("utf-8")
-                    
-                match = re.search(r'var ytInitialData = ({.*?});', html)
-                if match:
-                    data = json.loads(match.group(1))
-                    
-                    def extract_titles(obj):
-                        if isinstance(obj, dict):
-                            if "videoRenderer" in obj:
-                                video = obj["videoRenderer"]
-                                if "title" in video and "runs" in video["title"]:
-                                    all_titles.append(video["title"]["runs"][0]["text"])
-                                elif "title" in video and "simpleText" in video["title"]:
-                                    all_titles.append(video["title"]["simpleText"])
-                            
-                            if "gridVideoRenderer" in obj:
-                                video = obj["gridVideoRenderer"]
-                                if "title" in video and "runs" in video["title"]:
-                                    all_titles.append(video["title"]["runs"][0]["text"])
-                                elif "title" in video and "simpleText" in video["title"]:
-                                    all_titles.append(video["title"]["simpleText"])
-
-                            for key, value in obj.items():
-                                extract_titles(value)
-                        elif isinstance(obj, list):
-                            for item in obj:
-                                extract_titles(item)
-                                
-                    extract_titles(data)
-            except Exception as e:
-                print(f"Error scraping {url}: {e}")
-                continue
-
-        if not all_titles:
-            # Fallback if scraping fails entirely
-            return JSONResponse({"keywords": ["Minecraft", "Fortnite", "Roblox", "GTA 6", "Taylor Swift", "MrBeast", "Elden Ring", "SpaceX", "AI", "ChatGPT"]})
-
-        # Extract keywords logic
-        stop_words = set([
-            "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by", 
-            "is", "are", "was", "were", "be", "been", "this", "that", "it", "i", "you", "he", "she", 
-            "we", "they", "my", "your", "his", "her", "our", "their", "what", "which", "who", "whom", 
-            "whose", "how", "where", "when", "why", "video", "youtube", "channel", "subscribe", "like", 
-            "comment", "share", "official", "music", "video", "lyric", "lyrics", "full", "hd", "hq", 
-            "4k", "1080p", "2024", "2025", "new", "vs", "feat", "ft", "live", "stream", "trailer", 
-            "episode", "season", "part", "gameplay", "walkthrough", "review", "reaction", "highlights",
-            "moment", "moments", "best", "top", "funny", "compilation", "clip", "clips", "shorts"
-        ])
-        
-        phrases = []
-        for title in all_titles:
-            title_lower = title.lower()
-            clean_title = re.sub(r'[^\w\s]', ' ', title_lower)
-            words = clean_title.split()
-            
-            # 3-grams
-            for i in range(len(words) - 2):
-                if any(w in stop_words for w in [words[i], words[i+1], words[i+2]]):
-                    if words[i] in stop_words or words[i+2] in stop_words:
-                        continue
-                phrases.append(f"{words[i]} {words[i+1]} {words[i+2]}")
-
-            # 4-grams
-            for i in range(len(words) - 3):
-                if words[i] in stop_words or words[i+3] in stop_words:
-                    continue
-                phrases.append(f"{words[i]} {words[i+1]} {words[i+2]} {words[i+3]}")
-                
-        # Get top 20 most common phrases
-        counts = Counter(phrases)
-        common = counts.most_common(30)
-        
-        keywords = []
-        seen = set()
-        for item in common:
-            phrase = item[0]
-            if phrase not in seen:
-                keywords.append(phrase)
-                seen.add(phrase)
-        
-        result = keywords[:20]
-        
-        # Update cache
-        trending_cache["timestamp"] = time.time()
-        trending_cache["keywords"] = result
-        
-        return JSONResponse({"keywords": result})
-
-    except Exception as e:
-        print(f"Error fetching trending keywords: {str(e)}")
-        # Return cache if available even if expired, or fallback
-        if trending_cache["keywords"]:
-             return JSONResponse({"keywords": trending_cache["keywords"]})
-        return JSONResponse({"keywords": []})
+    # Served from the shared cache kept fresh by run_trending_refresher; requests never scrape
+    cached = read_cached_keywords()
+    if cached and cached.get("keywords"):
+        return JSONResponse({"keywords": cached["keywords"]})
+    return JSONResponse({"keywords": TRENDING_FALLBACK_KEYWORDS})
 
 class CaptureRequest(BaseModel):
     videoId: str
@@ -742,67 +698,35 @@ async def capture_thumbnail(request: CaptureRequest):
     base_filename = f"{video_id}_{int(timestamp)}"
     temp_video_path = TEMP_DIR / f"{base_filename}.mp4"
     output_image_path = TEMP_DIR / f"{base_filename}.jpg"
+    # ffmpeg writes here; it is renamed into place only once complete
+    partial_image_path = media_cache.partial_path(output_image_path)
     
     print(f"DEBUG: Output path: {output_image_path}")
 
+    frame_format = f"frame:{int(timestamp)}"
+
     # Return existing if available
-    if output_image_path.exists():
+    cached_path = media_cache.lookup(video_id, frame_format)
+    if cached_path:
          print("DEBUG: Returning existing thumbnail")
-         return JSONResponse({"url": f"/temp/{output_image_path.name}"})
+         return JSONResponse({"url": f"/temp/{cached_path.name}"})
 
     try:
         print("DEBUG: Starting capture process...")
-        # 1. Get the streaming URL using yt-dlp
-        cmd_get_url = [
-            "yt-dlp",
-            "-g",
-            "-f", "bestvideo[height<=720]/best[height<=720]",
-            f"https://www.youtube.com/watch?v={video_id}"
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd_get_url,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        try:
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=15.0) # Increased timeout
-        except asyncio.TimeoutError:
-            process.kill()
-            print("DEBUG: yt-dlp -g timed out")
-            # Don't raise immediately, try fallback
-            stdout = b""
-            stderr = b"Timeout"
-        
-        if process.returncode != 0 or not stdout:
-            print(f"yt-dlp error (will try fallback): {stderr.decode()}")
-            stream_url = None
-        else:
-            stream_url = stdout.decode().strip().split('\n')[0]
+        # 1. Get the streaming URL (cached per video until its signed expiry)
+        was_cached = stream_urls.is_cached(video_id)
+        stream_url = await stream_urls.resolve(video_id)
 
         if stream_url:
             # 2. Use ffmpeg to extract the frame directly from the stream
-            cmd_ffmpeg = [
-                "ffmpeg",
-                "-ss", str(timestamp),
-                "-i", stream_url,
-                "-frames:v", "1",
-                "-q:v", "2",
-                "-y", # Overwrite
-                str(output_image_path)
-            ]
-            
-            process_ffmpeg = await asyncio.create_subprocess_exec(
-                *cmd_ffmpeg,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout_ffmpeg, stderr_ffmpeg = await process_ffmpeg.communicate()
-            
-            if process_ffmpeg.returncode != 0:
-                print(f"ffmpeg stream capture failed: {stderr_ffmpeg.decode()}")
-
-        if not output_image_path.exists():
+            if not await extract_frame(stream_url, timestamp, partial_image_path) and was_cached:
+                # The cached URL may have been revoked early; resolve once more
+                stream_urls.invalidate(video_id)
+                stream_url = await stream_urls.resolve(video_id)
+                if stream_url:
+                    await extract_frame(stream_url, timestamp, partial_image_path)
+
+        if not partial_image_path.exists():
              # Fallback: Try downloading a small section if streaming fails (slower but more robust)
              print("Direct stream capture failed or skipped, trying download section...")
              
@@ -812,32 +736,20 @@ async def capture_thumbnail(request: CaptureRequest):
                 'download_ranges': lambda info, ydl: [{'start_time': timestamp, 'end_time': timestamp + 1}],
                 'quiet': True,
                 'force_keyframes_at_cuts': True,
+                'socket_timeout': YTDLP_SOCKET_TIMEOUT,
              }
              
-             # Run blocking yt-dlp in thread
+             # Run blocking yt-dlp in a governed thread
              try:
-                 loop = asyncio.get_event_loop()
-                 await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).download([f"https://www.youtube.com/watch?v={video_id}"]))
+                 await media_governor.run_in_thread(
+                     "download",
+                     lambda: yt_dlp.YoutubeDL(ydl_opts).download([f"https://www.youtube.com/watch?v={video_id}"]),
+                     timeout=FALLBACK_SECTION_TIMEOUT
+                 )
                  
                  if temp_video_path.exists():
                      # Now extract frame from local file
-                     cmd_ffmpeg_local = [
-                        "ffmpeg",
-                        "-i", str(temp_video_path),
-                        "-frames:v", "1",
-                        "-q:v", "2",
-                        "-y",
-                        str(output_image_path)
-                     ]
-                     
-                     process_local = await asyncio.create_subprocess_exec(
-                        *cmd_ffmpeg_local,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE
-                     )
-                     out, err = await process_local.communicate()
-                     if process_local.returncode != 0:
-                         print(f"ffmpeg local capture failed: {err.decode()}")
+                     await extract_frame(str(temp_video_path), 0, partial_image_path)
                      
                      # Cleanup temp video
                      os.remove(temp_video_path)
@@ -847,17 +759,104 @@ async def capture_thumbnail(request: CaptureRequest):
              except Exception as e:
                  print(f"Fallback download exception: {str(e)}")
 
-        if output_image_path.exists():
+        if partial_image_path.exists():
+            await asyncio.to_thread(media_cache.commit_file, video_id, frame_format, partial_image_path, output_image_path)
             return JSONResponse({"url": f"/temp/{output_image_path.name}"})
         else:
             raise Exception("Failed to generate thumbnail image after all attempts")
 
     except Exception as e:
+        if partial_image_path.exists():
+            partial_image_path.unlink()
         print(f"Thumbnail capture error: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+MAX_BATCH_CAPTURE = 12
+
+class BatchCaptureRequest(BaseModel):
+    videoId: str
+    timestamps: List[float]
+
+@app.post("/api/capture-thumbnails")
+async def capture_thumbnails(request: BatchCaptureRequest):
+    """
+    Capture several candidate frames in one round trip. Cached frames are reused and
+    the rest are extracted by a single ffmpeg process from the cached stream URL.
+    """
+    video_id = request.videoId
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Missing videoId")
+    # The JSON parser accepts NaN and Infinity, which have no whole second
+    if not all(math.isfinite(t) for t in request.timestamps):
+        raise HTTPException(status_code=400, detail="timestamps must be finite numbers of seconds")
+    # Frames are cached per whole second, so sub-second duplicates collapse
+    seconds = sorted({int(t) for t in request.timestamps if t >= 0})
+    if not seconds:
+        raise HTTPException(status_code=400, detail="Missing timestamps")
+    if len(seconds) > MAX_BATCH_CAPTURE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_CAPTURE} timestamps per request")
+
+    frames = {}
+    missing = []
+    for second in seconds:
+        cached_path = media_cache.lookup(video_id, f"frame:{second}")
+        if cached_path:
+            frames[second] = f"/temp/{cached_path.name}"
+        else:
+            missing.append(second)
+
+    if missing:
+        stream_url = await stream_urls.resolve(video_id)
+        if not stream_url:
+            raise HTTPException(status_code=502, detail="Could not resolve video stream")
+
+        final_paths = [TEMP_DIR / f"{video_id}_{second}.jpg" for second in missing]
+        partial_paths = [media_cache.partial_path(path) for path in final_paths]
+        written = await extract_frames(stream_url, [float(second) for second in missing], partial_paths)
+        if not any(written):
+            # Possibly a revoked URL; drop it so the next call resolves a fresh one
+            stream_urls.invalidate(video_id)
+
+        for second, ok, partial_path, final_path in zip(missing, written, partial_paths, final_paths):
+            if ok:
+                await asyncio.to_thread(media_cache.commit_file, video_id, f"frame:{second}", partial_path, final_path)
+                frames[second] = f"/temp/{final_path.name}"
+
+    return JSONResponse({
+        "frames": [{"timestamp": second, "url": frames[second]} for second in seconds if second in frames],
+        "failed": [second for second in seconds if second not in frames]
+    })
+
+@app.get("/api/storyboard/{video_id}")
+async def get_storyboard(video_id: str, t: Optional[str] = None):
+    """
+    Low-resolution storyboard sprites covering the whole video, for scrubbing without
+    a capture per guess. `t` is an optional comma-separated list of timestamps to
+    resolve to tiles; the client can also compute tiles itself from the returned grid.
+    Only the final chosen moment needs /api/capture-thumbnail.
+    """
+    try:
+        timestamps = [float(value) for value in t.split(",") if value.strip()] if t else []
+    except ValueError:
+        raise HTTPException(status_code=400, detail="t must be a comma-separated list of seconds")
+    # float() also parses "nan" and "inf", which cannot be mapped to a tile
+    if not all(math.isfinite(timestamp) for timestamp in timestamps):
+        raise HTTPException(status_code=400, detail="t must be a comma-separated list of seconds")
+    
+    try:
+        storyboard = await get_storyboard_cache().get(video_id)
+    except MediaTimeout:
+        raise HTTPException(status_code=504, detail="Timed out fetching storyboard")
+    except Exception as e:
+        print(f"Storyboard fetch failed for {video_id}: {e}")
+        raise HTTPException(status_code=502, detail="Could not fetch storyboard")
+    if storyboard is None:
+        raise HTTPException(status_code=404, detail="No storyboard available for this video")
+    
+    return JSONResponse(dict(storyboard, tiles=[tile_at(storyboard, timestamp) for timestamp in timestamps]))
+
 @app.delete("/api/cleanup")
 async def cleanup_video(request: CleanupRequest):
     filename = request.filename
@@ -871,6 +870,7 @@ async def cleanup_video(request: CleanupRequest):
     
     file_path = TEMP_DIR / filename
     
+    await asyncio.to_thread(media_cache.remove_file, filename)
     if file_path.exists():
         os.unlink(file_path)
         print(f"Deleted file: {file_path}")
@@ -1032,6 +1032,8 @@ def read_clips(
         clip_dict = clip.model_dump()
         clip_dict["tagIds"] = [tag.id for tag in clip.tags]
         clip_dict["spaceId"] = str(clip.space_id) if clip.space_id else None
+        # Resized WebP variants for grids; `thumbnail` stays the original URL
+        clip_dict["thumbnailVariants"] = derivative_urls(clip.thumbnail)
         
         # Include granular notes
         clip_dict["notesList"] = [note.model_dump() for note in clip.notes_list]
@@ -1119,34 +1121,13 @@ def create_clip(
             if tag:
                 clip.tags.append(tag)
     
-    # Calculate metrics
-    if clip.viewCount is not None and clip.subscriberCount is not None and clip.subscriberCount > 0:
-        # Calculate metrics
-        try:
-            # Viral Ratio (Raw)
-            viral_ratio_norm = 0.0
-            if clip.subscriberCount and clip.subscriberCount > 0:
-                clip.viralRatio = clip.viewCount / clip.subscriberCount
-                # Normalize for Engagement Score calculation
-                # 0.01x = 0, 1x = 5, 100x = 10
-                import math
-                viral_ratio_norm = min(10.0, max(0.0, (math.log10(max(clip.viralRatio, 0.0001)) + 2) * 2.5))
-            
-            # Time Ratio / Velocity (Normalized 0-10)
-            upload_dt = datetime.strptime(clip.uploadDate, "%Y%m%d")
-            days_since = (datetime.now() - upload_dt).days
-            if days_since < 1: days_since = 1
-            raw_velocity = clip.viewCount / days_since
-            # 100k views/day = 10
-            clip.timeSinceUploadRatio = min(10.0, (math.log10(raw_velocity + 1) / 5) * 10)
-            
-            # Engagement Score (Average of Normalized Ratios)
-            if clip.viralRatio is not None and clip.timeSinceUploadRatio is not None:
-                clip.engagementScore = (viral_ratio_norm + clip.timeSinceUploadRatio) / 2
-            
-                
-        except ValueError:
-            pass
+    # Calculate metrics. Velocity comes from stored snapshots when another save or the
+    # stats refresher already built a series for this video, otherwise it is estimated.
+    apply_clip_metrics(clip, views_per_day(session, clip.videoId))
+    
+    # Seed the time series so the refresher has a starting point
+    if clip.viewCount is not None:
+        record_snapshot(session, clip.videoId, clip.viewCount, clip.subscriberCount)
             
     session.add(clip)
     session.commit()
@@ -1167,6 +1148,8 @@ def update_clip(
         raise HTTPException(status_code=404, detail="Clip not found")
     
     clip_data_dict = clip_data.model_dump(exclude={"tagIds", "spaceId", "folderId"})
+    if clip_data_dict.get("thumbnail") != clip.thumbnail:
+        forget_hash(session, "clip", clip.id)
     for key, value in clip_data_dict.items():
         setattr(clip, key, value)
     
@@ -1198,6 +1181,76 @@ def update_clip(
     session.refresh(clip)
     return clip
 
+@app.get("/api/clips/{clip_id}/similar")
+async def get_similar_clips(
+    clip_id: uuid.UUID,
+    max_distance: int = Query(DEFAULT_SIMILAR_DISTANCE, ge=0, le=32),
+    limit: int = Query(20, ge=1, le=100),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_active_subscriber)
+):
+    """Clips and saved images whose thumbnails look like this clip's, closest first."""
+    clip = session.exec(select(Clip).where(Clip.id == clip_id, Clip.user_id == current_user.id)).first()
+    if not clip:
+        raise HTTPException(status_code=404, detail="Clip not found")
+    
+    clip_hash = await ensure_hash(session, "clip", clip.id, clip.user_id, clip.thumbnail)
+    if not clip_hash:
+        raise HTTPException(status_code=422, detail="Thumbnail could not be analysed")
+    
+    matches = find_similar(session, current_user.id, clip_hash.phash, max_distance, limit, exclude=("clip", clip.id))
+    return describe_items(session, matches)
+
+class ClipExportRequest(BaseModel):
+    quality: int = 720
+    precise: bool = False
+
+@app.post("/api/clips/{clip_id}/export")
+def export_clip(
+    clip_id: uuid.UUID,
+    http_request: Request,
+    request: ClipExportRequest = Body(default_factory=ClipExportRequest),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Export just the saved range of a clip as an MP4. Returns the cached file when the
+    same (videoId, start, end, quality) was exported before, otherwise a taskId whose
+    progress streams from /api/download/progress/{taskId}.
+    """
+    clip = session.exec(select(Clip).where(Clip.id == clip_id, Clip.user_id == current_user.id)).first()
+    if not clip:
+        raise HTTPException(status_code=404, detail="Clip not found")
+    if clip.start is None or clip.end is None or clip.end <= clip.start:
+        raise HTTPException(status_code=400, detail="Clip has no valid start/end range")
+    if request.quality not in SEGMENT_QUALITIES:
+        raise HTTPException(status_code=400, detail=f"quality must be one of {list(SEGMENT_QUALITIES)}")
+    
+    video_id, start, end = clip.videoId, clip.start, clip.end
+    cached_path = media_cache.lookup(video_id, segment_format(start, end, request.quality, request.precise))
+    if cached_path:
+        return JSONResponse({
+            "status": "exists",
+            "url": f"/temp/{cached_path.name}",
+            "filename": cached_path.name
+        })
+    
+    new_task_id = f"{video_id}_{start}-{end}_{request.quality}_{int(time.time())}"
+    # Same identity as start_download, so exports and downloads share one per-user limit
+    owner, _ = _download_owner(http_request, current_user)
+    try:
+        task_id, position = download_manager.submit(
+            new_task_id,
+            owner,
+            lambda: run_segment_export(video_id, start, end, request.quality, request.precise, new_task_id),
+            priority=PRIORITY_HIGH,
+            key=media_key(video_id, segment_format(start, end, request.quality, request.precise))
+        )
+    except DownloadQueueFull:
+        raise HTTPException(status_code=429, detail="Too many downloads queued, try again shortly")
+    
+    return JSONResponse({"taskId": task_id, "queuePosition": position})
+
 @app.delete("/api/clips/{clip_id}")
 def delete_clip(clip_id: str, session: Session = Depends(get_session), current_user: User = Depends(get_active_subscriber)):
     clip = session.exec(select(Clip).where(Clip.id == clip_id, Clip.user_id == current_user.id)).first()
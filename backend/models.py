@@ -2,7 +2,7 @@ import uuid
 from typing import List, Optional
 from datetime import datetime
 from sqlmodel import Field, Relationship, SQLModel
-from sqlalchemy import BigInteger, Text, UniqueConstraint
+from sqlalchemy import BigInteger, Index, Text, UniqueConstraint
 # from enum import Enum # Removed as it's no longer used
 from sqlalchemy import BigInteger, Text, UniqueConstraint
 
@@ -166,6 +166,53 @@ class Clip(SQLModel, table=True):
     thumbnail_templates: List["ThumbnailTemplate"] = Relationship(back_populates="sources", link_model=ThumbnailTemplateClipLink)
     script_templates: List["ScriptTemplate"] = Relationship(back_populates="sources", link_model=ScriptTemplateClipLink)
 
+class VideoStatsSnapshot(SQLModel, table=True):
+    """Point-in-time YouTube statistics for a saved video, shared by every clip of that video"""
+    __table_args__ = (
+        Index("ix_videostatssnapshot_video_captured", "video_id", "captured_at"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    video_id: str
+    captured_at: int = Field(sa_type=BigInteger)  # Milliseconds timestamp
+    view_count: int = Field(sa_type=BigInteger)
+    subscriber_count: Optional[int] = Field(default=None, sa_type=BigInteger)
+
+class VideoKnowledge(SQLModel, table=True):
+    """Shared AI analysis/transcript of a YouTube video, reused across users and clips"""
+    __table_args__ = (
+        UniqueConstraint("video_id", "kind", "model", "prompt_version", "input_hash", name="unique_video_knowledge_key"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    video_id: str = Field(index=True)
+    kind: str  # transcript, outline, script_structure, summary, thumbnail_analysis
+    model: str
+    prompt_version: int
+    input_hash: str = Field(default="")  # hash of non-video inputs (title, thumbnail URL), or the transcript source
+    content: str = Field(sa_type=Text)
+    created_at: int = Field(sa_type=BigInteger)
+    hit_count: int = Field(default=0)
+
+class ImageHash(SQLModel, table=True):
+    """Perceptual hashes of a saved image or clip thumbnail, for near-duplicate and similarity lookups"""
+    __table_args__ = (
+        UniqueConstraint("item_type", "item_id", name="unique_image_hash_item"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    item_type: str  # 'image' | 'clip'
+    item_id: uuid.UUID = Field(index=True)
+    user_id: Optional[uuid.UUID] = Field(default=None, index=True)
+    source_hash: str  # hash of the URL that was hashed; recomputed when it changes
+    # 64-bit hashes stored as signed BIGINT
+    ahash: int = Field(sa_type=BigInteger)
+    dhash: int = Field(sa_type=BigInteger)
+    phash: int = Field(sa_type=BigInteger)
+    # 16-bit slices of phash; items within Hamming distance 3 share at least one
+    phash_band0: int = Field(index=True)
+    phash_band1: int = Field(index=True)
+    phash_band2: int = Field(index=True)
+    phash_band3: int = Field(index=True)
+    created_at: int = Field(sa_type=BigInteger)
+
 class Note(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     content: str
@@ -292,8 +339,29 @@ class AIWorkflow(SQLModel, table=True):
     
     executions: List["WorkflowExecution"] = Relationship(back_populates="workflow")
 
+class WorkflowBatch(SQLModel, table=True):
+    """One workflow run over many rows of inputs; each row is a WorkflowExecution"""
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    workflow_id: uuid.UUID = Field(foreign_key="aiworkflow.id")
+    user_id: uuid.UUID = Field(foreign_key="user.id")
+    status: str = Field(default="running")  # 'running', 'completed', 'cancelled'
+    row_count: int
+    parallelism: int  # Rows of this batch running at the same time, at most
+    # Taken up front for every row; the difference to credits_used is settled once all rows finished
+    credits_reserved: int = Field(default=0)
+    credits_used: int = Field(default=0)
+    completed_rows: int = Field(default=0)
+    failed_rows: int = Field(default=0)  # Failed or cancelled
+    execution_time_ms: Optional[int] = None  # Wall time from submission to the last row
+    row_time_ms: Optional[int] = None  # Sum of the rows' own execution times
+    created_at: int = Field(sa_type=BigInteger)
+    completed_at: Optional[int] = Field(default=None, sa_type=BigInteger)  # Set when settled
+
 class WorkflowExecution(SQLModel, table=True):
     """Tracks execution history and results"""
+    __table_args__ = (
+        Index("ix_workflowexecution_status_created", "status", "created_at"),
+    )
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     workflow_id: uuid.UUID = Field(foreign_key="aiworkflow.id")
     status: str = Field(default="pending")  # 'pending', 'running', 'completed', 'failed', 'cancelled'
@@ -305,12 +373,41 @@ class WorkflowExecution(SQLModel, table=True):
     created_at: int = Field(sa_type=BigInteger)
     completed_at: Optional[int] = Field(default=None, sa_type=BigInteger)
     
+    # Run request, kept so a queued execution can be picked up by any worker
+    target_node_ids: Optional[str] = Field(default=None, sa_type=Text)  # JSON list
+    use_cache: bool = Field(default=True)
+    # Worker bookkeeping: a running execution whose heartbeat stops is requeued
+    started_at: Optional[int] = Field(default=None, sa_type=BigInteger)
+    heartbeat_at: Optional[int] = Field(default=None, sa_type=BigInteger)
+    attempts: int = Field(default=0)
+    # Row of a batch run, if any
+    batch_id: Optional[uuid.UUID] = Field(default=None, foreign_key="workflowbatch.id", index=True)
+    batch_index: Optional[int] = None
+    
     user_id: uuid.UUID = Field(foreign_key="user.id")
     user: Optional[User] = Relationship(back_populates="workflow_executions")
     
     workflow: Optional[AIWorkflow] = Relationship(back_populates="executions")
     credit_transactions: List["CreditTransaction"] = Relationship(back_populates="workflow_execution")
 
+class NodeExecution(SQLModel, table=True):
+    """State of one node within a workflow execution"""
+    __table_args__ = (
+        UniqueConstraint("execution_id", "node_id", name="unique_node_execution"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    execution_id: uuid.UUID = Field(foreign_key="workflowexecution.id", index=True)
+    node_id: str
+    node_type: str
+    status: str = Field(default="running")  # 'running', 'completed', 'failed', 'cancelled'
+    cached: bool = Field(default=False)  # Output reused from an earlier run
+    fingerprint: Optional[str] = None  # Node configuration the output was computed with
+    output: Optional[str] = Field(default=None, sa_type=Text)  # JSON of the node output (URLs or text)
+    error_message: Optional[str] = Field(default=None, sa_type=Text)
+    credits_used: int = Field(default=0)
+    started_at: int = Field(sa_type=BigInteger)
+    completed_at: Optional[int] = Field(default=None, sa_type=BigInteger)
+
 class CreditTransaction(SQLModel, table=True):
     """Tracks all credit additions/deductions"""
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
@@ -0,0 +1,27 @@
+"""Resized WebP variants for image grids. Public so <img> tags can load them; URLs are signed."""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from services.image_derivatives import (
+    DERIVATIVE_SIZES,
+    IMMUTABLE_CACHE_CONTROL,
+    decode_token,
+    get_derivative_store,
+)
+
+router = APIRouter(prefix="/api/img", tags=["images"])
+
+
+@router.get("/{token}/{size}.webp")
+async def get_derivative(token: str, size: str):
+    if size not in DERIVATIVE_SIZES:
+        raise HTTPException(status_code=404, detail="Unknown size")
+    source = decode_token(token)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Invalid image token")
+
+    path = await get_derivative_store().get(source, size)
+    if path is None:
+        # Unreachable, not allowed or not an image; clients fall back to the original URL they have
+        raise HTTPException(status_code=404, detail="Image unavailable", headers={"Cache-Control": "no-store"})
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
@@ -10,8 +10,8 @@ from database import get_session
 from models import VideoIdeation, User, Clip, Space, AsyncJob
 from auth import get_current_user
 from dependencies import get_current_space, get_current_space_optional
+from services.video_knowledge import get_knowledge, get_transcript, input_hash
 from ai_agent import (
-    fetch_transcript, 
     generate_video_outline, 
     generate_title_ideas, 
     readapt_script_outline, 
@@ -144,8 +144,17 @@ async def generate_outline(
     if clip.scriptOutline:
         return {"outline": clip.scriptOutline}
 
+    # Shared cache: another user may already have outlined this video
+    outline_inputs = input_hash(clip.title)
+    outline = get_knowledge(session, clip.videoId, "outline", outline_inputs)
+    if outline:
+        clip.scriptOutline = outline
+        session.add(clip)
+        session.commit()
+        return {"outline": outline}
+
     # Fetch transcript
-    transcript = fetch_transcript(clip.videoId)
+    transcript = get_transcript(session, clip.videoId, scrapecreators=False)
     if not transcript:
         # Fallback if transcript fails (e.g. no captions)
         raise HTTPException(status_code=400, detail="Could not fetch transcript for this video. Use manual creation.")
@@ -159,7 +168,7 @@ async def generate_outline(
     job = AsyncJob(
         type="video_outline",
         status="pending",
-        input_payload=json.dumps({"transcript": transcript[:100], "title": clip.title}), # Log partial input
+        input_payload=json.dumps({"transcript": transcript[:100], "title": clip.title, "videoId": clip.videoId}), # Log partial input
         created_at=int(time.time() * 1000),
         updated_at=int(time.time() * 1000),
         user_id=user.id
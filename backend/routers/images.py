@@ -1,11 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from sqlmodel import Session, select, or_
 from typing import List, Optional
 from database import get_session
 from models import Image, User, Tag, ImageTagLink, Space
-from auth import get_current_user
+from auth import get_active_subscriber, get_current_user
 from dependencies import get_current_space
+from services.image_derivatives import derivative_urls
+from services.perceptual_hash import (
+    DEFAULT_SIMILAR_DISTANCE,
+    INSERT_HASH_TIMEOUT,
+    describe_items,
+    ensure_hash,
+    find_duplicates,
+    find_similar,
+)
 from pydantic import BaseModel
+import asyncio
 import uuid
 import time
 from urllib.parse import urlparse
@@ -81,7 +91,22 @@ async def create_image(
     session.commit()
     session.refresh(new_image)
     
-    return new_image
+    # Flag near-duplicates of images already saved; if the image cannot be fetched
+    # quickly, the background indexer hashes it later. The deadline covers the whole
+    # of it: fetching, waiting for a transcode slot and ffmpeg.
+    duplicates = []
+    try:
+        image_hash = await asyncio.wait_for(
+            ensure_hash(session, "image", new_image.id, current_user.id, new_image.image_url),
+            timeout=INSERT_HASH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        image_hash = None
+    if image_hash:
+        matches = find_duplicates(session, current_user.id, image_hash.phash, exclude=("image", new_image.id))
+        duplicates = describe_items(session, [(row.item_type, row.item_id, distance) for row, distance in matches])
+    
+    return dict(new_image.model_dump(), duplicates=duplicates)
 
 @router.get("")
 async def get_images(
@@ -133,7 +158,11 @@ async def get_images(
     
     images = session.exec(query).all()
     
-    return images
+    # Resized WebP variants for the grid; thumbnail_url/image_url stay the originals
+    return [
+        dict(image.model_dump(), variants=derivative_urls(image.thumbnail_url or image.image_url))
+        for image in images
+    ]
 
 @router.get("/{image_id}")
 async def get_image(
@@ -153,6 +182,35 @@ async def get_image(
     
     return image
 
+@router.get("/{image_id}/similar")
+async def get_similar_images(
+    image_id: uuid.UUID,
+    max_distance: int = Query(DEFAULT_SIMILAR_DISTANCE, ge=0, le=32),
+    limit: int = Query(20, ge=1, le=100),
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_active_subscriber)
+):
+    """
+    Saved images and clip thumbnails that look like this image, closest first.
+    Like /api/clips/{id}/similar this is a subscriber feature (it may fetch and decode
+    the image on demand), hence get_active_subscriber rather than get_current_user.
+    """
+    
+    image = session.get(Image, image_id)
+    
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    if image.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    image_hash = await ensure_hash(session, "image", image.id, image.user_id, image.image_url)
+    if not image_hash:
+        raise HTTPException(status_code=422, detail="Image could not be analysed")
+    
+    matches = find_similar(session, current_user.id, image_hash.phash, max_distance, limit, exclude=("image", image.id))
+    return describe_items(session, matches)
+
 @router.put("/{image_id}")
 async def update_image(
     image_id: uuid.UUID,
@@ -3,8 +3,9 @@ from typing import List, Optional
 from sqlmodel import Session, select
 from database import get_session
 from models import User, Clip, TitleTemplate, ThumbnailTemplate, ScriptTemplate, TitleTemplateClipLink, ThumbnailTemplateClipLink, ScriptTemplateClipLink
-from auth import get_current_user
-from ai_agent import extract_script_structure, extract_title_structure, extract_thumbnail_description, summarize_video, fetch_transcript_scrapecreators
+from auth import get_admin_user, get_current_user
+from ai_agent import extract_script_structure, extract_title_structure, extract_thumbnail_description, summarize_video
+from services.video_knowledge import cached_knowledge, get_transcript, input_hash, invalidate_knowledge
 from pydantic import BaseModel
 import uuid
 import time
@@ -42,7 +43,7 @@ async def fetch_transcript_endpoint(request: ExtractRequest, session: Session =
     import os
     print(f"DEBUG: SCRAPECREATORS_API_KEY present? {'Yes' if os.getenv('SCRAPECREATORS_API_KEY') else 'No'}")
     
-    transcript = fetch_transcript_scrapecreators(clip.videoId)
+    transcript = get_transcript(session, clip.videoId)
     print(f"DEBUG: Fetch result length: {len(transcript) if transcript else 0}")
     
     if transcript:
@@ -64,11 +65,10 @@ async def extract_script_endpoint(request: ExtractRequest, session: Session = De
     transcript = clip.transcript
     
     if not transcript:
-        # ScrapeCreators Exclusive Strategy with Save-on-Fetch
-        from ai_agent import fetch_transcript_scrapecreators
+        # Shared transcript cache, then ScrapeCreators, with Save-on-Fetch
         print(f"DEBUG: Fetching transcript via ScrapeCreators for {clip.videoId}")
         
-        transcript = fetch_transcript_scrapecreators(clip.videoId)
+        transcript = get_transcript(session, clip.videoId)
         
         if transcript:
             # SAVE the transcript for future reuse
@@ -80,7 +80,12 @@ async def extract_script_endpoint(request: ExtractRequest, session: Session = De
         else:
              raise HTTPException(status_code=400, detail="Could not fetch transcript from ScrapeCreators.")
 
-    structure = extract_script_structure(transcript)
+    # Keyed on the transcript too, since a clip may carry its own (edited) transcript
+    structure = cached_knowledge(
+        session, clip.videoId, "script_structure",
+        lambda: extract_script_structure(transcript),
+        inputs=input_hash(transcript)
+    )
 
     # Auto-Save / Upsert Logic
     # 1. Check for existing link
@@ -165,7 +170,12 @@ async def extract_thumbnail_endpoint(request: ExtractRequest, session: Session =
     if not clip.thumbnail:
          raise HTTPException(status_code=400, detail="Clip has no thumbnail")
 
-    structure = extract_thumbnail_description(clip.thumbnail)
+    # Keyed on the image URL too, since clips can carry a captured frame instead of the YouTube thumbnail
+    structure = cached_knowledge(
+        session, clip.videoId, "thumbnail_analysis",
+        lambda: extract_thumbnail_description(clip.thumbnail),
+        inputs=input_hash(clip.thumbnail)
+    )
 
     # Auto-Save / Upsert Logic
     existing_link = session.exec(
@@ -371,10 +381,9 @@ async def extract_summary_endpoint(request: ExtractRequest, session: Session = D
     transcript = clip.transcript
     
     if not transcript:
-        # ScrapeCreators Exclusive Strategy with Save-on-Fetch
-        from ai_agent import fetch_transcript_scrapecreators
+        # Shared transcript cache, then ScrapeCreators, with Save-on-Fetch
         
-        transcript = fetch_transcript_scrapecreators(clip.videoId)
+        transcript = get_transcript(session, clip.videoId)
         
         if transcript:
             # SAVE the transcript
@@ -385,7 +394,11 @@ async def extract_summary_endpoint(request: ExtractRequest, session: Session = D
         else:
             raise HTTPException(status_code=400, detail="Could not fetch transcript from ScrapeCreators.")
 
-    summary = summarize_video(transcript)
+    summary = cached_knowledge(
+        session, clip.videoId, "summary",
+        lambda: summarize_video(transcript),
+        inputs=input_hash(transcript)
+    )
     
     # Save to Clip.notes ONLY if it's not an error
     if not summary.startswith("Error"):
@@ -400,6 +413,16 @@ async def extract_summary_endpoint(request: ExtractRequest, session: Session = D
 
     return {"summary": summary}
 
+@router.delete("/knowledge/{video_id}")
+async def invalidate_video_knowledge(video_id: str, kind: Optional[str] = None, session: Session = Depends(get_session), user: User = Depends(get_admin_user)):
+    """
+    Drops the shared transcript/analysis cache for a video (optionally one kind),
+    e.g. when a result was bad or the video was re-uploaded. Admins only, since the
+    cache is shared by every user.
+    """
+    deleted = invalidate_knowledge(session, video_id, kind)
+    return {"status": "invalidated", "deleted": deleted}
+
 class UpdateSummaryRequest(BaseModel):
     clipId: str
     summary: str
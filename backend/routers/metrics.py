@@ -0,0 +1,48 @@
+"""Operational metrics for capacity planning and alerting."""
+from fastapi import APIRouter, Depends
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from auth import get_admin_user
+from database import get_session
+from models import User, VideoKnowledge
+from services.download_manager import get_download_manager
+from services.execution_events import get_execution_events
+from services.frame_capture import get_stream_url_cache
+from services.image_derivatives import get_derivative_store
+from services.media_cache import get_media_cache
+from services.media_governor import get_media_governor
+from services.node_results import get_node_result_cache
+from services.prediction_waiter import get_prediction_waiter
+from services.progress import get_progress_broker
+from services.storyboards import get_storyboard_cache
+from services.video_knowledge import knowledge_stats
+from services.workflow_engine import plan_cache_stats
+from services.workflow_runner import get_workflow_runner
+from services.youtube_quota import get_youtube_quota
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("")
+def get_metrics(session: Session = Depends(get_session), user: User = Depends(get_admin_user)):
+    """Snapshot of in-process counters. Admins only: it exposes usage across all users."""
+    entries, lifetime_hits = session.exec(
+        select(func.count(VideoKnowledge.id), func.coalesce(func.sum(VideoKnowledge.hit_count), 0))
+    ).one()
+    return {
+        "youtube_quota": get_youtube_quota().snapshot(),
+        "downloads": get_download_manager().stats() if get_download_manager() else None,
+        "download_progress": get_progress_broker().stats(),
+        "media_cache": get_media_cache().stats() if get_media_cache() else None,
+        "stream_urls": get_stream_url_cache().stats(),
+        "media_governor": get_media_governor().stats(),
+        "image_derivatives": get_derivative_store().stats(),
+        "storyboards": get_storyboard_cache().stats(),
+        "video_knowledge": dict(knowledge_stats(), entries=entries, lifetime_hits=lifetime_hits),
+        "workflow_plans": plan_cache_stats(),
+        "node_results": get_node_result_cache().stats(),
+        "workflow_runner": get_workflow_runner().stats(),
+        "execution_events": get_execution_events().stats(),
+        "replicate_predictions": get_prediction_waiter().stats(),
+    }
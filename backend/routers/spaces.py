@@ -70,6 +70,7 @@ def delete_space(
     return {"ok": True}
 
 from models import Image, Clip
+from services.image_derivatives import derivative_url
 
 @router.get("/current/assets")
 def get_space_assets(
@@ -96,7 +97,7 @@ def get_space_assets(
             "id": str(img.id),
             "type": "image",
             "url": img.image_url,
-            "thumbnail": img.thumbnail_url or img.image_url,
+            "thumbnail": derivative_url(img.thumbnail_url or img.image_url),
             "title": img.title,
             "created_at": img.createdAt
         })
@@ -108,7 +109,7 @@ def get_space_assets(
                 "id": str(clip.id),
                 "type": "video",
                 "url": clip.thumbnail, # Input node expects an image URL usually
-                "thumbnail": clip.thumbnail,
+                "thumbnail": derivative_url(clip.thumbnail),
                 "title": clip.title,
                 "created_at": clip.createdAt
             })
@@ -5,6 +5,8 @@ import json
 import time
 from database import get_session
 from models import AsyncJob
+from services.prediction_waiter import get_prediction_waiter
+from services.video_knowledge import input_hash, store_knowledge
 
 router = APIRouter(prefix="/api/webhooks", tags=["webhooks"])
 
@@ -24,6 +26,10 @@ async def replicate_webhook(request: Request, session: Session = Depends(get_ses
     if not prediction_id:
         return {"ok": False, "error": "Missing prediction_id"}
 
+    # Workflow nodes awaiting this prediction re-fetch it from Replicate
+    if get_prediction_waiter().notify(prediction_id):
+        return {"ok": True}
+
     # Find the job
     job = session.exec(select(AsyncJob).where(AsyncJob.prediction_id == prediction_id)).first()
     
@@ -49,5 +55,21 @@ async def replicate_webhook(request: Request, session: Session = Depends(get_ses
     
     session.add(job)
     session.commit()
+
+    if status == "succeeded" and job.type == "video_outline":
+        _store_outline(session, job, payload.get("output"))
     
     return {"ok": True}
+
+def _store_outline(session: Session, job: AsyncJob, output):
+    """Share a finished video outline with every user who saves the same video."""
+    try:
+        job_input = json.loads(job.input_payload)
+    except (TypeError, ValueError):
+        return
+    video_id = job_input.get("videoId")
+    if not video_id or not output:
+        return
+    content = "".join(output) if isinstance(output, list) else str(output)
+    content = content.replace("```markdown", "").replace("```", "").strip()
+    store_knowledge(session, video_id, "outline", content, input_hash(job_input.get("title")))
@@ -7,21 +7,39 @@ from pydantic import BaseModel
 import time
 import uuid
 import json
-import asyncio
+import csv
 
 from database import get_session
-from models import AIWorkflow, WorkflowExecution, User
-from auth import get_current_user
-from services.workflow_engine import WorkflowEngine
+from models import AIWorkflow, NodeExecution, WorkflowBatch, WorkflowExecution, User
+from auth import get_current_user, get_current_user_from_token
 from services.credit_service import CreditService
+from services.execution_events import (
+    TERMINAL_STATUSES, batch_event, execution_event, get_execution_events, node_event, row_event
+)
+from services.workflow_batches import BATCH_MAX_PARALLELISM, check_rows, finish_row, parse_csv_rows, settle_batch
+from services.workflow_engine import WorkflowEngine, get_workflow_plan
+from services.workflow_runner import get_workflow_runner
 
 
 router = APIRouter(prefix="/api", tags=["executions"])
 
+# Seconds without events before a stream checks the database for runs on other processes' workers
+EXTERNAL_WORKER_CHECK_INTERVAL = 5.0
+
 
 class ExecutionCreate(BaseModel):
     input_data: Dict[str, Any]
     target_node_ids: Optional[List[str]] = None
+    use_cache: bool = True  # Reuse earlier outputs of unchanged upstream nodes
+
+
+class BatchCreate(BaseModel):
+    # Input values by input name, one dict per run; or the same as CSV with a header row
+    rows: Optional[List[Dict[str, Any]]] = None
+    csv: Optional[str] = None
+    target_node_ids: Optional[List[str]] = None
+    use_cache: bool = True
+    parallelism: Optional[int] = None  # Defaults to (and is capped at) BATCH_MAX_PARALLELISM
 
 
 class ExecutionResponse(BaseModel):
@@ -37,14 +55,14 @@ class ExecutionResponse(BaseModel):
     completed_at: Optional[int]
 
 
-@router.post("/workflows/{workflow_id}/execute", response_model=ExecutionResponse, status_code=status.HTTP_201_CREATED)
-async def execute_workflow(
+@router.post("/workflows/{workflow_id}/execute", response_model=ExecutionResponse, status_code=status.HTTP_202_ACCEPTED)
+def execute_workflow(
     workflow_id: str,
     execution: ExecutionCreate,
     session: Session = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    """Execute a workflow."""
+    """Queue a workflow run; follow it via /executions/{id}/stream."""
     try:
         workflow_uuid = uuid.UUID(workflow_id)
     except ValueError:
@@ -71,11 +89,13 @@ async def execute_workflow(
     
     current_time = int(time.time() * 1000)
     
-    # Create execution record
+    # The pending row is the queue entry; a background worker claims and runs it
     new_execution = WorkflowExecution(
         workflow_id=workflow.id,
         status="pending",
         input_data=json.dumps(execution.input_data),
+        target_node_ids=json.dumps(execution.target_node_ids) if execution.target_node_ids else None,
+        use_cache=execution.use_cache,
         created_at=current_time,
         user_id=current_user.id
     )
@@ -83,75 +103,311 @@ async def execute_workflow(
     session.add(new_execution)
     session.commit()
     session.refresh(new_execution)
-    
-    # Execute workflow
-    try:
-        new_execution.status = "running"
-        session.add(new_execution)
-        session.commit()
-        
-        # Run workflow engine
-        engine = WorkflowEngine(session)
-        result = await engine.execute(
-            workflow_data=workflow.workflow_data,
-            input_data=execution.input_data,
-            user_id=current_user.id,
-            target_node_ids=execution.target_node_ids
-        )
-        
-        # Update execution record
-        if result["status"] == "completed":
-            new_execution.status = "completed"
-            new_execution.output_data = json.dumps(result["outputs"])
-            new_execution.credits_used = result["credits_used"]
-            new_execution.execution_time_ms = result["execution_time_ms"]
-            new_execution.completed_at = int(time.time() * 1000)
-            
-            # Deduct credits
-            credit_service = CreditService()
-            credit_service.deduct_credits(
-                session=session,
-                user_id=current_user.id,
-                amount=result["credits_used"],
-                description=f"Workflow execution: {workflow.name}",
-                execution_id=new_execution.id
-            )
-        else:
-            new_execution.status = "failed"
-            new_execution.error_message = result.get("error")
-            new_execution.credits_used = result.get("credits_used", 0)
-            new_execution.execution_time_ms = result.get("execution_time_ms")
-            new_execution.completed_at = int(time.time() * 1000)
-            
-            # Refund any credits if partially used
-            if new_execution.credits_used > 0:
-                credit_service = CreditService()
-                credit_service.refund_credits(session, new_execution.id)
-        
-        session.add(new_execution)
-        session.commit()
-        session.refresh(new_execution)
-    
-    except Exception as e:
-        new_execution.status = "failed"
-        new_execution.error_message = str(e)
-        new_execution.completed_at = int(time.time() * 1000)
-        session.add(new_execution)
-        session.commit()
-        session.refresh(new_execution)
+    get_workflow_runner().notify()
     
     return ExecutionResponse(
         id=str(new_execution.id),
         workflow_id=str(new_execution.workflow_id),
         status=new_execution.status,
         input_data=json.loads(new_execution.input_data),
-        output_data=json.loads(new_execution.output_data) if new_execution.output_data else None,
-        error_message=new_execution.error_message,
+        output_data=None,
+        error_message=None,
         credits_used=new_execution.credits_used,
-        execution_time_ms=new_execution.execution_time_ms,
+        execution_time_ms=None,
         created_at=new_execution.created_at,
-        completed_at=new_execution.completed_at
+        completed_at=None
+    )
+
+
+class BatchResponse(BaseModel):
+    id: str
+    workflow_id: str
+    status: str
+    row_count: int
+    parallelism: int
+    credits_reserved: int
+    credits_used: int
+    completed_rows: int
+    failed_rows: int
+    execution_time_ms: Optional[int]
+    row_time_ms: Optional[int]
+    created_at: int
+    completed_at: Optional[int]
+    rows: List[ExecutionResponse] = []
+
+
+def _batch_response(batch: WorkflowBatch, rows: List[WorkflowExecution] = ()) -> BatchResponse:
+    return BatchResponse(
+        id=str(batch.id),
+        workflow_id=str(batch.workflow_id),
+        status=batch.status,
+        row_count=batch.row_count,
+        parallelism=batch.parallelism,
+        credits_reserved=batch.credits_reserved,
+        credits_used=batch.credits_used,
+        completed_rows=batch.completed_rows,
+        failed_rows=batch.failed_rows,
+        execution_time_ms=batch.execution_time_ms,
+        row_time_ms=batch.row_time_ms,
+        created_at=batch.created_at,
+        completed_at=batch.completed_at,
+        rows=[
+            ExecutionResponse(
+                id=str(e.id),
+                workflow_id=str(e.workflow_id),
+                status=e.status,
+                input_data=json.loads(e.input_data),
+                output_data=json.loads(e.output_data) if e.output_data else None,
+                error_message=e.error_message,
+                credits_used=e.credits_used,
+                execution_time_ms=e.execution_time_ms,
+                created_at=e.created_at,
+                completed_at=e.completed_at
+            )
+            for e in rows
+        ]
+    )
+
+
+def _get_own_batch(session: Session, batch_id: str, current_user: User) -> WorkflowBatch:
+    try:
+        batch_uuid = uuid.UUID(batch_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid batch ID"
+        )
+    
+    batch = session.get(WorkflowBatch, batch_uuid)
+    
+    if not batch:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found"
+        )
+    
+    # Check permissions
+    if batch.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this batch"
+        )
+    return batch
+
+
+@router.post("/workflows/{workflow_id}/batch", response_model=BatchResponse, status_code=status.HTTP_202_ACCEPTED)
+def execute_batch(
+    workflow_id: str,
+    request: BatchCreate,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Queue one run of the workflow per row of inputs, at most `parallelism` at a time.
+    Credits for every row are reserved now and what the rows did not use is returned
+    at the end; follow the rows via /batches/{id}/stream.
+    """
+    try:
+        workflow_uuid = uuid.UUID(workflow_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid workflow ID"
+        )
+    
+    workflow = session.get(AIWorkflow, workflow_uuid)
+    
+    if not workflow:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Workflow not found"
+        )
+    
+    # Check permissions
+    if workflow.user_id != current_user.id and not workflow.is_public:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to execute this workflow"
+        )
+    
+    if (request.rows is None) == (request.csv is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either rows or csv"
+        )
+    try:
+        rows = request.rows if request.rows is not None else parse_csv_rows(request.csv)
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid CSV: {e}"
+        )
+    
+    # Validated once here; every row's run then finds the compiled plan in the cache
+    plan = get_workflow_plan(workflow.workflow_data)
+    error = plan.error or check_rows(plan, rows, request.target_node_ids)
+    if error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=error
+        )
+    
+    cost_per_row = WorkflowEngine(session).calculate_total_cost(plan.nodes, plan.nodes_to_run(request.target_node_ids))
+    reserved = cost_per_row * len(rows)
+    balance = CreditService.get_balance(session, current_user.id)
+    if balance < reserved:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient credits. Required: {reserved} ({len(rows)} rows x {cost_per_row}), Available: {balance}"
+        )
+    
+    current_time = int(time.time() * 1000)
+    batch = WorkflowBatch(
+        workflow_id=workflow.id,
+        user_id=current_user.id,
+        row_count=len(rows),
+        parallelism=max(1, min(request.parallelism or BATCH_MAX_PARALLELISM, BATCH_MAX_PARALLELISM)),
+        credits_reserved=reserved,
+        created_at=current_time
     )
+    session.add(batch)
+    session.commit()
+    session.refresh(batch)
+    
+    if reserved > 0:
+        CreditService.deduct_credits(
+            session, current_user.id, reserved, f"Batch of {len(rows)} runs: {workflow.name} (reserved)"
+        )
+    
+    target_node_ids = json.dumps(request.target_node_ids) if request.target_node_ids else None
+    executions = [
+        WorkflowExecution(
+            workflow_id=workflow.id,
+            status="pending",
+            input_data=json.dumps(row),
+            target_node_ids=target_node_ids,
+            use_cache=request.use_cache,
+            created_at=current_time,
+            user_id=current_user.id,
+            batch_id=batch.id,
+            batch_index=index
+        )
+        for index, row in enumerate(rows)
+    ]
+    session.add_all(executions)
+    session.commit()
+    session.refresh(batch)
+    for _ in range(batch.parallelism):
+        get_workflow_runner().notify()
+    
+    return _batch_response(batch, executions)
+
+
+@router.get("/batches/{batch_id}", response_model=BatchResponse)
+def get_batch(
+    batch_id: str,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Batch totals and the state of every row."""
+    batch = _get_own_batch(session, batch_id, current_user)
+    rows = session.exec(
+        select(WorkflowExecution)
+        .where(WorkflowExecution.batch_id == batch.id)
+        .order_by(WorkflowExecution.batch_index)
+    ).all()
+    return _batch_response(batch, rows)
+
+
+@router.get("/batches/{batch_id}/stream")
+async def stream_batch(
+    batch_id: str,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user_from_token)
+):
+    """Stream finished rows via Server-Sent Events, ending with the batch totals."""
+    batch = _get_own_batch(session, batch_id, current_user)
+    batch_uuid = batch.id
+    
+    from database import engine
+
+    async def event_generator():
+        events = get_execution_events()
+        cursor = events.cursor(str(batch_uuid))
+        with Session(engine) as db:
+            current_batch = db.get(WorkflowBatch, batch_uuid)
+            finished_rows = db.exec(
+                select(WorkflowExecution)
+                .where(WorkflowExecution.batch_id == batch_uuid)
+                .where(WorkflowExecution.status.in_(TERMINAL_STATUSES))
+                .order_by(WorkflowExecution.completed_at)
+            ).all()
+        for row in finished_rows:
+            yield f"data: {json.dumps(row_event(row))}\n\n"
+        yield f"data: {json.dumps(batch_event(current_batch))}\n\n"
+        if current_batch.completed_at is not None:
+            return
+
+        seen = {str(row.id) for row in finished_rows}
+        async for event in events.subscribe(str(batch_uuid), after=cursor, idle_timeout=EXTERNAL_WORKER_CHECK_INTERVAL):
+            if event is not None:
+                if event["type"] == "row":
+                    if event["execution_id"] in seen:
+                        continue
+                    seen.add(event["execution_id"])
+                yield f"data: {json.dumps(event)}\n\n"
+                continue
+            # Rows may be worked by another process, whose events do not reach this one
+            with Session(engine) as db:
+                current_batch = db.get(WorkflowBatch, batch_uuid)
+            if current_batch.completed_at is not None:
+                yield f"data: {json.dumps(batch_event(current_batch))}\n\n"
+                break
+    
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
+@router.delete("/batches/{batch_id}", status_code=status.HTTP_204_NO_CONTENT)
+def cancel_batch(
+    batch_id: str,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel the rows that have not finished; reserved credits they did not use are returned."""
+    batch = _get_own_batch(session, batch_id, current_user)
+    
+    if batch.completed_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch has already finished"
+        )
+    
+    unfinished = session.exec(
+        select(WorkflowExecution)
+        .where(WorkflowExecution.batch_id == batch.id)
+        .where(WorkflowExecution.status.in_(["pending", "running"]))
+    ).all()
+    now = int(time.time() * 1000)
+    batch.status = "cancelled"
+    session.add(batch)
+    for execution in unfinished:
+        # Running rows are finished (completed_at) by their worker once it has stopped;
+        # the batch settles after the last of them, counting the nodes they completed
+        if execution.status == "pending":
+            execution.completed_at = now
+        execution.status = "cancelled"
+        session.add(execution)
+    session.commit()
+    
+    events = get_execution_events()
+    for execution in unfinished:
+        get_workflow_runner().cancel(execution.id)
+        events.publish(str(execution.id), execution_event(execution))
+        if execution.completed_at is not None:
+            events.publish(str(batch.id), row_event(execution))
+    settle_batch(session, batch.id)
+    
+    return None
 
 
 @router.get("/executions/{execution_id}", response_model=ExecutionResponse)
@@ -198,9 +454,113 @@ def get_execution(
     )
 
 
-from auth import get_current_user, get_current_user_from_token
+@router.post("/executions/{execution_id}/resume", response_model=ExecutionResponse, status_code=status.HTTP_202_ACCEPTED)
+def resume_execution(
+    execution_id: str,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Queue a failed or cancelled execution again. Completed nodes keep their outputs unless
+    the node (or something upstream of it) was edited since; only the rest runs and is charged.
+    """
+    try:
+        execution_uuid = uuid.UUID(execution_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid execution ID"
+        )
+    
+    execution = session.get(WorkflowExecution, execution_uuid)
+    
+    if not execution:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Execution not found"
+        )
+    
+    # Check permissions
+    if execution.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to resume this execution"
+        )
+    
+    if execution.status not in ["failed", "cancelled"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Can only resume failed or cancelled executions"
+        )
+    
+    if not session.get(AIWorkflow, execution.workflow_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Workflow not found"
+        )
+    
+    execution.status = "pending"
+    execution.error_message = None
+    execution.execution_time_ms = None
+    execution.completed_at = None
+    execution.attempts = 0
+    session.add(execution)
+    session.commit()
+    session.refresh(execution)
+    get_workflow_runner().notify()
+    get_execution_events().publish(str(execution.id), execution_event(execution))
+    
+    return ExecutionResponse(
+        id=str(execution.id),
+        workflow_id=str(execution.workflow_id),
+        status=execution.status,
+        input_data=json.loads(execution.input_data),
+        output_data=None,
+        error_message=None,
+        credits_used=execution.credits_used,
+        execution_time_ms=None,
+        created_at=execution.created_at,
+        completed_at=None
+    )
+
+
+@router.get("/executions/{execution_id}/nodes")
+def list_node_executions(
+    execution_id: str,
+    session: Session = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Per-node state of an execution, e.g. to restore the canvas after a reload."""
+    try:
+        execution_uuid = uuid.UUID(execution_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid execution ID"
+        )
+    
+    execution = session.get(WorkflowExecution, execution_uuid)
+    
+    if not execution:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Execution not found"
+        )
+    
+    # Check permissions
+    if execution.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this execution"
+        )
+    
+    records = session.exec(
+        select(NodeExecution)
+        .where(NodeExecution.execution_id == execution_uuid)
+        .order_by(NodeExecution.started_at)
+    ).all()
+    return [node_event(record) for record in records]
 
-# ... (rest of imports)
 
 @router.get("/executions/{execution_id}/stream")
 async def stream_execution(
@@ -233,46 +593,37 @@ async def stream_execution(
         )
     
     from database import engine
-    from functools import partial
 
     async def event_generator():
-        """Generate SSE events for execution status."""
-        while True:
-            # Create a new session for this poll to ensure fresh data and valid connection
-            # We must use proper context management here
-            try:
-                with Session(engine) as db:
-                    # Re-fetch the execution
-                    current_execution = db.get(WorkflowExecution, execution_uuid)
-                    
-                    if not current_execution:
-                        # Should not happen, but handle it
-                        yield f"data: {json.dumps({'error': 'Execution not found'})}\n\n"
-                        break
-                    
-                    # Send status update
-                    data = {
-                        "status": current_execution.status,
-                        "credits_used": current_execution.credits_used,
-                        "execution_time_ms": current_execution.execution_time_ms,
-                        "error_message": current_execution.error_message
-                    }
-                    
-                    yield f"data: {json.dumps(data)}\n\n"
-                    
-                    # Stop streaming if execution is complete
-                    if current_execution.status in ["completed", "failed", "cancelled"]:
-                        if current_execution.output_data:
-                            output_data = json.loads(current_execution.output_data)
-                            yield f"data: {json.dumps({'outputs': output_data})}\n\n"
-                        break
-            except Exception as e:
-                print(f"Stream error: {e}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        """Snapshot of the run and its nodes, then node and run events as they are published."""
+        events = get_execution_events()
+        # Taken before the snapshot so nothing published in between is missed
+        cursor = events.cursor(str(execution_uuid))
+        with Session(engine) as db:
+            current_execution = db.get(WorkflowExecution, execution_uuid)
+            node_records = db.exec(
+                select(NodeExecution)
+                .where(NodeExecution.execution_id == execution_uuid)
+                .order_by(NodeExecution.started_at)
+            ).all()
+        for record in node_records:
+            yield f"data: {json.dumps(node_event(record))}\n\n"
+        yield f"data: {json.dumps(execution_event(current_execution))}\n\n"
+        if current_execution.status in TERMINAL_STATUSES:
+            return
+
+        async for event in events.subscribe(str(execution_uuid), after=cursor, idle_timeout=EXTERNAL_WORKER_CHECK_INTERVAL):
+            if event is not None:
+                yield f"data: {json.dumps(event)}\n\n"
+                continue
+            # Quiet for a while: the run may be on a worker in another process,
+            # whose events do not reach this one, so look at the stored status
+            with Session(engine) as db:
+                current_execution = db.get(WorkflowExecution, execution_uuid)
+            if current_execution is None or current_execution.status in TERMINAL_STATUSES:
+                if current_execution:
+                    yield f"data: {json.dumps(execution_event(current_execution))}\n\n"
                 break
-                
-            # Wait before next update
-            await asyncio.sleep(0.5)
     
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -374,16 +725,19 @@ def cancel_execution(
             detail="Can only cancel pending or running executions"
         )
     
-    # Update status
+    # Update status; a running execution is finished by its worker once it has stopped,
+    # which charges the nodes that completed (and settles its batch, if any)
+    if execution.status == "pending":
+        execution.completed_at = int(time.time() * 1000)
     execution.status = "cancelled"
-    execution.completed_at = int(time.time() * 1000)
-    
-    # Refund credits if any were used
-    if execution.credits_used > 0:
-        credit_service = CreditService()
-        credit_service.refund_credits(session, execution.id)
     
     session.add(execution)
     session.commit()
     
+    # Workers in other processes see the status at their next heartbeat
+    get_workflow_runner().cancel(execution.id)
+    get_execution_events().publish(str(execution.id), execution_event(execution))
+    if execution.batch_id and execution.completed_at is not None:
+        finish_row(session, execution)
+    
     return None
@@ -2,5 +2,6 @@
 from .credit_service import CreditService
 from .replicate_service import ReplicateService
 from .workflow_engine import WorkflowEngine
+from .youtube_quota import YouTubeQuota
 
-__all__ = ['CreditService', 'ReplicateService', 'WorkflowEngine']
+__all__ = ['CreditService', 'ReplicateService', 'WorkflowEngine', 'YouTubeQuota']
@@ -0,0 +1,231 @@
+"""Periodic YouTube statistics snapshots for saved clips and the metrics derived from them."""
+import asyncio
+import math
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from database import engine
+from models import Clip, VideoStatsSnapshot
+from services.locks import try_file_lock
+from services.youtube_quota import QuotaExhausted, get_youtube_quota
+
+BATCH_SIZE = 50
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# (max video age in days, refresh interval in ms); recent uploads move fastest
+REFRESH_TIERS = [
+    (7, 6 * 60 * 60 * 1000),
+    (30, DAY_MS),
+    (365, 7 * DAY_MS),
+]
+OLD_VIDEO_REFRESH_INTERVAL = 30 * DAY_MS
+
+# Snapshots closer together than this are too noisy for a velocity estimate
+MIN_VELOCITY_WINDOW_MS = 60 * 60 * 1000
+
+# videoId -> ms timestamp before which the video is not retried
+_unavailable_until: Dict[str, int] = {}
+
+TICK_INTERVAL = int(os.getenv("CLIP_STATS_TICK_INTERVAL", "900"))
+MAX_BATCHES_PER_TICK = int(os.getenv("CLIP_STATS_MAX_BATCHES", "20"))
+
+
+def apply_clip_metrics(clip: Clip, views_per_day: Optional[float] = None) -> None:
+    """
+    Recompute viralRatio, timeSinceUploadRatio and engagementScore from the clip's counts.
+    Without a measured `views_per_day` the lifetime average since upload is used.
+    """
+    if clip.viewCount is None or not clip.subscriberCount or clip.subscriberCount <= 0:
+        return
+
+    # Viral Ratio (Raw)
+    clip.viralRatio = clip.viewCount / clip.subscriberCount
+    # Normalize for Engagement Score calculation
+    # 0.01x = 0, 1x = 5, 100x = 10
+    viral_ratio_norm = min(10.0, max(0.0, (math.log10(max(clip.viralRatio, 0.0001)) + 2) * 2.5))
+
+    if views_per_day is None:
+        try:
+            upload_dt = datetime.strptime(clip.uploadDate, "%Y%m%d")
+        except (TypeError, ValueError):
+            return
+        days_since = max((datetime.now() - upload_dt).days, 1)
+        views_per_day = clip.viewCount / days_since
+
+    # Time Ratio / Velocity (Normalized 0-10), 100k views/day = 10
+    clip.timeSinceUploadRatio = min(10.0, (math.log10(max(views_per_day, 0) + 1) / 5) * 10)
+
+    # Engagement Score (Average of Normalized Ratios)
+    clip.engagementScore = (viral_ratio_norm + clip.timeSinceUploadRatio) / 2
+
+
+def views_per_day(session: Session, video_id: str) -> Optional[float]:
+    """Velocity between the two most recent snapshots that are far enough apart."""
+    snapshots = session.exec(
+        select(VideoStatsSnapshot)
+        .where(VideoStatsSnapshot.video_id == video_id)
+        .order_by(VideoStatsSnapshot.captured_at.desc())
+        .limit(10)
+    ).all()
+    if len(snapshots) < 2:
+        return None
+
+    latest = snapshots[0]
+    for previous in snapshots[1:]:
+        elapsed = latest.captured_at - previous.captured_at
+        if elapsed >= MIN_VELOCITY_WINDOW_MS:
+            return max(0, latest.view_count - previous.view_count) / (elapsed / DAY_MS)
+    return None
+
+
+def record_snapshot(
+    session: Session,
+    video_id: str,
+    view_count: int,
+    subscriber_count: Optional[int] = None,
+    min_interval_ms: int = MIN_VELOCITY_WINDOW_MS
+) -> Optional[VideoStatsSnapshot]:
+    """Store a snapshot unless one was taken recently (any user may have saved the video)."""
+    now = int(time.time() * 1000)
+    latest = session.exec(
+        select(func.max(VideoStatsSnapshot.captured_at))
+        .where(VideoStatsSnapshot.video_id == video_id)
+    ).first()
+    if latest and now - latest < min_interval_ms:
+        return None
+
+    snapshot = VideoStatsSnapshot(
+        video_id=video_id,
+        captured_at=now,
+        view_count=view_count,
+        subscriber_count=subscriber_count
+    )
+    session.add(snapshot)
+    return snapshot
+
+
+def _refresh_interval(upload_date: Optional[str], now: datetime) -> int:
+    try:
+        age_days = (now - datetime.strptime(upload_date, "%Y%m%d")).days
+    except (TypeError, ValueError):
+        return REFRESH_TIERS[1][1]
+    for max_age_days, interval in REFRESH_TIERS:
+        if age_days <= max_age_days:
+            return interval
+    return OLD_VIDEO_REFRESH_INTERVAL
+
+
+def select_due_videos(session: Session) -> List[str]:
+    """Distinct saved videoIds whose tier interval has elapsed, most overdue first."""
+    uploads = session.exec(
+        select(Clip.videoId, func.min(Clip.uploadDate)).group_by(Clip.videoId)
+    ).all()
+    last_captured: Dict[str, int] = dict(session.exec(
+        select(VideoStatsSnapshot.video_id, func.max(VideoStatsSnapshot.captured_at))
+        .group_by(VideoStatsSnapshot.video_id)
+    ).all())
+
+    now = datetime.now()
+    now_ms = int(time.time() * 1000)
+    due = []
+    for video_id, upload_date in uploads:
+        if _unavailable_until.get(video_id, 0) > now_ms:
+            continue
+        overdue = now_ms - last_captured.get(video_id, 0) - _refresh_interval(upload_date, now)
+        if overdue >= 0:
+            due.append((overdue, video_id))
+    due.sort(reverse=True)
+    return [video_id for _, video_id in due]
+
+
+def refresh_batch(session: Session, video_ids: List[str]) -> int:
+    """Snapshot up to 50 videos and update every clip that references them."""
+    quota = get_youtube_quota()
+    videos_response = quota.execute("videos.list", lambda yt: yt.videos().list(
+        part="snippet,statistics",
+        id=",".join(video_ids)
+    ))
+    items = videos_response.get("items", [])
+
+    channel_ids = list({item["snippet"]["channelId"] for item in items})
+    subscribers = {}
+    for i in range(0, len(channel_ids), BATCH_SIZE):
+        batch_channel_ids = channel_ids[i:i + BATCH_SIZE]
+        channels_response = quota.execute("channels.list", lambda yt: yt.channels().list(
+            part="statistics",
+            id=",".join(batch_channel_ids)
+        ))
+        for channel in channels_response.get("items", []):
+            count = channel["statistics"].get("subscriberCount")
+            if count is not None:
+                subscribers[channel["id"]] = int(count)
+
+    now = int(time.time() * 1000)
+    for item in items:
+        video_id = item["id"]
+        view_count = int(item["statistics"].get("viewCount", 0))
+        subscriber_count = subscribers.get(item["snippet"]["channelId"])
+        session.add(VideoStatsSnapshot(
+            video_id=video_id,
+            captured_at=now,
+            view_count=view_count,
+            subscriber_count=subscriber_count
+        ))
+    session.flush()
+
+    for item in items:
+        video_id = item["id"]
+        velocity = views_per_day(session, video_id)
+        for clip in session.exec(select(Clip).where(Clip.videoId == video_id)).all():
+            clip.viewCount = int(item["statistics"].get("viewCount", 0))
+            subscriber_count = subscribers.get(item["snippet"]["channelId"])
+            if subscriber_count:
+                clip.subscriberCount = subscriber_count
+            apply_clip_metrics(clip, velocity)
+            session.add(clip)
+
+    # Deleted or private videos are not returned; back off instead of retrying every tick
+    returned = {item["id"] for item in items}
+    for video_id in video_ids:
+        if video_id not in returned:
+            _unavailable_until[video_id] = now + OLD_VIDEO_REFRESH_INTERVAL
+
+    session.commit()
+    return len(items)
+
+
+def refresh_due_videos(max_batches: int = MAX_BATCHES_PER_TICK) -> int:
+    """One refresh pass. Stats refreshes are non-essential, so stop when quota runs low."""
+    quota = get_youtube_quota()
+    refreshed = 0
+    with Session(engine) as session:
+        due = select_due_videos(session)
+        for i in range(0, min(len(due), max_batches * BATCH_SIZE), BATCH_SIZE):
+            if quota.is_low():
+                print("YouTube quota low, postponing clip stats refresh")
+                break
+            try:
+                refreshed += refresh_batch(session, due[i:i + BATCH_SIZE])
+            except QuotaExhausted:
+                break
+    return refreshed
+
+
+async def run_clip_stats_refresher(interval: int = TICK_INTERVAL) -> None:
+    """Background loop; the file lock keeps multiple workers from refreshing the same videos."""
+    while True:
+        try:
+            with try_file_lock("clip_stats") as acquired:
+                if acquired and get_youtube_quota().configured:
+                    refreshed = await asyncio.to_thread(refresh_due_videos)
+                    if refreshed:
+                        print(f"Refreshed statistics for {refreshed} saved videos")
+        except Exception as e:
+            print(f"Clip stats refresh failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,184 @@
+"""Bounded worker pool for yt-dlp downloads with a priority queue and per-user concurrency limits."""
+import itertools
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "3"))
+DOWNLOAD_PER_USER_LIMIT = int(os.getenv("DOWNLOAD_PER_USER_LIMIT", "2"))
+DOWNLOAD_MAX_QUEUED_PER_USER = int(os.getenv("DOWNLOAD_MAX_QUEUED_PER_USER", "10"))
+
+# Lower runs first; FIFO within a priority
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class DownloadQueueFull(Exception):
+    """Raised when an owner already has too many downloads waiting"""
+
+
+class _Job:
+    __slots__ = ("task_id", "owner", "fn", "priority", "seq", "key")
+
+    def __init__(self, task_id: str, owner: str, fn: Callable[[], Any], priority: int, seq: int, key: Optional[str]):
+        self.task_id = task_id
+        self.owner = owner
+        self.fn = fn
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+
+
+class DownloadManager:
+    """
+    Runs submitted download callables on a fixed number of worker threads.
+    A job is only dispatched while its owner is below the per-user limit, so one
+    client cannot occupy every worker; later jobs from other owners go first.
+    Queue positions are pushed through `publish(task_id, data)` whenever they change.
+    Jobs submitted with a key (videoId and format) are deduplicated: while one is
+    queued or running, later submissions with the same key attach to its task id.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, Dict[str, Any]], None],
+        workers: int = DOWNLOAD_WORKERS,
+        per_user_limit: int = DOWNLOAD_PER_USER_LIMIT,
+        max_queued_per_user: int = DOWNLOAD_MAX_QUEUED_PER_USER
+    ):
+        self.publish = publish
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.max_queued_per_user = max_queued_per_user
+
+        self._cond = threading.Condition()
+        self._queue: List[_Job] = []  # kept sorted by (priority, seq)
+        self._active: Dict[str, int] = {}  # owner -> running jobs
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._seq = itertools.count()
+        self._inflight: Dict[str, _Job] = {}  # key -> queued or running job
+        self._deduplicated = 0
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"download-worker-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(
+        self,
+        task_id: str,
+        owner: str,
+        fn: Callable[[], Any],
+        priority: int = PRIORITY_NORMAL,
+        key: Optional[str] = None
+    ) -> Tuple[str, Optional[int]]:
+        """
+        Queue a job and return (task_id, 1-based queue position). If a job with the
+        same key is already in flight, nothing is queued and its task id is returned
+        instead, with position None once it is running.
+        """
+        with self._cond:
+            existing = self._inflight.get(key) if key else None
+            if existing:
+                self._deduplicated += 1
+                if existing in self._queue:
+                    # Serve the shared job at the best priority any requester has
+                    if priority < existing.priority:
+                        existing.priority = priority
+                        self._queue.sort(key=lambda j: (j.priority, j.seq))
+                        self._publish_positions()
+                    return existing.task_id, self._queue.index(existing) + 1
+                return existing.task_id, None
+
+            if sum(1 for job in self._queue if job.owner == owner) >= self.max_queued_per_user:
+                raise DownloadQueueFull(f"Too many queued downloads for {owner}")
+            self._ensure_workers()
+            job = _Job(task_id, owner, fn, priority, next(self._seq), key)
+            if key:
+                self._inflight[key] = job
+            self._queue.append(job)
+            self._queue.sort(key=lambda j: (j.priority, j.seq))
+            self._publish_positions()
+            self._cond.notify()
+            return task_id, self._queue.index(job) + 1
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        with self._cond:
+            for position, job in enumerate(self._queue, start=1):
+                if job.task_id == task_id:
+                    return position
+        return None
+
+    def _publish_positions(self) -> None:
+        # Called with the lock held
+        for position, job in enumerate(self._queue, start=1):
+            self.publish(job.task_id, {"status": "queued", "progress": 0, "queuePosition": position})
+
+    def _next_job(self) -> Optional[_Job]:
+        # Called with the lock held: first job whose owner has a free slot
+        for i, job in enumerate(self._queue):
+            if self._active.get(job.owner, 0) < self.per_user_limit:
+                return self._queue.pop(i)
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._active[job.owner] = self._active.get(job.owner, 0) + 1
+                self._running += 1
+                self.publish(job.task_id, {"status": "starting", "progress": 0})
+                self._publish_positions()
+
+            failed = False
+            try:
+                job.fn()
+            except Exception as e:
+                failed = True
+                print(f"Download task {job.task_id} failed: {e}")
+
+            with self._cond:
+                self._running -= 1
+                self._active[job.owner] -= 1
+                if not self._active[job.owner]:
+                    del self._active[job.owner]
+                if job.key and self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                # A slot for this owner opened up; a worker may now be able to take their next job
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "per_user_limit": self.per_user_limit,
+                "active": self._running,
+                "queued": len(self._queue),
+                "completed": self._completed,
+                "failed": self._failed,
+                "deduplicated": self._deduplicated,
+            }
+
+
+_manager: Optional[DownloadManager] = None
+
+
+def init_download_manager(publish: Callable[[str, Dict[str, Any]], None]) -> DownloadManager:
+    global _manager
+    _manager = DownloadManager(publish)
+    return _manager
+
+
+def get_download_manager() -> Optional[DownloadManager]:
+    return _manager
@@ -0,0 +1,174 @@
+"""Per-execution (and per-batch) event log pub/sub: the workflow engine publishes node and run events, SSE handlers subscribe."""
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from models import NodeExecution, WorkflowBatch, WorkflowExecution
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# Finished executions stay replayable this long so a reconnecting client still sees every event
+FINISHED_RETENTION = 300
+# Executions that stop publishing without finishing (e.g. worker crash) are dropped after this
+STALE_RETENTION = 3600
+
+
+def is_terminal(event: Dict[str, Any]) -> bool:
+    return event.get("type") in ("execution", "batch") and event.get("status") in TERMINAL_STATUSES
+
+
+def node_event(record: NodeExecution) -> Dict[str, Any]:
+    # `node_status`, not `status`: clients read `status` as the state of the whole run
+    return {
+        "type": "node",
+        "node_id": record.node_id,
+        "node_status": record.status,
+        "cached": record.cached,
+        "output": json.loads(record.output) if record.output else None,
+        "error_message": record.error_message,
+        "credits_used": record.credits_used,
+        "started_at": record.started_at,
+        "completed_at": record.completed_at,
+    }
+
+
+def execution_event(execution: WorkflowExecution) -> Dict[str, Any]:
+    event = {
+        "type": "execution",
+        "status": execution.status,
+        "credits_used": execution.credits_used,
+        "execution_time_ms": execution.execution_time_ms,
+        "error_message": execution.error_message,
+    }
+    if execution.output_data:
+        event["outputs"] = json.loads(execution.output_data)
+    return event
+
+
+def row_event(execution: WorkflowExecution) -> Dict[str, Any]:
+    """A finished row of a batch, published under the batch id."""
+    return {
+        "type": "row",
+        "index": execution.batch_index,
+        "execution_id": str(execution.id),
+        "row_status": execution.status,
+        "input_data": json.loads(execution.input_data),
+        "outputs": json.loads(execution.output_data) if execution.output_data else None,
+        "error_message": execution.error_message,
+        "credits_used": execution.credits_used,
+        "execution_time_ms": execution.execution_time_ms,
+    }
+
+
+def batch_event(batch: WorkflowBatch) -> Dict[str, Any]:
+    return {
+        "type": "batch",
+        "status": batch.status,
+        "rows": batch.row_count,
+        "completed_rows": batch.completed_rows,
+        "failed_rows": batch.failed_rows,
+        "credits_reserved": batch.credits_reserved,
+        "credits_used": batch.credits_used,
+        "execution_time_ms": batch.execution_time_ms,
+        "row_time_ms": batch.row_time_ms,
+    }
+
+
+class ExecutionEventBus:
+    """
+    Unlike download progress, every event matters here (each one is a node changing
+    state), so events are appended to a log per execution instead of coalesced.
+    Subscribers keep a cursor into the log and are woken through their own event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._logs: Dict[str, List[Dict[str, Any]]] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def publish(self, execution_id: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            log = self._logs.setdefault(execution_id, [])
+            log.append(dict(event, seq=len(log) + 1))
+            self._updated_at[execution_id] = time.monotonic()
+            subscribers = list(self._subscribers.get(execution_id, ()))
+            if is_terminal(event):
+                self._evict_expired()
+        for loop, wakeup in subscribers:
+            if not wakeup.is_set():
+                try:
+                    loop.call_soon_threadsafe(wakeup.set)
+                except RuntimeError:
+                    # Subscriber's loop already closed
+                    pass
+
+    def cursor(self, execution_id: str) -> int:
+        """Sequence number of the latest event (0 if none); pass it to subscribe() to skip the backlog."""
+        with self._lock:
+            return len(self._logs.get(execution_id, ()))
+
+    def _evict_expired(self) -> None:
+        # Called with the lock held
+        now = time.monotonic()
+        for execution_id, updated_at in list(self._updated_at.items()):
+            if execution_id in self._subscribers:
+                continue
+            finished = is_terminal(self._logs[execution_id][-1])
+            if now - updated_at > (FINISHED_RETENTION if finished else STALE_RETENTION):
+                del self._logs[execution_id]
+                del self._updated_at[execution_id]
+
+    async def subscribe(
+        self,
+        execution_id: str,
+        after: int = 0,
+        idle_timeout: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield events with seq > `after` until the execution finishes. With `idle_timeout`,
+        None is yielded whenever nothing was published for that long, so the caller can
+        check on runs whose worker lives in another process.
+        """
+        wakeup = asyncio.Event()
+        entry = (asyncio.get_running_loop(), wakeup)
+        with self._lock:
+            self._subscribers.setdefault(execution_id, []).append(entry)
+        try:
+            while True:
+                wakeup.clear()
+                with self._lock:
+                    pending = self._logs.get(execution_id, [])[after:]
+                for event in pending:
+                    after = event["seq"]
+                    yield event
+                    if is_terminal(event):
+                        return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=idle_timeout)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(execution_id, [])
+                if entry in subscribers:
+                    subscribers.remove(entry)
+                if not subscribers:
+                    self._subscribers.pop(execution_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "executions": len(self._logs),
+                "events": sum(len(log) for log in self._logs.values()),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+            }
+
+
+_bus = ExecutionEventBus()
+
+
+def get_execution_events() -> ExecutionEventBus:
+    return _bus
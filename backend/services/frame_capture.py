@@ -0,0 +1,174 @@
+"""Frame capture from YouTube streams: cached stream URLs and batched ffmpeg extraction."""
+import asyncio
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.media_governor import get_media_governor
+
+STREAM_FORMAT = "bestvideo[height<=720]/best[height<=720]"
+RESOLVE_TIMEOUT = 15.0
+FRAME_TIMEOUT = 60.0
+BATCH_FRAME_TIMEOUT = 180.0
+
+# googlevideo URLs carry their signed expiry; stop using them a little early
+URL_EXPIRY_MARGIN = 300
+DEFAULT_URL_TTL = 3600
+EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+# Timestamps within this span are decoded in one pass from a single seek;
+# wider batches seek each frame separately (still one ffmpeg process)
+MAX_SINGLE_PASS_SPAN = 60
+
+
+def _url_expiry(url: str) -> float:
+    match = EXPIRE_RE.search(url)
+    if match:
+        return int(match.group(1)) - URL_EXPIRY_MARGIN
+    return time.time() + DEFAULT_URL_TTL
+
+
+async def run_command(cmd: List[str], pool: str, timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+    """Run a yt-dlp/ffmpeg subprocess through the media governor."""
+    return await get_media_governor().run(pool, cmd, timeout=timeout)
+
+
+class StreamUrlCache:
+    """
+    Resolved `yt-dlp -g` URLs per videoId, kept until their signed expiry.
+    Concurrent resolves of the same video share one yt-dlp process.
+    """
+
+    def __init__(self):
+        self._urls: Dict[str, Tuple[str, float]] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._counters = {"hits": 0, "misses": 0}
+
+    def is_cached(self, video_id: str) -> bool:
+        cached = self._urls.get(video_id)
+        return bool(cached and cached[1] > time.time())
+
+    async def resolve(self, video_id: str) -> Optional[str]:
+        if self.is_cached(video_id):
+            self._counters["hits"] += 1
+            return self._urls[video_id][0]
+
+        self._counters["misses"] += 1
+        pending = self._pending.get(video_id)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[video_id] = future
+        try:
+            url = await self._fetch(video_id)
+            if url:
+                self._urls[video_id] = (url, _url_expiry(url))
+            future.set_result(url)
+            return url
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited future does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._pending[video_id]
+
+    async def _fetch(self, video_id: str) -> Optional[str]:
+        returncode, stdout, stderr = await run_command([
+            "yt-dlp",
+            "-g",
+            "-f", STREAM_FORMAT,
+            f"https://www.youtube.com/watch?v={video_id}"
+        ], pool="extract", timeout=RESOLVE_TIMEOUT)
+        if returncode != 0 or not stdout:
+            print(f"yt-dlp error (will try fallback): {stderr.decode(errors='replace')}")
+            return None
+        return stdout.decode().strip().split('\n')[0]
+
+    def invalidate(self, video_id: str) -> None:
+        self._urls.pop(video_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        now = time.time()
+        return dict(self._counters, cached=sum(1 for _, expires in self._urls.values() if expires > now))
+
+
+async def extract_frame(source: str, timestamp: float, output_path: Path) -> bool:
+    returncode, _, stderr = await run_command([
+        "ffmpeg",
+        "-ss", str(timestamp),
+        "-i", source,
+        "-frames:v", "1",
+        "-q:v", "2",
+        "-y",
+        str(output_path)
+    ], pool="transcode", timeout=FRAME_TIMEOUT)
+    if returncode != 0:
+        print(f"ffmpeg stream capture failed: {stderr.decode(errors='replace')}")
+    return returncode == 0 and output_path.exists()
+
+
+async def extract_frames(source: str, timestamps: List[float], output_paths: List[Path]) -> List[bool]:
+    """
+    Extract one frame per timestamp with a single ffmpeg process.
+    Close timestamps share one input (one HTTP connection, one seek) and are picked
+    out with a select filter; wide batches fall back to one seek per frame.
+    Returns, per timestamp, whether its output file was written.
+    """
+    if len(timestamps) == 1:
+        return [await extract_frame(source, timestamps[0], output_paths[0])]
+
+    order = sorted(range(len(timestamps)), key=lambda i: timestamps[i])
+    start = timestamps[order[0]]
+    span = timestamps[order[-1]] - start
+
+    with tempfile.TemporaryDirectory(dir=output_paths[0].parent) as scratch:
+        if span <= MAX_SINGLE_PASS_SPAN:
+            # First decoded frame at or after each offset from the seek point
+            offsets = [round(timestamps[i] - start, 3) for i in order]
+            expression = "+".join(f"gte(t,{o})*(lt(prev_t,{o})+isnan(prev_t))" for o in offsets)
+            cmd = [
+                "ffmpeg",
+                "-ss", str(start),
+                "-i", source,
+                "-vf", f"select='{expression}'",
+                "-vsync", "vfr",
+                "-frames:v", str(len(offsets)),
+                "-q:v", "2",
+                "-y",
+                os.path.join(scratch, "frame_%03d.jpg")
+            ]
+            # Frames come out in time order
+            scratch_paths = {i: Path(scratch) / f"frame_{n:03d}.jpg" for n, i in enumerate(order, start=1)}
+        else:
+            cmd = ["ffmpeg"]
+            for t in timestamps:
+                cmd += ["-ss", str(t), "-i", source]
+            scratch_paths = {}
+            for i in range(len(timestamps)):
+                scratch_paths[i] = Path(scratch) / f"frame_{i:03d}.jpg"
+                cmd += ["-map", f"{i}:v:0", "-frames:v", "1", "-q:v", "2", "-y", str(scratch_paths[i])]
+
+        returncode, _, stderr = await run_command(cmd, pool="transcode", timeout=BATCH_FRAME_TIMEOUT)
+        if returncode != 0:
+            print(f"ffmpeg batch capture failed: {stderr.decode(errors='replace')[-500:]}")
+
+        written = []
+        for i, output_path in enumerate(output_paths):
+            if scratch_paths[i].exists():
+                os.replace(scratch_paths[i], output_path)
+                written.append(True)
+            else:
+                written.append(False)
+        return written
+
+
+_stream_urls = StreamUrlCache()
+
+
+def get_stream_url_cache() -> StreamUrlCache:
+    return _stream_urls
@@ -0,0 +1,155 @@
+"""Resized WebP variants of saved images and clip thumbnails, generated on first request."""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.media_cache import get_media_cache
+from services.media_governor import get_media_governor
+from services.safe_fetch import FetchError, fetch_bytes
+
+# Variant name -> maximum width in pixels; smaller sources are never upscaled
+DERIVATIVE_SIZES = {"sm": 320, "md": 640, "lg": 1280}
+WEBP_QUALITY = 80
+DERIVATIVE_TIMEOUT = 60.0
+
+# Variants are addressed by their source, so a URL always yields the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Signs /api/img tokens. Without it no variant URLs are issued or accepted, and
+# images are served from their source URLs as before.
+IMAGE_SIGNING_KEY = os.getenv("IMAGE_SIGNING_KEY")
+
+
+def _signature(source: str) -> str:
+    return hmac.new(IMAGE_SIGNING_KEY.encode(), source.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def _is_supported(source: Optional[str]) -> bool:
+    return (bool(IMAGE_SIGNING_KEY) and bool(source)
+            and (source.startswith(("http://", "https://")) or source.startswith("/temp/")))
+
+
+def derivative_url(source: Optional[str], size: str = "md") -> Optional[str]:
+    """
+    URL of a resized variant of `source`, or `source` itself when it cannot be resized
+    (e.g. data: URIs). The token is signed so the endpoint cannot be used as an open proxy.
+    """
+    if not _is_supported(source):
+        return source
+    encoded = base64.urlsafe_b64encode(source.encode()).decode().rstrip("=")
+    return f"/api/img/{encoded}.{_signature(source)}/{size}.webp"
+
+
+def derivative_urls(source: Optional[str]) -> Optional[Dict[str, str]]:
+    if not _is_supported(source):
+        return None
+    return {size: derivative_url(source, size) for size in DERIVATIVE_SIZES}
+
+
+def decode_token(token: str) -> Optional[str]:
+    """Source URL for a token issued by derivative_url, or None if it was tampered with."""
+    if not IMAGE_SIGNING_KEY:
+        return None
+    encoded, _, signature = token.rpartition(".")
+    try:
+        source = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not hmac.compare_digest(signature, _signature(source)):
+        return None
+    return source
+
+
+async def image_input(source: str) -> Tuple[List[str], Optional[bytes]]:
+    """
+    ffmpeg input arguments for an image, and the bytes to feed its stdin. Remote images
+    are fetched by us (public addresses only, bounded) and piped in, so ffmpeg itself
+    never opens a network URL. Raises FetchError if the source cannot be used.
+    """
+    if source.startswith("/temp/"):
+        local = get_media_cache().local_path(source)
+        if local is None:
+            raise FetchError(f"{source} is not in the media cache")
+        return ["-i", str(local)], None
+    data = await fetch_bytes(source)
+    return ["-protocol_whitelist", "pipe", "-i", "pipe:0"], data
+
+
+class DerivativeStore:
+    """
+    Variants live in the media cache (and so share its disk budget and eviction).
+    Concurrent requests for the same missing variant share one ffmpeg run.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._counters = {"hits": 0, "generated": 0, "failed": 0}
+
+    async def get(self, source: str, size: str) -> Optional[Path]:
+        cache = get_media_cache()
+        source_key = "img_" + hashlib.sha256(source.encode()).hexdigest()[:24]
+        fmt = f"webp:{size}"
+        cached = cache.lookup(source_key, fmt)
+        if cached:
+            self._counters["hits"] += 1
+            return cached
+
+        pending = self._pending.get((source_key, size))
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[(source_key, size)] = future
+        try:
+            path = await self._generate(cache, source, source_key, size)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._pending[(source_key, size)]
+
+    async def _generate(self, cache, source: str, source_key: str, size: str) -> Optional[Path]:
+        try:
+            ffmpeg_input, data = await image_input(source)
+        except FetchError as e:
+            print(f"WebP derivative failed for {source}: {e}")
+            self._counters["failed"] += 1
+            return None
+
+        final_path = cache.root / f"{source_key}_{size}.webp"
+        partial = cache.partial_path(final_path)
+        returncode, _, stderr = await get_media_governor().run("transcode", [
+            "ffmpeg",
+            *ffmpeg_input,
+            "-vf", f"scale='min(iw,{DERIVATIVE_SIZES[size]})':-2",
+            "-frames:v", "1",
+            "-c:v", "libwebp",
+            "-quality", str(WEBP_QUALITY),
+            "-y",
+            str(partial)
+        ], timeout=DERIVATIVE_TIMEOUT, input=data)
+        if returncode != 0 or not partial.exists():
+            print(f"WebP derivative failed for {source}: {stderr.decode(errors='replace')[-300:]}")
+            partial.unlink(missing_ok=True)
+            self._counters["failed"] += 1
+            return None
+
+        await asyncio.to_thread(cache.commit_file, source_key, f"webp:{size}", partial, final_path)
+        self._counters["generated"] += 1
+        return final_path
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters, pending=len(self._pending))
+
+
+_store = DerivativeStore()
+
+
+def get_derivative_store() -> DerivativeStore:
+    return _store
@@ -0,0 +1,26 @@
+"""Cross-process locks for background jobs that every worker process runs."""
+import fcntl
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+LOCK_DIR = Path(__file__).resolve().parent.parent / "cache"
+
+
+@contextmanager
+def try_file_lock(name: str) -> Iterator[bool]:
+    """
+    Non-blocking exclusive lock shared by all workers on the host.
+    Yields True if this process holds the lock, False if another one does.
+    """
+    LOCK_DIR.mkdir(exist_ok=True)
+    with open(LOCK_DIR / f"{name}.lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
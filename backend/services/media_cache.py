@@ -0,0 +1,295 @@
+"""Index of downloaded media in backend/temp with atomic writes and LRU eviction."""
+import asyncio
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from services.locks import LOCK_DIR, try_file_lock
+
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+MEDIA_CACHE_MAX_AGE = int(float(os.getenv("MEDIA_CACHE_MAX_AGE_HOURS", "72")) * 3600)
+JANITOR_INTERVAL = 600
+
+# Kept outside the media directory, which is publicly served under /temp
+INDEX_DIR = LOCK_DIR
+# Partial files older than this are assumed abandoned (crashed download or capture)
+ORPHAN_AGE = 3600
+# Scratch files: partial_path()'s "<stem>.<pid>.<thread>.tmp<suffix>" and yt-dlp's for cached downloads
+PARTIAL_RE = re.compile(r"\.\d+\.\d+\.tmp(\.[^.]+)?$")
+YTDLP_PARTIAL_SUFFIXES = (".part", ".ytdl")
+# Last-access updates are persisted at most this often per entry, by the janitor's flush
+TOUCH_INTERVAL = 60
+
+# Filenames produced before the index existed: "<title>-<videoId>.<ext>" and "<videoId>_<ts>.jpg"
+LEGACY_VIDEO_RE = re.compile(r"-([A-Za-z0-9_-]{11})\.(mp4|webm|mkv)$")
+LEGACY_FRAME_RE = re.compile(r"^([A-Za-z0-9_-]{11})_(\d+)\.jpg$")
+
+
+def media_key(video_id: str, fmt: str) -> str:
+    return f"{video_id}:{fmt}"
+
+
+class MediaCache:
+    """
+    Maps (videoId, format) to a file in the media directory.
+    The index is a JSON file on local disk so it survives restarts; every
+    mutation re-reads it under an exclusive flock so several workers can share it.
+    Lookups are answered from the in-memory copy and never take the flock: the
+    access times and stale entries they note are written by flush() (or the next
+    mutation), so lookup is safe to call from async handlers. Mutations block and
+    belong in a thread.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        index_dir: Path = INDEX_DIR,
+        max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+        max_age: int = MEDIA_CACHE_MAX_AGE
+    ):
+        self.root = root
+        self.index_dir = index_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.index_path = index_dir / "media_index.json"
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._loaded_mtime: Optional[float] = None
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+        # key -> last access time to record, or None to drop the entry; guarded by self._lock
+        self._pending: Dict[str, Optional[float]] = {}
+
+    # --- index persistence ---
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _refresh(self) -> None:
+        # Called with self._lock held; picks up writes from other workers
+        try:
+            mtime = self.index_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._loaded_mtime:
+            self._entries = self._read_index()
+            self._loaded_mtime = mtime
+
+    def _apply_pending(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        # Called with self._lock held
+        for key, last_access in self._pending.items():
+            if last_access is None:
+                # Only if still missing: another worker may have downloaded it again since
+                if key in entries and not (self.root / entries[key]["filename"]).exists():
+                    del entries[key]
+            elif key in entries:
+                entries[key]["last_access"] = max(entries[key]["last_access"], last_access)
+        self._pending.clear()
+
+    @contextmanager
+    def _mutate(self) -> Iterator[Dict[str, Dict[str, Any]]]:
+        """Exclusive read-modify-write of the on-disk index, including changes noted by lookups."""
+        self.index_dir.mkdir(exist_ok=True)
+        with self._lock, open(self.index_dir / "media_index.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self._read_index()
+            self._apply_pending(entries)
+            yield entries
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.index_path)
+            self._entries = entries
+            self._loaded_mtime = self.index_path.stat().st_mtime
+
+    # --- public API ---
+
+    def lookup(self, video_id: str, fmt: str) -> Optional[Path]:
+        """Path of the cached file, or None. Marks the entry as recently used."""
+        key = media_key(video_id, fmt)
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+        if entry and entry.get("uncached"):
+            # Over the byte budget: kept only until it expires, never reused
+            entry = None
+        path = self.root / entry["filename"] if entry else None
+        exists = path is not None and path.exists()
+
+        now = time.time()
+        with self._lock:
+            if not exists:
+                self._counters["misses"] += 1
+                if entry:
+                    self._pending[key] = None
+                return None
+            self._counters["hits"] += 1
+            if now - entry["last_access"] > TOUCH_INTERVAL:
+                entry["last_access"] = now
+                self._pending[key] = now
+        return path
+
+    def flush(self) -> None:
+        """Persist the access times and stale entries noted by lookups. Blocking."""
+        with self._lock:
+            if not self._pending:
+                return
+        with self._mutate():
+            pass
+
+    def add(self, video_id: str, fmt: str, path: Path) -> None:
+        """
+        Register a finished file (already at its final name) and evict if over budget.
+        A file larger than the whole budget is not cached: it stays for the request that
+        produced it and is deleted once past max age, without evicting anything.
+        """
+        now = time.time()
+        size = path.stat().st_size
+        entry = {"filename": path.name, "size": size, "created_at": now, "last_access": now}
+        if size > self.max_bytes:
+            print(f"Not caching {path.name}: {size} bytes exceed the {self.max_bytes} byte budget")
+            entry["uncached"] = True
+        with self._mutate() as entries:
+            entries[media_key(video_id, fmt)] = entry
+        if not entry.get("uncached"):
+            self.evict()
+
+    def remove_file(self, filename: str) -> None:
+        with self._mutate() as entries:
+            for key in [k for k, e in entries.items() if e["filename"] == filename]:
+                del entries[key]
+
+    def local_path(self, url: str) -> Optional[Path]:
+        """Existing file behind a /temp/... URL, confined to the media directory."""
+        if not url.startswith("/temp/"):
+            return None
+        path = (self.root / url[len("/temp/"):]).resolve()
+        if self.root.resolve() not in path.parents or not path.is_file():
+            return None
+        return path
+
+    def partial_path(self, final_path: Path) -> Path:
+        """Unique scratch path next to `final_path`; swept as an orphan if never committed."""
+        return final_path.with_name(f"{final_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{final_path.suffix}")
+
+    def commit_file(self, video_id: str, fmt: str, partial: Path, final_path: Path) -> None:
+        """Atomically move a fully written scratch file into place and index it."""
+        os.replace(partial, final_path)
+        self.add(video_id, fmt, final_path)
+
+    # --- maintenance ---
+
+    def evict(self) -> int:
+        """Drop entries past max age, then least recently used until under the byte budget."""
+        now = time.time()
+        removed = []
+        with self._mutate() as entries:
+            for key, entry in list(entries.items()):
+                if not (self.root / entry["filename"]).exists():
+                    del entries[key]
+                elif now - entry["last_access"] > self.max_age:
+                    removed.append(entries.pop(key)["filename"])
+
+            cached = {key: entry for key, entry in entries.items() if not entry.get("uncached")}
+            total = sum(e["size"] for e in cached.values())
+            for key, entry in sorted(cached.items(), key=lambda item: item[1]["last_access"]):
+                if total <= self.max_bytes:
+                    break
+                total -= entry["size"]
+                removed.append(entries.pop(key)["filename"])
+
+        for filename in removed:
+            try:
+                (self.root / filename).unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._counters["evictions"] += len(removed)
+        return len(removed)
+
+    def sweep(self) -> None:
+        """
+        Delete abandoned scratch files and adopt files written before the index existed.
+        Other unindexed files in the directory are left alone: they are not the cache's.
+        """
+        now = time.time()
+        with self._mutate() as entries:
+            indexed = {e["filename"] for e in entries.values()}
+            for path in self.root.iterdir():
+                name = path.name
+                if not path.is_file() or name in indexed:
+                    continue
+                stat = path.stat()
+                age = now - stat.st_mtime
+                if PARTIAL_RE.search(name) or name.endswith(YTDLP_PARTIAL_SUFFIXES):
+                    if age > ORPHAN_AGE:
+                        path.unlink()
+                    continue
+
+                video_match = LEGACY_VIDEO_RE.search(name)
+                frame_match = LEGACY_FRAME_RE.match(name)
+                if video_match:
+                    key = media_key(video_match.group(1), "video")
+                elif frame_match:
+                    key = media_key(frame_match.group(1), f"frame:{frame_match.group(2)}")
+                else:
+                    key = None
+
+                if key and key not in entries:
+                    entries[key] = {"filename": name, "size": stat.st_size, "created_at": stat.st_mtime, "last_access": stat.st_mtime}
+        self.evict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            entries = list(self._entries.values())
+            counters = dict(self._counters)
+        return dict(
+            counters,
+            entries=len(entries),
+            bytes=sum(e["size"] for e in entries),
+            max_bytes=self.max_bytes,
+            max_age_hours=self.max_age / 3600,
+        )
+
+
+async def run_media_cache_janitor(cache: MediaCache, interval: int = JANITOR_INTERVAL) -> None:
+    """
+    Every worker flushes what its lookups noted each TOUCH_INTERVAL; sweep and
+    eviction run every `interval`, one worker at a time.
+    """
+    last_sweep = None
+    while True:
+        try:
+            await asyncio.to_thread(cache.flush)
+            if last_sweep is None or time.monotonic() - last_sweep >= interval:
+                last_sweep = time.monotonic()
+                with try_file_lock("media_cache") as acquired:
+                    if acquired:
+                        await asyncio.to_thread(cache.sweep)
+        except Exception as e:
+            print(f"Media cache maintenance failed: {e}")
+        await asyncio.sleep(min(interval, TOUCH_INTERVAL))
+
+
+_cache: Optional[MediaCache] = None
+
+
+def init_media_cache(root: Path) -> MediaCache:
+    global _cache
+    _cache = MediaCache(root)
+    return _cache
+
+
+def get_media_cache() -> Optional[MediaCache]:
+    return _cache
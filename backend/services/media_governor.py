@@ -0,0 +1,286 @@
+"""Process-wide concurrency limits for yt-dlp, ffmpeg and model work, shared by threads and the event loop."""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+
+# extract: yt-dlp metadata, channel listing and stream URL lookups; download: yt-dlp
+# media downloads (including their ffmpeg merge); transcode: standalone ffmpeg runs;
+# predict: Replicate predictions in flight (awaited, so they hold no thread)
+POOL_LIMITS = {
+    "extract": int(os.getenv("MEDIA_EXTRACT_CONCURRENCY", "8")),
+    "download": int(os.getenv("MEDIA_DOWNLOAD_CONCURRENCY", "3")),
+    "transcode": int(os.getenv("MEDIA_TRANSCODE_CONCURRENCY", str(os.cpu_count() or 2))),
+    "predict": int(os.getenv("REPLICATE_MAX_CONCURRENT_PREDICTIONS", "32")),
+}
+
+# Pools that also limit each owner (user) separately, below the global limit
+OWNER_LIMITS = {
+    "predict": int(os.getenv("REPLICATE_PER_USER_PREDICTIONS", "4")),
+}
+
+# Passed to yt-dlp so library calls cannot hang forever on a dead connection
+YTDLP_SOCKET_TIMEOUT = 30
+
+
+class MediaTimeout(Exception):
+    """Raised when governed media work exceeds its timeout"""
+
+
+class _Pool:
+    """
+    FIFO counting semaphore usable from worker threads (blocking) and from any
+    event loop (awaitable). A released slot is handed directly to the oldest waiter.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._active = 0
+        # Each waiter is a threading.Event or a (loop, future) pair
+        self._waiters: Deque[Any] = deque()
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _record_wait(self, started: float) -> None:
+        waited = time.monotonic() - started
+        with self._lock:
+            self.acquired += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def acquire(self) -> None:
+        started = time.monotonic()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                event = None
+            else:
+                event = threading.Event()
+                self._waiters.append(event)
+        if event is not None:
+            event.wait()
+        self._record_wait(started)
+
+    async def acquire_async(self) -> None:
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                future = None
+            else:
+                future = loop.create_future()
+                waiter = (loop, future)
+                self._waiters.append(waiter)
+        if future is not None:
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        raise
+                # The slot was handed over as we were cancelled. If the hand-over already
+                # completed the future we own the slot and pass it on; otherwise the
+                # pending _hand_over sees the cancelled future and releases it.
+                if not future.cancelled():
+                    self.release()
+                raise
+        self._record_wait(started)
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                if not future.done():
+                    # The slot stays counted as active and now belongs to this waiter
+                    loop.call_soon_threadsafe(_hand_over, future, self)
+                    return
+            self._active -= 1
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Threads for run_in_thread, one per slot, so a busy pool cannot starve another."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.limit, thread_name_prefix=f"media-{self.name}")
+            return self._executor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "acquired": self.acquired,
+                "avg_wait_ms": round(self.wait_seconds / self.acquired * 1000, 1) if self.acquired else 0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+                "timeouts": self.timeouts,
+            }
+
+
+def _hand_over(future: asyncio.Future, pool: _Pool) -> None:
+    # Runs on the waiter's loop; if it was cancelled in the meantime the slot moves on
+    if future.done():
+        pool.release()
+    else:
+        future.set_result(None)
+
+
+class MediaGovernor:
+    def __init__(self, limits: Dict[str, int] = POOL_LIMITS, owner_limits: Dict[str, int] = OWNER_LIMITS):
+        self.pools = {name: _Pool(name, limit) for name, limit in limits.items()}
+        self.owner_limits = owner_limits
+        # (pool, owner) -> [per-owner pool, holders and waiters]; dropped when unused
+        self._owner_pools: Dict[Tuple[str, str], List[Any]] = {}
+        self._owner_lock = threading.Lock()
+        # pool -> [acquired, total wait, max wait] for owner slots, which outlive their pools
+        self._owner_waits: Dict[str, List[float]] = {pool: [0, 0.0, 0.0] for pool in owner_limits}
+
+    def _enter_owner_pool(self, pool: str, owner: str) -> _Pool:
+        with self._owner_lock:
+            entry = self._owner_pools.get((pool, owner))
+            if entry is None:
+                entry = self._owner_pools[(pool, owner)] = [_Pool(f"{pool}:{owner}", self.owner_limits[pool]), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _leave_owner_pool(self, pool: str, owner: str) -> None:
+        with self._owner_lock:
+            entry = self._owner_pools[(pool, owner)]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._owner_pools[(pool, owner)]
+
+    def _record_owner_wait(self, pool: str, started: float) -> None:
+        waited = time.monotonic() - started
+        with self._owner_lock:
+            waits = self._owner_waits[pool]
+            waits[0] += 1
+            waits[1] += waited
+            waits[2] = max(waits[2], waited)
+
+    @contextmanager
+    def slot(self, pool: str) -> Iterator[None]:
+        """Blocking slot for code already running in a worker thread."""
+        self.pools[pool].acquire()
+        try:
+            yield
+        finally:
+            self.pools[pool].release()
+
+    @asynccontextmanager
+    async def aslot(self, pool: str, owner: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Awaitable slot. With an `owner`, pools listed in OWNER_LIMITS first wait for one of
+        the owner's own slots, so one user's backlog never occupies the global queue.
+        """
+        if owner is None or pool not in self.owner_limits:
+            await self.pools[pool].acquire_async()
+            try:
+                yield
+            finally:
+                self.pools[pool].release()
+            return
+
+        owner_pool = self._enter_owner_pool(pool, owner)
+        try:
+            started = time.monotonic()
+            await owner_pool.acquire_async()
+            self._record_owner_wait(pool, started)
+            try:
+                await self.pools[pool].acquire_async()
+                try:
+                    yield
+                finally:
+                    self.pools[pool].release()
+            finally:
+                owner_pool.release()
+        finally:
+            self._leave_owner_pool(pool, owner)
+
+    async def run(
+        self,
+        pool: str,
+        cmd: List[str],
+        timeout: Optional[float] = None,
+        input: Optional[bytes] = None
+    ) -> Tuple[int, bytes, bytes]:
+        """
+        Run a subprocess inside a slot and return (returncode, stdout, stderr); `input` is
+        written to its stdin. The process is killed on timeout (returncode -1) and when
+        the caller is cancelled.
+        """
+        async with self.aslot(pool):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if input is not None else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.pools[pool].timeouts += 1
+                process.kill()
+                await process.wait()
+                return -1, b"", b"Timeout"
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+            return process.returncode, stdout, stderr
+
+    async def run_in_thread(self, pool: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a blocking library call (yt-dlp) on the pool's own threads once a slot is free.
+        Threads cannot be killed, so on timeout the caller gets MediaTimeout while the
+        slot stays held until the call actually returns; the limit stays truthful.
+        """
+        pool_obj = self.pools[pool]
+        await pool_obj.acquire_async()
+        task = asyncio.get_running_loop().run_in_executor(pool_obj.executor, fn)
+        task.add_done_callback(lambda _: pool_obj.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            pool_obj.timeouts += 1
+            raise MediaTimeout(f"{pool} call timed out after {timeout}s")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        with self._owner_lock:
+            owner_pools = [(key[0], entry[0]) for key, entry in self._owner_pools.items()]
+            owner_waits = {pool: list(waits) for pool, waits in self._owner_waits.items()}
+        for pool, limit in self.owner_limits.items():
+            owned = [owner_pool.stats() for name, owner_pool in owner_pools if name == pool]
+            acquired, total_wait, max_wait = owner_waits[pool]
+            stats[pool].update({
+                "owner_limit": limit,
+                "owners": len(owned),
+                "owners_waiting": sum(1 for s in owned if s["waiting"]),
+                "owner_queue": sum(s["waiting"] for s in owned),
+                "owner_avg_wait_ms": round(total_wait / acquired * 1000, 1) if acquired else 0,
+                "owner_max_wait_ms": round(max_wait * 1000, 1),
+            })
+        return stats
+
+
+_governor = MediaGovernor()
+
+
+def get_media_governor() -> MediaGovernor:
+    return _governor
@@ -0,0 +1,100 @@
+"""Memoized outputs of generative workflow nodes, keyed by what was sent to the model."""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+NODE_RESULT_CACHE_SIZE = int(os.getenv("NODE_RESULT_CACHE_SIZE", "2048"))
+# Replicate serves prediction outputs from URLs that expire after about an hour,
+# so a remembered result must not outlive its files
+NODE_RESULT_TTL = float(os.getenv("NODE_RESULT_TTL", "3000"))
+# Models whose output should never be reused, even for identical inputs
+NODE_RESULT_EXCLUDED_MODELS = {
+    model_id.strip() for model_id in os.getenv("NODE_RESULT_EXCLUDED_MODELS", "").split(",") if model_id.strip()
+}
+
+_MISSING = object()
+
+
+def is_cacheable(node_type: str, node_data: Dict[str, Any]) -> bool:
+    """
+    Nodes opt out with `"cache": false`, or with `"randomize_seed": true` when every
+    run should draw a new sample.
+    """
+    if node_data.get("cache") is False or node_data.get("randomize_seed"):
+        return False
+    return node_data.get("model_id") not in NODE_RESULT_EXCLUDED_MODELS
+
+
+def result_key(user_id: uuid.UUID, node_type: str, model_id: str, model_inputs: Dict[str, Any]) -> str:
+    """Identical resolved inputs (after upstream outputs are substituted) give the same key."""
+    canonical = json.dumps(
+        {"user": str(user_id), "type": node_type, "model": model_id, "inputs": model_inputs},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class NodeResultCache:
+    """
+    Size-bounded LRU of node outputs. Results are scoped per user: a hit is free, so
+    sharing them would hand out generations someone else paid for.
+    """
+
+    def __init__(self, max_entries: int = NODE_RESULT_CACHE_SIZE, ttl: float = NODE_RESULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "expired": 0, "credits_saved": 0}
+
+    def get(self, key: str) -> Any:
+        """The remembered output, or the module's _MISSING sentinel (outputs may be None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return _MISSING
+            stored_at, output = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return output
+
+    def put(self, key: str, output: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), output)
+            self._entries.move_to_end(key)
+            self._counters["stored"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def record_saved(self, credits: int) -> None:
+        with self._lock:
+            self._counters["credits_saved"] += credits
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+
+_cache = NodeResultCache()
+
+
+def get_node_result_cache() -> NodeResultCache:
+    return _cache
+
+
+def is_miss(output: Any) -> bool:
+    return output is _MISSING
@@ -0,0 +1,346 @@
+"""Perceptual hashes (aHash, dHash, pHash) for saved images and clip thumbnails."""
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, delete, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from database import engine
+from models import Clip, Image, ImageHash
+from services.image_derivatives import derivative_url, image_input
+from services.locks import try_file_lock
+from services.media_governor import get_media_governor
+from services.safe_fetch import FetchError
+
+HASH_SIZE = 8
+SAMPLE_SIZE = 32  # pHash takes the low frequencies of a 32x32 DCT
+HASH_TIMEOUT = 20.0
+# Hashing inline while a user saves an image must not hold the request for long
+INSERT_HASH_TIMEOUT = 5.0
+
+# pHash distance treated as "the same picture" (re-encodes, resizes, light crops);
+# BAND_COUNT bands guarantee every such match shares a band with the query
+DUPLICATE_DISTANCE = 3
+BAND_COUNT = 4
+BAND_BITS = 64 // BAND_COUNT
+DEFAULT_SIMILAR_DISTANCE = 12
+
+INDEX_INTERVAL = int(os.getenv("IMAGE_HASH_INTERVAL", "300"))
+INDEX_BATCH_SIZE = 100
+# Unreadable items remembered so the indexer does not retry them every pass
+UNREADABLE_MAX = 1000
+
+_MASK64 = (1 << 64) - 1
+
+Hashes = Tuple[int, int, int]  # (ahash, dhash, phash), unsigned
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(SAMPLE_SIZE)
+
+
+def _area_resize(pixels: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """Box-filter downscale that also handles sizes that do not divide evenly."""
+    row_edges = np.linspace(0, pixels.shape[0], rows + 1).astype(int)
+    col_edges = np.linspace(0, pixels.shape[1], cols + 1).astype(int)
+    row_sums = np.add.reduceat(pixels, row_edges[:-1], axis=0)
+    sums = np.add.reduceat(row_sums, col_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def compute_hashes(pixels: np.ndarray) -> Hashes:
+    """Hashes of a SAMPLE_SIZE x SAMPLE_SIZE grayscale image."""
+    pixels = pixels.astype(np.float64)
+
+    small = _area_resize(pixels, HASH_SIZE, HASH_SIZE)
+    ahash = _bits_to_int(small > small.mean())
+
+    wide = _area_resize(pixels, HASH_SIZE, HASH_SIZE + 1)
+    dhash = _bits_to_int(wide[:, 1:] > wide[:, :-1])
+
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only encodes overall brightness
+    phash = _bits_to_int(low > np.median(low.flatten()[1:]))
+
+    return ahash, dhash, phash
+
+
+def to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & _MASK64
+
+
+def phash_bands(phash: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(phash >> (BAND_BITS * i)) & mask for i in range(BAND_COUNT)]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(to_unsigned(a) ^ to_unsigned(b)).count("1")
+
+
+def source_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+async def hash_image(url: str, timeout: float = HASH_TIMEOUT) -> Optional[Hashes]:
+    """Decode `url` to 32x32 grayscale with ffmpeg and hash it; None if it cannot be read."""
+    if not url.startswith(("http://", "https://", "/temp/")):
+        return None
+    try:
+        ffmpeg_input, data = await image_input(url)
+    except FetchError as e:
+        print(f"Perceptual hash failed for {url}: {e}")
+        return None
+
+    returncode, stdout, stderr = await get_media_governor().run("transcode", [
+        "ffmpeg",
+        *ffmpeg_input,
+        "-vf", f"scale={SAMPLE_SIZE}:{SAMPLE_SIZE}:flags=area,format=gray",
+        "-frames:v", "1",
+        "-f", "rawvideo",
+        "pipe:1"
+    ], timeout=timeout, input=data)
+    if returncode != 0 or len(stdout) != SAMPLE_SIZE * SAMPLE_SIZE:
+        print(f"Perceptual hash failed for {url}: {stderr.decode(errors='replace')[-300:]}")
+        return None
+    pixels = np.frombuffer(stdout, dtype=np.uint8).reshape(SAMPLE_SIZE, SAMPLE_SIZE)
+    return compute_hashes(pixels)
+
+
+def store_hashes(
+    session: Session,
+    item_type: str,
+    item_id: uuid.UUID,
+    user_id: Optional[uuid.UUID],
+    url: str,
+    hashes: Hashes
+) -> ImageHash:
+    """Insert or replace the hash row of an item (not committed)."""
+    ahash, dhash, phash = hashes
+    row = session.exec(
+        select(ImageHash).where(ImageHash.item_type == item_type, ImageHash.item_id == item_id)
+    ).first() or ImageHash(item_type=item_type, item_id=item_id)
+    row.user_id = user_id
+    row.source_hash = source_hash(url)
+    row.ahash, row.dhash, row.phash = to_signed(ahash), to_signed(dhash), to_signed(phash)
+    for i, band in enumerate(phash_bands(phash)):
+        setattr(row, f"phash_band{i}", band)
+    row.created_at = int(time.time() * 1000)
+    session.add(row)
+    return row
+
+
+def find_duplicates(
+    session: Session,
+    user_id: uuid.UUID,
+    phash: int,
+    exclude: Optional[Tuple[str, uuid.UUID]] = None
+) -> List[Tuple[ImageHash, int]]:
+    """Items of a user within DUPLICATE_DISTANCE, found through the band indexes."""
+    bands = phash_bands(to_unsigned(phash))
+    candidates = session.exec(
+        select(ImageHash).where(
+            ImageHash.user_id == user_id,
+            or_(*[getattr(ImageHash, f"phash_band{i}") == band for i, band in enumerate(bands)])
+        )
+    ).all()
+    matches = []
+    for row in candidates:
+        if exclude and (row.item_type, row.item_id) == exclude:
+            continue
+        distance = hamming(row.phash, phash)
+        if distance <= DUPLICATE_DISTANCE:
+            matches.append((row, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+
+def find_similar(
+    session: Session,
+    user_id: uuid.UUID,
+    phash: int,
+    max_distance: int = DEFAULT_SIMILAR_DISTANCE,
+    limit: int = 20,
+    exclude: Optional[Tuple[str, uuid.UUID]] = None
+) -> List[Tuple[str, uuid.UUID, int]]:
+    """
+    (item_type, item_id, distance) of a user's items by pHash distance. Wider radii
+    than the band index covers, so this scans the user's hashes with vectorised popcounts.
+    """
+    rows = session.exec(
+        select(ImageHash.item_type, ImageHash.item_id, ImageHash.phash).where(ImageHash.user_id == user_id)
+    ).all()
+    if exclude:
+        rows = [row for row in rows if (row[0], row[1]) != exclude]
+    if not rows:
+        return []
+
+    hashes = np.array([to_unsigned(row[2]) for row in rows], dtype=np.uint64)
+    xor = hashes ^ np.uint64(to_unsigned(phash))
+    distances = np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    order = np.argsort(distances, kind="stable")
+    results = []
+    for i in order:
+        if distances[i] > max_distance or len(results) >= limit:
+            break
+        results.append((rows[i][0], rows[i][1], int(distances[i])))
+    return results
+
+
+async def ensure_hash(
+    session: Session,
+    item_type: str,
+    item_id: uuid.UUID,
+    user_id: Optional[uuid.UUID],
+    url: str,
+    timeout: float = HASH_TIMEOUT
+) -> Optional[ImageHash]:
+    """Stored hash row of an item, computing it now if missing or stale."""
+    row = session.exec(
+        select(ImageHash).where(ImageHash.item_type == item_type, ImageHash.item_id == item_id)
+    ).first()
+    if row and row.source_hash == source_hash(url):
+        return row
+    hashes = await hash_image(url, timeout)
+    if hashes is None:
+        return None
+    row = store_hashes(session, item_type, item_id, user_id, url, hashes)
+    try:
+        session.commit()
+    except IntegrityError:
+        # The background indexer inserted the row while we were hashing; same image, keep theirs
+        session.rollback()
+        return session.exec(
+            select(ImageHash).where(ImageHash.item_type == item_type, ImageHash.item_id == item_id)
+        ).first()
+    session.refresh(row)
+    return row
+
+
+def describe_items(session: Session, matches: List[Tuple[str, uuid.UUID, int]]) -> List[Dict]:
+    """Response entries for (item_type, item_id, distance) matches."""
+    image_ids = [item_id for item_type, item_id, _ in matches if item_type == "image"]
+    clip_ids = [item_id for item_type, item_id, _ in matches if item_type == "clip"]
+    images = {i.id: i for i in session.exec(select(Image).where(Image.id.in_(image_ids))).all()} if image_ids else {}
+    clips = {c.id: c for c in session.exec(select(Clip).where(Clip.id.in_(clip_ids))).all()} if clip_ids else {}
+
+    results = []
+    for item_type, item_id, distance in matches:
+        if item_type == "image" and item_id in images:
+            image = images[item_id]
+            url = image.thumbnail_url or image.image_url
+            results.append({"type": "image", "id": str(item_id), "title": image.title, "thumbnail": derivative_url(url, "sm"), "distance": distance})
+        elif item_type == "clip" and item_id in clips:
+            clip = clips[item_id]
+            results.append({"type": "clip", "id": str(item_id), "title": clip.title, "thumbnail": derivative_url(clip.thumbnail, "sm"), "distance": distance})
+    return results
+
+
+def _pending_items(session: Session, limit: int) -> List[Tuple[str, uuid.UUID, Optional[uuid.UUID], str]]:
+    """
+    Images and clip thumbnails with no hash yet. A changed thumbnail drops its hash
+    (see forget_hash), and lookups recompute stale rows through ensure_hash.
+    """
+    images = session.exec(
+        select(Image.id, Image.user_id, Image.image_url)
+        .outerjoin(ImageHash, and_(ImageHash.item_type == "image", ImageHash.item_id == Image.id))
+        .where(ImageHash.id.is_(None))
+        .limit(limit)
+    ).all()
+    pending = [("image", image_id, user_id, url) for image_id, user_id, url in images]
+    if len(pending) < limit:
+        clips = session.exec(
+            select(Clip.id, Clip.user_id, Clip.thumbnail)
+            .outerjoin(ImageHash, and_(ImageHash.item_type == "clip", ImageHash.item_id == Clip.id))
+            .where(ImageHash.id.is_(None))
+            .where(Clip.thumbnail.is_not(None), Clip.thumbnail != "")
+            .limit(limit - len(pending))
+        ).all()
+        pending += [("clip", clip_id, user_id, url) for clip_id, user_id, url in clips]
+    return pending
+
+
+def forget_hash(session: Session, item_type: str, item_id: uuid.UUID) -> None:
+    """Drop an item's hash after its URL changed so the indexer hashes it again (not committed)."""
+    session.exec(delete(ImageHash).where(ImageHash.item_type == item_type, ImageHash.item_id == item_id))
+
+
+def _purge_orphans(session: Session) -> None:
+    # Hash rows carry no foreign keys so deletes elsewhere stay untouched; clean up here
+    session.exec(delete(ImageHash).where(ImageHash.item_type == "image", ImageHash.item_id.not_in(select(Image.id))))
+    session.exec(delete(ImageHash).where(ImageHash.item_type == "clip", ImageHash.item_id.not_in(select(Clip.id))))
+
+
+# Items that could not be decoded are skipped until their URL changes or the process restarts;
+# past UNREADABLE_MAX the oldest are forgotten and retried
+_unreadable: "OrderedDict[Tuple[str, uuid.UUID], str]" = OrderedDict()
+
+
+async def index_pending(batch_size: int = INDEX_BATCH_SIZE) -> int:
+    with Session(engine) as session:
+        _purge_orphans(session)
+        session.commit()
+        pending = [
+            item for item in _pending_items(session, batch_size + len(_unreadable))
+            if _unreadable.get(item[:2]) != item[3]
+        ][:batch_size]
+
+    hashes = await asyncio.gather(*(hash_image(url) for _, _, _, url in pending))
+
+    indexed = 0
+    with Session(engine) as session:
+        for (item_type, item_id, user_id, url), item_hashes in zip(pending, hashes):
+            if item_hashes is None:
+                _unreadable[(item_type, item_id)] = url
+                _unreadable.move_to_end((item_type, item_id))
+                while len(_unreadable) > UNREADABLE_MAX:
+                    _unreadable.popitem(last=False)
+                continue
+            store_hashes(session, item_type, item_id, user_id, url, item_hashes)
+            try:
+                session.commit()
+            except IntegrityError:
+                # Hashed on demand (ensure_hash) in the meantime
+                session.rollback()
+                continue
+            indexed += 1
+    return indexed
+
+
+async def run_image_hash_indexer(interval: int = INDEX_INTERVAL) -> None:
+    """Background loop hashing new images and thumbnails; one worker at a time."""
+    while True:
+        try:
+            with try_file_lock("image_hashes") as acquired:
+                if acquired:
+                    indexed = await index_pending()
+                    if indexed:
+                        print(f"Hashed {indexed} images and thumbnails")
+        except Exception as e:
+            print(f"Image hash indexing failed: {e}")
+        await asyncio.sleep(interval)
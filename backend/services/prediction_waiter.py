@@ -0,0 +1,102 @@
+"""Waits on Replicate predictions without holding a thread: woken by webhooks, with polling as a fallback."""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+TERMINAL_PREDICTION_STATUSES = ("succeeded", "failed", "canceled")
+
+# First poll after this many seconds, backing off to the maximum; with a webhook
+# configured the poll is only a safety net for lost or misrouted deliveries
+PREDICTION_POLL_INTERVAL = float(os.getenv("PREDICTION_POLL_INTERVAL", "2"))
+PREDICTION_POLL_MAX_INTERVAL = 10.0
+PREDICTION_WEBHOOK_POLL_MAX_INTERVAL = 30.0
+PREDICTION_TIMEOUT = float(os.getenv("PREDICTION_TIMEOUT", "1800"))
+
+
+class PredictionTimeout(Exception):
+    """Raised when a prediction is still running after PREDICTION_TIMEOUT"""
+
+
+class PredictionWaiter:
+    """
+    Waiters are keyed by prediction id. A webhook only wakes them: the prediction is
+    then fetched from Replicate, so a forged callback cannot inject an output.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._counters = {"completed": 0, "webhooks": 0, "polls": 0, "timeouts": 0}
+
+    def notify(self, prediction_id: str) -> bool:
+        """Wake everything waiting on `prediction_id`; False if nothing in this process is."""
+        with self._lock:
+            waiters = list(self._waiting.get(prediction_id, ()))
+            if waiters:
+                self._counters["webhooks"] += 1
+        for loop, wakeup in waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # Waiter's loop already closed
+                pass
+        return bool(waiters)
+
+    async def wait(
+        self,
+        prediction_id: str,
+        fetch: Callable[[str], Awaitable[Dict[str, Any]]],
+        webhook: bool,
+        timeout: float = PREDICTION_TIMEOUT
+    ) -> Dict[str, Any]:
+        """Prediction state as returned by `fetch` once it reaches a terminal status."""
+        wakeup = asyncio.Event()
+        entry = (asyncio.get_running_loop(), wakeup)
+        with self._lock:
+            self._waiting.setdefault(prediction_id, []).append(entry)
+
+        deadline = time.monotonic() + timeout
+        interval = PREDICTION_POLL_INTERVAL
+        max_interval = PREDICTION_WEBHOOK_POLL_MAX_INTERVAL if webhook else PREDICTION_POLL_MAX_INTERVAL
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PredictionTimeout(f"Prediction {prediction_id} did not finish within {int(timeout)}s")
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=min(interval, remaining))
+                except asyncio.TimeoutError:
+                    interval = min(interval * 1.5, max_interval)
+                    self._counters["polls"] += 1
+                wakeup.clear()
+
+                try:
+                    prediction = await fetch(prediction_id)
+                except Exception as e:
+                    # Transient API errors must not fail a prediction that is still running
+                    print(f"Could not fetch prediction {prediction_id}: {e}")
+                    continue
+                if prediction["status"] in TERMINAL_PREDICTION_STATUSES:
+                    self._counters["completed"] += 1
+                    return prediction
+        finally:
+            with self._lock:
+                waiters = self._waiting.get(prediction_id, [])
+                if entry in waiters:
+                    waiters.remove(entry)
+                if not waiters:
+                    self._waiting.pop(prediction_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, waiting=sum(len(w) for w in self._waiting.values()))
+
+
+_waiter = PredictionWaiter()
+
+
+def get_prediction_waiter() -> PredictionWaiter:
+    return _waiter
@@ -0,0 +1,107 @@
+"""Per-task progress pub/sub: worker threads publish, SSE handlers subscribe."""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+TERMINAL_STATUSES = ("completed", "error", "exists")
+
+# Subscribers receive at most one update per interval; intermediate states are dropped
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "0.25"))
+# Finished tasks stay readable this long so a reconnecting client still sees the result
+FINISHED_RETENTION = 300
+# Tasks that stop publishing without finishing (e.g. worker crash) are dropped after this
+STALE_RETENTION = 3600
+
+
+class ProgressBroker:
+    """
+    Keeps only the latest state per task. publish() is thread-safe and never blocks;
+    each subscriber is woken through its own event loop and reads the latest state,
+    so bursts of yt-dlp callbacks coalesce instead of queueing.
+    """
+
+    def __init__(self, min_interval: float = PROGRESS_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def publish(self, task_id: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._states[task_id] = data
+            self._updated_at[task_id] = time.monotonic()
+            subscribers = list(self._subscribers.get(task_id, ()))
+            if data.get("status") in TERMINAL_STATUSES:
+                self._evict_expired()
+        for loop, event in subscribers:
+            if not event.is_set():
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    # Subscriber's loop already closed
+                    pass
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._states.get(task_id)
+
+    def _evict_expired(self) -> None:
+        # Called with the lock held
+        now = time.monotonic()
+        for task_id, updated_at in list(self._updated_at.items()):
+            if task_id in self._subscribers:
+                continue
+            finished = self._states[task_id].get("status") in TERMINAL_STATUSES
+            if now - updated_at > (FINISHED_RETENTION if finished else STALE_RETENTION):
+                del self._states[task_id]
+                del self._updated_at[task_id]
+
+    async def subscribe(self, task_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the current state, then coalesced updates until the task finishes."""
+        event = asyncio.Event()
+        entry = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._evict_expired()
+            if task_id not in self._states:
+                return
+            self._subscribers.setdefault(task_id, []).append(entry)
+        try:
+            while True:
+                event.clear()
+                state = self.get(task_id)
+                if state is None:
+                    return
+                yield state
+                if state.get("status") in TERMINAL_STATUSES:
+                    return
+                sent_at = time.monotonic()
+                await event.wait()
+                # Rate limit, but let a final state through as soon as it arrives
+                state = self.get(task_id)
+                wait = self.min_interval - (time.monotonic() - sent_at)
+                if wait > 0 and state and state.get("status") not in TERMINAL_STATUSES:
+                    await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(task_id, [])
+                if entry in subscribers:
+                    subscribers.remove(entry)
+                if not subscribers:
+                    self._subscribers.pop(task_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tasks": len(self._states),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+            }
+
+
+_broker = ProgressBroker()
+
+
+def get_progress_broker() -> ProgressBroker:
+    return _broker
@@ -1,10 +1,13 @@
 """Replicate API service wrapper."""
+import asyncio
 import os
 import replicate
 from typing import Dict, Any, List, Optional
 import time
 from sqlmodel import Session, select
 from models import ReplicateModelCache
+from services.media_governor import get_media_governor
+from services.prediction_waiter import get_prediction_waiter
 import uuid
 import json
 
@@ -244,110 +247,138 @@ class ReplicateService:
                 
         return processed_inputs
 
-    def run_prediction(self, model_id: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
-        """Run a prediction on Replicate."""
-        temp_files = []
-        open_handles = []
-        
-        try:
-            # Process inputs (handle Data URIs etc)
-            processed_inputs = self._process_inputs(inputs)
-            
-            # Special handling for 'image_input' (GPT-5/Vision models requiring binary files)
-            if 'image_input' in processed_inputs and isinstance(processed_inputs['image_input'], list):
-                import tempfile
-                import urllib.request
-                
-                file_inputs = []
-                for url in processed_inputs['image_input']:
-                    if isinstance(url, str) and (url.startswith('http') or url.startswith('data:')):
-                         try:
-                            # Create temp file
-                            fd, path = tempfile.mkstemp(suffix=".jpg") # Assume jpg or infer extension?
-                            os.close(fd) # Close low-level handle, we will reopen
-                            
-                            # Download
-                            if url.startswith('http'):
-                                urllib.request.urlretrieve(url, path)
-                            # Data URI handling could go here but let's assume http for now based on context
-                            
-                            # Open file object
-                            f = open(path, "rb")
-                            open_handles.append(f)
-                            temp_files.append(path)
-                            file_inputs.append(f)
-                         except Exception as e:
-                             print(f"Failed to download temp image: {e}")
-                             # Fallback to original if download fails? Or fail?
-                             # Let's keep original to avoid crashing everything if one fails, 
-                             # though mixing might be bad.
-                             file_inputs.append(url)
-                    else:
-                        file_inputs.append(url)
-                
-                processed_inputs['image_input'] = file_inputs
-
-            # Run the model
-            output = replicate.run(model_id, input=processed_inputs)
+    def _prepare_image_input(self, processed_inputs: Dict[str, Any], temp_files: List[str], open_handles: List[Any]) -> None:
+        """Download 'image_input' URLs to temp files (GPT-5/Vision models requiring binary files)."""
+        if 'image_input' in processed_inputs and isinstance(processed_inputs['image_input'], list):
+            import tempfile
+            import urllib.request
             
-            # Handle different output types
-            if isinstance(output, list):
-                result = output
-            elif isinstance(output, str):
-                result = [output]
-            else:
-                result = [str(output)]
+            file_inputs = []
+            for url in processed_inputs['image_input']:
+                if isinstance(url, str) and (url.startswith('http') or url.startswith('data:')):
+                     try:
+                        # Create temp file
+                        fd, path = tempfile.mkstemp(suffix=".jpg") # Assume jpg or infer extension?
+                        os.close(fd) # Close low-level handle, we will reopen
+                        
+                        # Download
+                        if url.startswith('http'):
+                            urllib.request.urlretrieve(url, path)
+                        # Data URI handling could go here but let's assume http for now based on context
+                        
+                        # Open file object
+                        f = open(path, "rb")
+                        open_handles.append(f)
+                        temp_files.append(path)
+                        file_inputs.append(f)
+                     except Exception as e:
+                         print(f"Failed to download temp image: {e}")
+                         # Fallback to original if download fails? Or fail?
+                         # Let's keep original to avoid crashing everything if one fails, 
+                         # though mixing might be bad.
+                         file_inputs.append(url)
+                else:
+                    file_inputs.append(url)
             
+            processed_inputs['image_input'] = file_inputs
+
+    @staticmethod
+    def _cleanup(temp_files: List[str], open_handles: List[Any]) -> None:
+        for f in open_handles:
+            try:
+                f.close()
+            except:
+                pass
+        
+        for path in temp_files:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except:
+                pass
+
+    @staticmethod
+    def _normalize_output(output: Any) -> List[Any]:
+        # Handle different output types
+        if isinstance(output, list):
+            return output
+        elif isinstance(output, str):
+            return [output]
+        return [str(output)]
+
+    async def predict(self, model_id: str, inputs: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run a prediction and return {"status", "output"} or {"status", "error"}, awaited
+        without a thread: the prediction is created asynchronously and its completion arrives by webhook (REPLICATE_WEBHOOK_URL)
+        or polling. Cancelling the awaiting task cancels the prediction on Replicate.
+        Predictions in flight are limited globally and per `owner` (user id).
+        """
+        async with get_media_governor().aslot("predict", owner):
+            return await self._predict(model_id, inputs)
+
+    async def _predict(self, model_id: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        webhook_url = os.getenv("REPLICATE_WEBHOOK_URL")
+        try:
+            prediction_id = await self.run_prediction_async(model_id, inputs, webhook_url)
+        except ValueError as e:
             return {
-                "status": "succeeded",
-                "output": result
+                "status": "failed",
+                "error": str(e)
             }
-        except Exception as e:
+        
+        try:
+            prediction = await get_prediction_waiter().wait(prediction_id, self._fetch_prediction, webhook=bool(webhook_url))
+        except BaseException:
+            # Cancelled execution or timeout: stop paying for the prediction
+            await asyncio.shield(self.cancel_prediction(prediction_id))
+            raise
+        
+        if prediction["status"] != "succeeded":
             return {
                 "status": "failed",
-                "error": str(e)
+                "error": prediction.get("error") or f"Prediction {prediction['status']}"
             }
-        finally:
-            # Cleanup
-            for f in open_handles:
-                try:
-                    f.close()
-                except:
-                    pass
-            
-            for path in temp_files:
-                try:
-                    if os.path.exists(path):
-                        os.remove(path)
-                except:
-                    pass
+        return {
+            "status": "succeeded",
+            "output": self._normalize_output(prediction["output"])
+        }
     
-    async def run_prediction_async(self, model_id: str, inputs: Dict[str, Any]) -> str:
+    async def run_prediction_async(self, model_id: str, inputs: Dict[str, Any], webhook_url: Optional[str] = None) -> str:
         """Start an async prediction and return prediction ID."""
+        temp_files = []
+        open_handles = []
         try:
             # Process inputs
             processed_inputs = self._process_inputs(inputs)
+            if 'image_input' in processed_inputs:
+                # Only the downloads use a thread, not the prediction itself
+                await asyncio.to_thread(self._prepare_image_input, processed_inputs, temp_files, open_handles)
             
-            prediction = await replicate.predictions.create(
-                version=model_id,
-                input=processed_inputs
-            )
+            # "owner/name" runs the model's latest version, "owner/name:version" a pinned one
+            name, _, version = model_id.partition(":")
+            target = {"version": version} if version else {"model": name}
+            params = {"webhook": webhook_url, "webhook_events_filter": ["completed"]} if webhook_url else {}
+            prediction = await replicate.predictions.async_create(input=processed_inputs, **target, **params)
             return prediction.id
         except Exception as e:
             raise ValueError(f"Failed to start prediction: {str(e)}")
+        finally:
+            self._cleanup(temp_files, open_handles)
+    
+    async def _fetch_prediction(self, prediction_id: str) -> Dict[str, Any]:
+        prediction = await replicate.predictions.async_get(prediction_id)
+        return {
+            "id": prediction.id,
+            "status": prediction.status,
+            "output": prediction.output,
+            "error": prediction.error,
+            "logs": prediction.logs
+        }
     
     async def get_prediction_status(self, prediction_id: str) -> Dict[str, Any]:
         """Get status of a running prediction."""
         try:
-            prediction = await replicate.predictions.get(prediction_id)
-            
-            return {
-                "id": prediction.id,
-                "status": prediction.status,
-                "output": prediction.output,
-                "error": prediction.error,
-                "logs": prediction.logs
-            }
+            return await self._fetch_prediction(prediction_id)
         except Exception as e:
             return {
                 "status": "failed",
@@ -357,7 +388,7 @@ class ReplicateService:
     async def cancel_prediction(self, prediction_id: str) -> bool:
         """Cancel a running prediction."""
         try:
-            await replicate.predictions.cancel(prediction_id)
+            await replicate.predictions.async_cancel(prediction_id)
             return True
         except Exception as e:
             print(f"Failed to cancel prediction: {e}")
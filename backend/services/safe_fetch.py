@@ -0,0 +1,96 @@
+"""
+Fetching user-supplied URLs from the server. Only public addresses are contacted,
+redirects are re-checked hop by hop, and responses are bounded in time and size,
+so a stored image URL cannot be used to reach internal services or cloud metadata.
+Requests go to the address that was checked, so a second DNS answer cannot redirect them.
+"""
+import asyncio
+import ipaddress
+import socket
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import httpx
+
+FETCH_TIMEOUT = 15.0
+MAX_FETCH_BYTES = 20 * 1024 * 1024
+MAX_REDIRECTS = 3
+
+
+class FetchError(Exception):
+    """The URL is not allowed or could not be fetched within the limits"""
+
+
+Address = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+
+async def check_public_url(url: str) -> Address:
+    """
+    Raise FetchError unless `url` is http(s) and every address its host resolves to is
+    public; otherwise the address to connect to.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchError(f"Unsupported URL: {url}")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise FetchError(f"Cannot resolve {parts.hostname}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        # Loopback, private, link-local (cloud metadata), shared and reserved ranges are not global
+        if not address.is_global:
+            raise FetchError(f"{parts.hostname} resolves to a non-public address")
+    if not infos:
+        raise FetchError(f"Cannot resolve {parts.hostname}")
+    address = ipaddress.ip_address(infos[0][4][0].split("%")[0])
+    return address.ipv4_mapped or address if isinstance(address, ipaddress.IPv6Address) else address
+
+
+def _pinned(url: str, address: Address) -> Tuple[str, Dict[str, str], Dict[str, str]]:
+    """`url` with its host replaced by `address`, plus the Host header and TLS server name it needs."""
+    parts = urlsplit(url)
+    port = f":{parts.port}" if parts.port else ""
+    host = f"[{address}]" if isinstance(address, ipaddress.IPv6Address) else str(address)
+    name = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    pinned = urlunsplit((parts.scheme, host + port, parts.path, parts.query, ""))
+    extensions = {"sni_hostname": parts.hostname} if parts.scheme == "https" else {}
+    return pinned, {"Host": name + port}, extensions
+
+
+async def fetch_bytes(url: str, max_bytes: int = MAX_FETCH_BYTES, timeout: float = FETCH_TIMEOUT) -> bytes:
+    """Body of `url`, following at most MAX_REDIRECTS redirects to public addresses only."""
+    try:
+        # Overall deadline; httpx's own timeout applies per read, which a slow trickle never hits
+        return await asyncio.wait_for(_fetch(url, max_bytes, timeout), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise FetchError(f"Fetching {url} took longer than {timeout}s")
+
+
+async def _fetch(url: str, max_bytes: int, timeout: float) -> bytes:
+    async with httpx.AsyncClient(follow_redirects=False, timeout=timeout) as client:
+        for _ in range(MAX_REDIRECTS + 1):
+            pinned, headers, extensions = _pinned(url, await check_public_url(url))
+            try:
+                async with client.stream("GET", pinned, headers=headers, extensions=extensions) as response:
+                    if response.is_redirect:
+                        url = urljoin(url, response.headers.get("location", ""))
+                        continue
+                    if response.status_code != 200:
+                        raise FetchError(f"{url} returned HTTP {response.status_code}")
+                    declared: Optional[str] = response.headers.get("content-length")
+                    if declared and declared.isdigit() and int(declared) > max_bytes:
+                        raise FetchError(f"{url} is larger than {max_bytes} bytes")
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > max_bytes:
+                            raise FetchError(f"{url} is larger than {max_bytes} bytes")
+                    return bytes(body)
+            except httpx.HTTPError as e:
+                raise FetchError(f"Could not fetch {url}: {e}")
+    raise FetchError(f"Too many redirects for {url}")
@@ -0,0 +1,161 @@
+"""YouTube storyboard sprites (yt-dlp `sb*` formats) for instant frame scrubbing."""
+import asyncio
+import json
+import os
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import yt_dlp
+
+from services.media_cache import get_media_cache
+from services.media_governor import get_media_governor, YTDLP_SOCKET_TIMEOUT
+
+STORYBOARD_INFO_TIMEOUT = 60.0
+SHEET_TIMEOUT = 20.0
+# Highest-resolution level whose sprite sheets stay within this count; long videos
+# fall back to a coarser level rather than fetching hundreds of sheets
+MAX_STORYBOARD_SHEETS = int(os.getenv("MAX_STORYBOARD_SHEETS", "60"))
+
+
+def _pick_level(formats: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    levels = [f for f in formats if f.get("format_note") == "storyboard" and f.get("fragments")]
+    if not levels:
+        return None
+    within_budget = [f for f in levels if len(f["fragments"]) <= MAX_STORYBOARD_SHEETS]
+    if within_budget:
+        return max(within_budget, key=lambda f: f["width"] * f["height"])
+    return min(levels, key=lambda f: len(f["fragments"]))
+
+
+def _fetch_info(video_id: str) -> Dict[str, Any]:
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'socket_timeout': YTDLP_SOCKET_TIMEOUT,
+    }
+    return yt_dlp.YoutubeDL(ydl_opts).extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+
+
+def _fetch_sheet(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=SHEET_TIMEOUT) as response:
+        return response.read()
+
+
+def tile_at(storyboard: Dict[str, Any], timestamp: float) -> Dict[str, Any]:
+    """Sheet URL and pixel rectangle of the tile shown at `timestamp`."""
+    index = min(max(int(timestamp / storyboard["interval"]), 0), storyboard["frameCount"] - 1)
+    per_sheet = storyboard["columns"] * storyboard["rows"]
+    sheet, position = divmod(index, per_sheet)
+    row, column = divmod(position, storyboard["columns"])
+    return {
+        "timestamp": timestamp,
+        "url": storyboard["sheets"][sheet]["url"],
+        "x": column * storyboard["tileWidth"],
+        "y": row * storyboard["tileHeight"],
+        "width": storyboard["tileWidth"],
+        "height": storyboard["tileHeight"],
+    }
+
+
+class StoryboardCache:
+    """
+    Storyboard metadata and sprite sheets per videoId, kept in the media cache.
+    Concurrent requests for the same video share one fetch.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._counters = {"hits": 0, "fetched": 0, "unavailable": 0}
+
+    def _cached(self, video_id: str) -> Optional[Dict[str, Any]]:
+        cache = get_media_cache()
+        path = cache.lookup(video_id, "storyboard")
+        if path is None:
+            return None
+        with open(path) as f:
+            storyboard = json.load(f)
+        # Sheets are evicted independently; a partial storyboard is fetched again
+        for i in range(len(storyboard["sheets"])):
+            if cache.lookup(video_id, f"storyboard:{i}") is None:
+                return None
+        return storyboard
+
+    async def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        storyboard = self._cached(video_id)
+        if storyboard:
+            self._counters["hits"] += 1
+            return storyboard
+
+        pending = self._pending.get(video_id)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[video_id] = future
+        try:
+            storyboard = await self._fetch(video_id)
+            future.set_result(storyboard)
+            return storyboard
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._pending[video_id]
+
+    async def _fetch(self, video_id: str) -> Optional[Dict[str, Any]]:
+        governor = get_media_governor()
+        info = await governor.run_in_thread("extract", lambda: _fetch_info(video_id), timeout=STORYBOARD_INFO_TIMEOUT)
+        level = _pick_level(info.get("formats") or [])
+        if level is None:
+            self._counters["unavailable"] += 1
+            return None
+
+        cache = get_media_cache()
+        fragments = level["fragments"]
+        sheets = await asyncio.gather(*(
+            governor.run_in_thread("extract", lambda url=fragment["url"]: _fetch_sheet(url), timeout=SHEET_TIMEOUT)
+            for fragment in fragments
+        ))
+
+        sheet_entries = []
+        start = 0.0
+        for i, (fragment, data) in enumerate(zip(fragments, sheets)):
+            final_path = cache.root / f"{video_id}_{level['format_id']}_{i}.jpg"
+            partial = cache.partial_path(final_path)
+            partial.write_bytes(data)
+            await asyncio.to_thread(cache.commit_file, video_id, f"storyboard:{i}", partial, final_path)
+            sheet_entries.append({"url": f"/temp/{final_path.name}", "start": round(start, 3)})
+            start += fragment["duration"]
+
+        duration = info.get("duration") or start
+        frame_count = max(1, round(level["fps"] * duration))
+        storyboard = {
+            "videoId": video_id,
+            "duration": duration,
+            "interval": duration / frame_count,
+            "frameCount": frame_count,
+            "tileWidth": level["width"],
+            "tileHeight": level["height"],
+            "columns": level["columns"],
+            "rows": level["rows"],
+            "sheets": sheet_entries,
+        }
+        # Written after the sheets so a cached storyboard always has them
+        final_path = cache.root / f"{video_id}_storyboard.json"
+        partial = cache.partial_path(final_path)
+        partial.write_text(json.dumps(storyboard))
+        await asyncio.to_thread(cache.commit_file, video_id, "storyboard", partial, final_path)
+        self._counters["fetched"] += 1
+        return storyboard
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters, pending=len(self._pending))
+
+
+_storyboards = StoryboardCache()
+
+
+def get_storyboard_cache() -> StoryboardCache:
+    return _storyboards
@@ -0,0 +1,185 @@
+"""Trending keyword extraction from YouTube trending pages, refreshed in the background."""
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.locks import try_file_lock
+
+# Shared by every worker process on the host, so requests never scrape inline
+CACHE_DIR = Path(__file__).resolve().parent.parent / "cache"
+CACHE_FILE = CACHE_DIR / "trending_keywords.json"
+
+REFRESH_INTERVAL = int(os.getenv("TRENDING_REFRESH_INTERVAL", "3600"))
+RETRY_INTERVAL = 300
+
+# Scrape YouTube Trending (Gaming & Music) to get a mix
+TRENDING_URLS = [
+    "https://www.youtube.com/feed/trending?bp=4gIcGhpnYW1pbmdfY29ycHVzX21vc3RfcG9wdWxhcg%3D%3D",  # Gaming
+    "https://www.youtube.com/feed/trending?bp=4gIcGhptdXNpY19jb3JwdXNfbW9zdF9wb3B1bGFy",  # Music
+]
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+FALLBACK_KEYWORDS = ["Minecraft", "Fortnite", "Roblox", "GTA 6", "Taylor Swift", "MrBeast", "Elden Ring", "SpaceX", "AI", "ChatGPT"]
+
+STOP_WORDS = frozenset([
+    "the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by",
+    "is", "are", "was", "were", "be", "been", "this", "that", "it", "i", "you", "he", "she",
+    "we", "they", "my", "your", "his", "her", "our", "their", "what", "which", "who", "whom",
+    "whose", "how", "where", "when", "why", "video", "youtube", "channel", "subscribe", "like",
+    "comment", "share", "official", "music", "video", "lyric", "lyrics", "full", "hd", "hq",
+    "4k", "1080p", "2024", "2025", "new", "vs", "feat", "ft", "live", "stream", "trailer",
+    "episode", "season", "part", "gameplay", "walkthrough", "review", "reaction", "highlights",
+    "moment", "moments", "best", "top", "funny", "compilation", "clip", "clips", "shorts"
+])
+
+RENDERER_KEYS = ("videoRenderer", "gridVideoRenderer")
+INITIAL_DATA_RE = re.compile(r'var ytInitialData = ({.*?});')
+NON_WORD_RE = re.compile(r'[^\w\s]')
+
+
+def extract_titles(data: Any) -> List[str]:
+    """Collect video titles from ytInitialData with an explicit stack instead of recursion."""
+    titles = []
+    stack = [data]
+    pop = stack.pop
+    push = stack.extend
+    while stack:
+        obj = pop()
+        if isinstance(obj, dict):
+            for renderer_key in RENDERER_KEYS:
+                video = obj.get(renderer_key)
+                if video is not None:
+                    title = video.get("title")
+                    if title:
+                        if "runs" in title:
+                            titles.append(title["runs"][0]["text"])
+                        elif "simpleText" in title:
+                            titles.append(title["simpleText"])
+            # Only containers can hold renderers, skip pushing scalars.
+            # Children are pushed reversed so they pop in document order.
+            push([v for v in reversed(obj.values()) if isinstance(v, (dict, list))])
+        else:
+            push([v for v in reversed(obj) if isinstance(v, (dict, list))])
+    return titles
+
+
+def count_phrases(titles: Iterable[str]) -> Counter:
+    """Count 3- and 4-word phrases that neither start nor end with a stop word."""
+    counts = Counter()
+    for title in titles:
+        words = NON_WORD_RE.sub(' ', title.lower()).split()
+        n = len(words)
+        if n < 3:
+            continue
+        is_stop = [w in STOP_WORDS for w in words]
+        counts.update(
+            f"{words[i]} {words[i + 1]} {words[i + 2]}"
+            for i in range(n - 2)
+            if not (is_stop[i] or is_stop[i + 2])
+        )
+        counts.update(
+            f"{words[i]} {words[i + 1]} {words[i + 2]} {words[i + 3]}"
+            for i in range(n - 3)
+            if not (is_stop[i] or is_stop[i + 3])
+        )
+    return counts
+
+
+def compute_keywords(titles: List[str], limit: int = 20) -> List[str]:
+    return [phrase for phrase, _ in count_phrases(titles).most_common(limit)]
+
+
+def _fetch_page(url: str) -> str:
+    req = urllib.request.Request(url, headers=HEADERS)
+    with urllib.request.urlopen(req, timeout=10) as response:
+        return response.read().decode("utf-8")
+
+
+def _titles_from_html(html: str) -> List[str]:
+    match = INITIAL_DATA_RE.search(html)
+    if not match:
+        return []
+    return extract_titles(json.loads(match.group(1)))
+
+
+async def _scrape_category(url: str) -> List[str]:
+    try:
+        html = await asyncio.to_thread(_fetch_page, url)
+        return await asyncio.to_thread(_titles_from_html, html)
+    except Exception as e:
+        print(f"Error scraping {url}: {e}")
+        return []
+
+
+def read_cached_keywords() -> Optional[Dict[str, Any]]:
+    """Latest refresh result as {"timestamp", "keywords"}, or None if never refreshed."""
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_cache(keywords: List[str]) -> None:
+    CACHE_DIR.mkdir(exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump({"timestamp": time.time(), "keywords": keywords}, f)
+    os.replace(tmp_path, CACHE_FILE)
+
+
+async def refresh_trending_keywords() -> Optional[List[str]]:
+    """Scrape all trending categories concurrently and store the keywords."""
+    results = await asyncio.gather(*(_scrape_category(url) for url in TRENDING_URLS))
+    all_titles = [title for titles in results for title in titles]
+    if not all_titles:
+        return None
+    keywords = await asyncio.to_thread(compute_keywords, all_titles)
+    _write_cache(keywords)
+    return keywords
+
+
+def _cache_age() -> float:
+    cached = read_cached_keywords()
+    if not cached or not cached.get("keywords"):
+        return float("inf")
+    return time.time() - cached["timestamp"]
+
+
+async def run_trending_refresher(interval: int = REFRESH_INTERVAL) -> None:
+    """
+    Keep the shared cache fresh. Every worker runs this loop, but the refresh is
+    guarded by a non-blocking file lock and a staleness check so only one
+    process scrapes per interval.
+    """
+    while True:
+        delay = interval
+        try:
+            age = _cache_age()
+            if age >= interval:
+                with try_file_lock("trending_keywords") as acquired:
+                    if not acquired:
+                        # Another worker is refreshing; check back after it should be done
+                        delay = RETRY_INTERVAL
+                    # Re-check under the lock in case another worker just finished
+                    elif _cache_age() >= interval:
+                        keywords = await refresh_trending_keywords()
+                        if keywords is None:
+                            delay = RETRY_INTERVAL
+            else:
+                delay = interval - age
+        except Exception as e:
+            print(f"Trending keywords refresh failed: {e}")
+            delay = RETRY_INTERVAL
+        await asyncio.sleep(delay)
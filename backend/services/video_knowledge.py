@@ -0,0 +1,168 @@
+"""Shared, user-independent cache of transcripts and AI analyses keyed by YouTube videoId."""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, delete, select
+
+from ai_agent import LLM_MODEL, PROMPT_VERSIONS, fetch_transcript, fetch_transcript_scrapecreators
+from database import engine
+from models import VideoKnowledge
+
+# Transcripts are not model output; the fetcher that produced one is part of its key instead
+TRANSCRIPT_KIND = "transcript"
+TRANSCRIPT_MODEL = "transcript"
+TRANSCRIPT_VERSION = 1
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "stores": 0})
+
+# Lookups are read-only; hit_count is added up here and written in batches
+HIT_FLUSH_EVERY = 50
+HIT_FLUSH_INTERVAL = 60.0
+_pending_hits: Dict[int, int] = defaultdict(int)
+_last_flush = time.monotonic()
+
+
+def _count(kind: str, field: str) -> None:
+    with _stats_lock:
+        _stats[kind][field] += 1
+
+
+def _key(kind: str) -> Dict[str, Any]:
+    if kind == TRANSCRIPT_KIND:
+        return {"model": TRANSCRIPT_MODEL, "prompt_version": TRANSCRIPT_VERSION}
+    return {"model": LLM_MODEL, "prompt_version": PROMPT_VERSIONS[kind]}
+
+
+def input_hash(*parts: Optional[str]) -> str:
+    """Fingerprint of the non-video inputs (title, thumbnail URL, transcript) that change the result."""
+    if not any(parts):
+        return ""
+    return hashlib.sha256("\x1f".join(p or "" for p in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def get_knowledge(session: Session, video_id: str, kind: str, inputs: str = "") -> Optional[str]:
+    key = _key(kind)
+    entry = session.exec(select(VideoKnowledge).where(
+        VideoKnowledge.video_id == video_id,
+        VideoKnowledge.kind == kind,
+        VideoKnowledge.model == key["model"],
+        VideoKnowledge.prompt_version == key["prompt_version"],
+        VideoKnowledge.input_hash == inputs
+    )).first()
+    if entry is None:
+        _count(kind, "misses")
+        return None
+
+    _count(kind, "hits")
+    _record_hit(entry.id)
+    return entry.content
+
+
+def _record_hit(entry_id: int) -> None:
+    global _last_flush
+    with _stats_lock:
+        _pending_hits[entry_id] += 1
+        due = (sum(_pending_hits.values()) >= HIT_FLUSH_EVERY
+               or time.monotonic() - _last_flush >= HIT_FLUSH_INTERVAL)
+    if due:
+        flush_hits()
+
+
+def flush_hits() -> None:
+    """Write buffered hit counts, in a session of their own so callers' sessions are not committed."""
+    global _last_flush
+    with _stats_lock:
+        pending = dict(_pending_hits)
+        _pending_hits.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    with Session(engine) as session:
+        for entry_id, hits in pending.items():
+            # Entries invalidated meanwhile simply match no row
+            session.exec(
+                update(VideoKnowledge)
+                .where(VideoKnowledge.id == entry_id)
+                .values(hit_count=VideoKnowledge.hit_count + hits)
+            )
+        session.commit()
+
+
+def store_knowledge(session: Session, video_id: str, kind: str, content: str, inputs: str = "") -> None:
+    """Insert a result; a concurrent insert of the same key by another request is not an error."""
+    if not content or content.startswith("Error"):
+        return
+    entry = VideoKnowledge(
+        video_id=video_id,
+        kind=kind,
+        input_hash=inputs,
+        content=content,
+        created_at=int(time.time() * 1000),
+        **_key(kind)
+    )
+    session.add(entry)
+    try:
+        session.commit()
+        _count(kind, "stores")
+    except IntegrityError:
+        session.rollback()
+
+
+def cached_knowledge(
+    session: Session,
+    video_id: str,
+    kind: str,
+    compute: Callable[[], str],
+    inputs: str = ""
+) -> str:
+    """Return the shared result for this video, computing and storing it on a miss."""
+    content = get_knowledge(session, video_id, kind, inputs)
+    if content is None:
+        content = compute()
+        store_knowledge(session, video_id, kind, content, inputs)
+    return content
+
+
+def get_transcript(session: Session, video_id: str, scrapecreators: bool = True) -> Optional[str]:
+    """Cached transcript, fetched via ScrapeCreators (default) or youtube_transcript_api on a miss."""
+    # The two fetchers format transcripts differently, so each has its own entry
+    source = "scrapecreators" if scrapecreators else "youtube_transcript_api"
+    transcript = get_knowledge(session, video_id, TRANSCRIPT_KIND, source)
+    if transcript is None:
+        transcript = fetch_transcript_scrapecreators(video_id) if scrapecreators else fetch_transcript(video_id)
+        if transcript:
+            store_knowledge(session, video_id, TRANSCRIPT_KIND, transcript, source)
+    return transcript
+
+
+def invalidate_knowledge(session: Session, video_id: str, kind: Optional[str] = None) -> int:
+    """Delete every cached entry for a video (or one kind of it), across models and prompt versions."""
+    statement = delete(VideoKnowledge).where(VideoKnowledge.video_id == video_id)
+    if kind:
+        statement = statement.where(VideoKnowledge.kind == kind)
+    result = session.exec(statement)
+    session.commit()
+    return result.rowcount
+
+
+def knowledge_stats() -> Dict[str, Any]:
+    """Hit/miss counters for this process since startup."""
+    with _stats_lock:
+        kinds = {kind: dict(counts) for kind, counts in _stats.items()}
+    hits = sum(c["hits"] for c in kinds.values())
+    lookups = hits + sum(c["misses"] for c in kinds.values())
+    for counts in kinds.values():
+        total = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = round(counts["hits"] / total, 3) if total else None
+    return {
+        "hits": hits,
+        "lookups": lookups,
+        "hit_rate": round(hits / lookups, 3) if lookups else None,
+        "kinds": kinds
+    }
@@ -0,0 +1,101 @@
+"""Concurrent YouTube Data API fetch pipeline for the viral tracker."""
+import asyncio
+import os
+from typing import Any, Dict, List, Tuple
+
+from services.youtube_quota import YouTubeQuota
+
+# Max YouTube API calls in flight per viral feed request
+FETCH_CONCURRENCY = int(os.getenv("YOUTUBE_FETCH_CONCURRENCY", "4"))
+
+BATCH_SIZE = 50
+
+
+async def fetch_viral_candidates(
+    quota: YouTubeQuota,
+    search_params: Dict[str, Any],
+    fetch_target: int,
+    concurrency: int = FETCH_CONCURRENCY,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Fetch search results, video statistics and channel statistics.
+    Search pages are chained by page token so they run in order, but each page's
+    videos.list batch starts as soon as the page arrives, and each videos batch
+    immediately fans out channels.list for channels not requested yet.
+    Returns (video items in search order, channel info by channel id).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(method: str, make_request) -> Dict[str, Any]:
+        async with semaphore:
+            return await asyncio.to_thread(quota.execute, method, make_request)
+
+    requested_channels = set()
+    channels: Dict[str, Dict[str, Any]] = {}
+    channel_tasks: List[asyncio.Task] = []
+
+    async def fetch_channels(channel_ids: List[str]) -> None:
+        response = await call("channels.list", lambda yt: yt.channels().list(
+            part="statistics,snippet",
+            id=",".join(channel_ids)
+        ))
+        for channel in response.get("items", []):
+            channels[channel["id"]] = {
+                "subscriberCount": int(channel["statistics"].get("subscriberCount", 1)),
+                "channelTitle": channel["snippet"]["title"],
+                "country": channel["snippet"].get("country", "")
+            }
+
+    async def fetch_videos(video_ids: List[str]) -> List[Dict[str, Any]]:
+        response = await call("videos.list", lambda yt: yt.videos().list(
+            part="statistics,snippet",
+            id=",".join(video_ids)
+        ))
+        items = response.get("items", [])
+
+        new_channels = []
+        for video in items:
+            channel_id = video["snippet"]["channelId"]
+            if channel_id not in requested_channels:
+                requested_channels.add(channel_id)
+                new_channels.append(channel_id)
+        for i in range(0, len(new_channels), BATCH_SIZE):
+            channel_tasks.append(asyncio.create_task(fetch_channels(new_channels[i:i + BATCH_SIZE])))
+        return items
+
+    video_tasks: List[asyncio.Task] = []
+    try:
+        fetched = 0
+        next_page_token = None
+        while fetched < fetch_target:
+            # Stop paginating rather than fail once we already have results
+            if fetched and not quota.has_budget("search.list"):
+                break
+
+            params = dict(search_params, maxResults=min(fetch_target - fetched, BATCH_SIZE))
+            if next_page_token:
+                params["pageToken"] = next_page_token
+
+            search_response = await call("search.list", lambda yt: yt.search().list(**params))
+            items = search_response.get("items", [])
+            if not items:
+                break
+
+            page_ids = [item["id"]["videoId"] for item in items]
+            fetched += len(page_ids)
+            video_tasks.append(asyncio.create_task(fetch_videos(page_ids)))
+
+            next_page_token = search_response.get("nextPageToken")
+            if not next_page_token:
+                break
+
+        video_batches = await asyncio.gather(*video_tasks)
+        # Channel tasks are appended while video batches complete, so gather after them
+        await asyncio.gather(*channel_tasks)
+    except BaseException:
+        for task in video_tasks + channel_tasks:
+            task.cancel()
+        raise
+
+    videos = [video for batch in video_batches for video in batch]
+    return videos, channels
@@ -0,0 +1,129 @@
+"""
+Batch runs: one workflow executed over many rows of inputs. Every row is a queued
+WorkflowExecution; credits for the whole batch are reserved when it is submitted and
+settled against what the rows actually used once the last row finished.
+"""
+import csv
+import io
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_, update
+from sqlmodel import Session, select
+
+from models import WorkflowBatch, WorkflowExecution
+from services.credit_service import CreditService
+from services.execution_events import batch_event, get_execution_events, row_event
+from services.workflow_engine import WorkflowPlan
+
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "500"))
+# Rows of one batch running at the same time; requests may ask for fewer
+BATCH_MAX_PARALLELISM = int(os.getenv("BATCH_MAX_PARALLELISM", "4"))
+
+
+def parse_csv_rows(text: str) -> List[Dict[str, Any]]:
+    """Rows of a CSV with a header line naming the workflow inputs; empty cells are left out."""
+    reader = csv.DictReader(io.StringIO(text.strip()))
+    if not reader.fieldnames:
+        raise ValueError("CSV has no header row")
+    return [
+        {column.strip(): value for column, value in row.items() if column and value not in (None, "")}
+        for row in reader
+    ]
+
+
+def check_rows(plan: WorkflowPlan, rows: List[Dict[str, Any]], target_node_ids: Optional[List[str]] = None) -> Optional[str]:
+    """Why the rows cannot be run against `plan`, or None."""
+    if not rows:
+        return "No rows to run"
+    if len(rows) > BATCH_MAX_ROWS:
+        return f"At most {BATCH_MAX_ROWS} rows per batch"
+    # A map runs its body once per list item, a count only known at run time, so the
+    # credits of a batch could not be reserved up front
+    mapped = sorted(set(plan.scopes) & set(plan.nodes_to_run(target_node_ids)))
+    if mapped:
+        return f"Workflows with For Each nodes cannot run as a batch ({', '.join(mapped)})"
+    input_names = {node.data.get('name', node.id) for node in plan.nodes if node.type == 'input'}
+    for index, row in enumerate(rows):
+        unknown = sorted(set(row) - input_names)
+        if unknown:
+            return (f"Row {index}: unknown input {', '.join(unknown)}; "
+                    f"workflow inputs are {', '.join(sorted(input_names)) or 'none'}")
+    return None
+
+
+def is_open(batch: Optional[WorkflowBatch]) -> bool:
+    """Rows of an open batch are paid from its reservation rather than charged one by one."""
+    return batch is not None and batch.completed_at is None
+
+
+def settle_batch(session: Session, batch_id: uuid.UUID) -> bool:
+    """
+    Close the batch if none of its rows is pending or running: record the totals,
+    return unused reserved credits (or take the shortfall) and publish the summary.
+    False if rows are still outstanding or the batch was settled already. A row
+    cancelled while running is outstanding until its worker has stopped (completed_at
+    set), since nodes may still complete until then.
+    """
+    outstanding = session.exec(
+        select(func.count(WorkflowExecution.id))
+        .where(WorkflowExecution.batch_id == batch_id)
+        .where(or_(
+            WorkflowExecution.status.in_(["pending", "running"]),
+            (WorkflowExecution.status == "cancelled") & WorkflowExecution.completed_at.is_(None)
+        ))
+    ).one()
+    if outstanding:
+        return False
+
+    batch = session.get(WorkflowBatch, batch_id)
+    rows = session.exec(select(WorkflowExecution).where(WorkflowExecution.batch_id == batch_id)).all()
+    completed = [row for row in rows if row.status == "completed"]
+    now = int(time.time() * 1000)
+    # Failed and cancelled rows pay for the nodes they completed, like single runs
+    credits_used = sum(row.credits_used or 0 for row in rows)
+
+    # Conditional, so a row finishing on another worker at the same moment cannot settle twice
+    settled = session.exec(
+        update(WorkflowBatch)
+        .where(WorkflowBatch.id == batch_id)
+        .where(WorkflowBatch.completed_at.is_(None))
+        .values(
+            status="cancelled" if batch.status == "cancelled" else "completed",
+            completed_rows=len(completed),
+            failed_rows=len(rows) - len(completed),
+            credits_used=credits_used,
+            execution_time_ms=now - batch.created_at,
+            row_time_ms=sum(row.execution_time_ms or 0 for row in rows),
+            completed_at=now
+        )
+    ).rowcount
+    session.commit()
+    if not settled:
+        return False
+    session.refresh(batch)
+
+    unused = batch.credits_reserved - credits_used
+    if unused > 0:
+        CreditService.add_credits(
+            session, batch.user_id, unused, "refund",
+            f"Unused credits of batch {batch.id} ({batch.completed_rows}/{batch.row_count} rows completed)"
+        )
+    elif unused < 0:
+        # Prices changed while the batch ran; never leave the user owing more than they have
+        shortfall = min(-unused, CreditService.get_balance(session, batch.user_id))
+        if shortfall > 0:
+            CreditService.deduct_credits(session, batch.user_id, shortfall, f"Batch {batch.id} beyond its reservation")
+
+    get_execution_events().publish(str(batch.id), batch_event(batch))
+    print(f"Batch {batch.id} settled: {batch.completed_rows}/{batch.row_count} rows, "
+          f"{credits_used}/{batch.credits_reserved} reserved credits used, {batch.execution_time_ms} ms")
+    return True
+
+
+def finish_row(session: Session, execution: WorkflowExecution) -> None:
+    """Publish a finished row to the batch's subscribers and settle the batch if it was the last."""
+    get_execution_events().publish(str(execution.batch_id), row_event(execution))
+    settle_batch(session, execution.batch_id)
@@ -1,16 +1,36 @@
 """Workflow execution engine."""
+import hashlib
 import json
+import os
+import threading
 import time
 import asyncio
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
-import networkx as nx
-from sqlmodel import Session
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, FrozenSet, List, Optional, Set
+from dataclasses import dataclass, field
+from sqlmodel import Session, delete, select
+from models import NodeExecution
+from services.execution_events import get_execution_events, node_event
 from services.replicate_service import ReplicateService
 from services.credit_service import CreditService
+from services.node_results import get_node_result_cache, is_cacheable, is_miss, result_key
 import uuid
 
 
+# Upper bound on nodes of one execution running at the same time
+WORKFLOW_MAX_IN_FLIGHT = int(os.getenv("WORKFLOW_MAX_IN_FLIGHT", "8"))
+# Compiled plans kept in memory, keyed by a hash of workflow_data
+PLAN_CACHE_SIZE = 256
+# Elements of one map node running at the same time, and the longest list it accepts
+MAP_MAX_PARALLELISM = int(os.getenv("MAP_MAX_PARALLELISM", "4"))
+MAP_MAX_ITEMS = 64
+
+GENERATIVE_NODE_TYPES = ['replicate', 'llm_model', 'inpaint', 'remove_bg']
+# Canvas state the editor saves into node data; not part of what a node computes
+VOLATILE_NODE_KEYS = ('output', 'loading', 'error')
+
+
 @dataclass
 class WorkflowNode:
     """Represents a node in the workflow."""
@@ -29,15 +49,313 @@ class WorkflowEdge:
     target_handle: str
 
 
+@dataclass
+class MapScope:
+    """The part of a workflow that a map node runs once per element of its input list."""
+    map_id: str
+    collect_id: str  # gathers the per-element results back into a list
+    body: List[str]  # nodes between the two, topological order (nested maps' bodies included)
+
+
+@dataclass
+class WorkflowPlan:
+    """
+    A parsed, validated workflow with the indexes execution needs. Plans are shared
+    between executions of the same workflow_data and must not be mutated.
+    """
+    nodes: List[WorkflowNode]
+    edges: List[WorkflowEdge]
+    nodes_by_id: Dict[str, WorkflowNode]
+    incoming: Dict[str, List[WorkflowEdge]]  # node id -> edges into it
+    dependencies: Dict[str, List[str]]  # node id -> nodes it waits for (edges and $references)
+    dependents: Dict[str, List[str]]
+    order: List[str]  # topological order, workflow order among independent nodes
+    error: Optional[str] = None  # validation failure, if any
+    scopes: Dict[str, MapScope] = field(default_factory=dict)  # map node id -> its scope
+    scope_of: Dict[str, str] = field(default_factory=dict)  # node id -> innermost map running it (top level: absent)
+    # Dependencies as scheduled: a map waits for everything its body needs, and the body
+    # is not scheduled on its own. Equal to dependencies/dependents without map nodes.
+    waits_for: Dict[str, List[str]] = field(default_factory=dict)
+    unblocks: Dict[str, List[str]] = field(default_factory=dict)
+    _run_sets: Dict[FrozenSet[str], List[str]] = field(default_factory=dict, repr=False)
+    _fingerprints: Dict[str, str] = field(default_factory=dict, repr=False)
+
+    def nodes_to_run(self, target_node_ids: Optional[List[str]] = None) -> List[str]:
+        """Targets and everything they depend on, in topological order (all nodes without targets)."""
+        if not target_node_ids:
+            return self.order
+        key = frozenset(target_node_ids)
+        if key not in self._run_sets:
+            keep: Set[str] = set()
+            stack = [node_id for node_id in key if node_id in self.nodes_by_id]
+            while stack:
+                node_id = stack.pop()
+                if node_id not in keep:
+                    keep.add(node_id)
+                    stack.extend(self.dependencies[node_id])
+            self._run_sets[key] = [node_id for node_id in self.order if node_id in keep]
+        return self._run_sets[key]
+
+    def fingerprint(self, node_id: str) -> str:
+        """node_fingerprint(), for a map node over its body too: editing the body changes its results."""
+        if node_id not in self._fingerprints:
+            fingerprint = node_fingerprint(self.nodes_by_id[node_id])
+            if node_id in self.scopes:
+                body = [fingerprint] + [node_fingerprint(self.nodes_by_id[inner]) for inner in self.scopes[node_id].body]
+                fingerprint = hashlib.sha256("".join(body).encode()).hexdigest()[:32]
+            self._fingerprints[node_id] = fingerprint
+        return self._fingerprints[node_id]
+
+    def reusable(self, node_ids_to_run: List[str], finished: Dict[str, str]) -> Set[str]:
+        """
+        Nodes whose earlier result (node id -> fingerprint it was computed with) still holds:
+        the node is unchanged and so is everything it depends on.
+        """
+        reuse: Set[str] = set()
+        for node_id in node_ids_to_run:
+            if (finished.get(node_id) == self.fingerprint(node_id)
+                    and all(dependency in reuse for dependency in self.waits_for[node_id])):
+                reuse.add(node_id)
+        return reuse
+
+
+# Set inside map nodes: "[2]" while running the body for element 2, "[2][0]" when nested
+_map_item: ContextVar[str] = ContextVar("map_item", default="")
+
+
+def instance_id(node_id: str) -> str:
+    """Id of this run of a node; nodes inside a map run once per element."""
+    return node_id + _map_item.get()
+
+
+def node_fingerprint(node: WorkflowNode) -> str:
+    """Changes whenever the node's type or configuration does."""
+    data = {key: value for key, value in node.data.items() if key not in VOLATILE_NODE_KEYS}
+    canonical = json.dumps({"type": node.type, "data": data}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def _toposort(vertices: List[str], successors: Dict[str, List[str]]) -> Optional[List[str]]:
+    """Kahn's algorithm; None if there is a cycle."""
+    in_degree = {vertex: 0 for vertex in vertices}
+    for vertex in vertices:
+        for successor in successors.get(vertex, []):
+            in_degree[successor] += 1
+    queue = deque(vertex for vertex in vertices if in_degree[vertex] == 0)
+    order = []
+    while queue:
+        vertex = queue.popleft()
+        order.append(vertex)
+        for successor in successors.get(vertex, []):
+            in_degree[successor] -= 1
+            if in_degree[successor] == 0:
+                queue.append(successor)
+    return order if len(order) == len(vertices) else None
+
+
+def compile_plan(nodes: List[WorkflowNode], edges: List[WorkflowEdge]) -> WorkflowPlan:
+    nodes_by_id = {node.id: node for node in nodes}
+    incoming: Dict[str, List[WorkflowEdge]] = {node.id: [] for node in nodes}
+    for edge in edges:
+        if edge.target in incoming:
+            incoming[edge.target].append(edge)
+
+    links = [(edge.source, edge.target) for edge in edges]
+    # "$<node_id>" parameter references read the context like edges do
+    for node in nodes:
+        for value in node.data.get('parameters', {}).values():
+            if isinstance(value, str) and value.startswith('$'):
+                links.append((value[1:], node.id))
+
+    # Edges may name nodes that do not exist; they count for validation only
+    vertices = list(dict.fromkeys([node.id for node in nodes] + [v for link in links for v in link]))
+    successors: Dict[str, List[str]] = {vertex: [] for vertex in vertices}
+    dependencies: Dict[str, List[str]] = {node.id: [] for node in nodes}
+    dependents: Dict[str, List[str]] = {node.id: [] for node in nodes}
+    for source, target in dict.fromkeys(links):
+        successors[source].append(target)
+        if source in nodes_by_id and target in nodes_by_id:
+            dependencies[target].append(source)
+            dependents[source].append(target)
+
+    order = _toposort(vertices, successors)
+    plan = WorkflowPlan(
+        nodes=nodes,
+        edges=edges,
+        nodes_by_id=nodes_by_id,
+        incoming=incoming,
+        dependencies=dependencies,
+        dependents=dependents,
+        order=[vertex for vertex in order if vertex in nodes_by_id] if order else [],
+        waits_for=dependencies,
+        unblocks=dependents,
+    )
+    plan.error = _validate(plan, order is not None) or _scope_maps(plan)
+    return plan
+
+
+def _scope_maps(plan: WorkflowPlan) -> Optional[str]:
+    """
+    Pair every map node with the collect node closing it, like brackets (the innermost
+    open map), and fill in the plan's scopes and scheduling graph.
+    """
+    map_ids = [node_id for node_id in plan.order if plan.nodes_by_id[node_id].type == 'map']
+    collect_ids = [node_id for node_id in plan.order if plan.nodes_by_id[node_id].type == 'collect']
+    if not map_ids and not collect_ids:
+        return None
+
+    ancestors: Dict[str, Set[str]] = {}
+    for node_id in plan.order:
+        ancestors[node_id] = set(plan.dependencies[node_id])
+        for dependency in plan.dependencies[node_id]:
+            ancestors[node_id] |= ancestors[dependency]
+
+    collect_of: Dict[str, str] = {}
+    for collect_id in collect_ids:
+        if len(plan.incoming[collect_id]) != 1:
+            return f"Collect node {collect_id} needs exactly one input"
+        closed = {map_id for map_id, closing in collect_of.items() if closing in ancestors[collect_id]}
+        open_maps = [map_id for map_id in map_ids if map_id in ancestors[collect_id] and map_id not in closed]
+        if not open_maps:
+            return f"Collect node {collect_id} does not follow a map node"
+        if any(map_id not in ancestors[open_maps[-1]] for map_id in open_maps[:-1]):
+            return f"Collect node {collect_id} follows several unrelated map nodes"
+        collect_of[open_maps[-1]] = collect_id
+
+    for map_id in map_ids:
+        collect_id = collect_of.get(map_id)
+        if collect_id is None:
+            return f"Map node {map_id} has no collect node"
+        body = [node_id for node_id in plan.order if map_id in ancestors[node_id] and node_id in ancestors[collect_id]]
+        inside = set(body)
+        for node_id in plan.order:
+            if (map_id in ancestors[node_id] and node_id != collect_id
+                    and node_id not in inside and collect_id not in ancestors[node_id]):
+                return f"Node {node_id} follows map node {map_id} but does not lead to its collect node"
+        for node_id in body:
+            for dependent in plan.dependents[node_id]:
+                if dependent not in inside and dependent != collect_id:
+                    return (f"Node {dependent} reads {node_id}, which only exists inside map node {map_id}; "
+                            f"connect it through collect node {collect_id}")
+        plan.scopes[map_id] = MapScope(map_id=map_id, collect_id=collect_id, body=body)
+        # Outer maps come first in topological order, so inner ones overwrite: innermost wins
+        for node_id in body:
+            plan.scope_of[node_id] = map_id
+    for scope in plan.scopes.values():
+        # A collect node runs next to its map, once
+        if scope.map_id in plan.scope_of:
+            plan.scope_of[scope.collect_id] = plan.scope_of[scope.map_id]
+        else:
+            plan.scope_of.pop(scope.collect_id, None)
+
+    def unit(node_id: str, level: Optional[str]) -> Optional[str]:
+        # What `node_id` belongs to among the nodes scheduled at `level`; None if outside it
+        while plan.scope_of.get(node_id) != level:
+            node_id = plan.scope_of.get(node_id)
+            if node_id is None:
+                return None
+        return node_id
+
+    waits_for: Dict[str, List[str]] = {}
+    unblocks: Dict[str, List[str]] = {node_id: [] for node_id in plan.order}
+    for node_id in plan.order:
+        level = plan.scope_of.get(node_id)
+        sources = list(plan.dependencies[node_id])
+        if node_id in plan.scopes:
+            for inner in plan.scopes[node_id].body:
+                sources.extend(plan.dependencies[inner])
+        waits_for[node_id] = []
+        for source in sources:
+            waited = unit(source, level)
+            if waited is not None and waited != node_id and waited not in waits_for[node_id]:
+                waits_for[node_id].append(waited)
+                unblocks[waited].append(node_id)
+    plan.waits_for = waits_for
+    plan.unblocks = unblocks
+    return None
+
+
+def _validate(plan: WorkflowPlan, acyclic: bool) -> Optional[str]:
+    if not acyclic:
+        return "Workflow contains cycles"
+
+    # Check for orphaned nodes (except input and output)
+    connected = {edge.source for edge in plan.edges} | {edge.target for edge in plan.edges}
+    for node in plan.nodes:
+        if node.type not in ['input', 'output'] and node.id not in connected:
+            return f"Node {node.id} is not connected"
+
+    # Check that there's at least one output or generative node
+    has_output = any(node.type == 'output' for node in plan.nodes)
+    has_gen_node = any(node.type in GENERATIVE_NODE_TYPES for node in plan.nodes)
+    if not has_output and not has_gen_node:
+        return "Workflow must have at least one output node or AI model node"
+
+    return None
+
+
+class _PlanCache:
+    def __init__(self, max_size: int = PLAN_CACHE_SIZE):
+        self.max_size = max_size
+        self._plans: "OrderedDict[str, WorkflowPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def get(self, workflow_data: str) -> WorkflowPlan:
+        key = hashlib.sha256(workflow_data.encode()).hexdigest()
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self._counters["hits"] += 1
+                return plan
+            self._counters["misses"] += 1
+
+        plan = compile_plan(*WorkflowEngine.parse_workflow(workflow_data))
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, plans=len(self._plans))
+
+
+_plan_cache = _PlanCache()
+
+
+def get_workflow_plan(workflow_data: str) -> WorkflowPlan:
+    """Compiled plan for workflow_data, compiled at most once per distinct JSON."""
+    return _plan_cache.get(workflow_data)
+
+
+def plan_cache_stats() -> Dict[str, int]:
+    return _plan_cache.stats()
+
+
 class WorkflowEngine:
     """Engine for executing AI workflows."""
     
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, max_in_flight: int = WORKFLOW_MAX_IN_FLIGHT):
         self.session = session
         self.replicate_service = ReplicateService()
         self.credit_service = CreditService()
+        self.max_in_flight = max_in_flight
+        # Set by execute(): who runs it (predictions are limited per user), whose memoized
+        # node results may be reused (None disables reuse), nodes that must run regardless,
+        # and nodes that were served from the cache
+        self.user_id: Optional[uuid.UUID] = None
+        self.check_credits = True
+        self.result_cache_user: Optional[uuid.UUID] = None
+        self.fresh_node_ids: Set[str] = set()
+        self.cached_node_ids: Set[str] = set()  # instance ids
+        # run_nodes() callbacks of the current execution, for map bodies
+        self.node_callbacks: Dict[str, Callable] = {}
     
-    def parse_workflow(self, workflow_data: str) -> tuple[List[WorkflowNode], List[WorkflowEdge]]:
+    @staticmethod
+    def parse_workflow(workflow_data: str) -> tuple[List[WorkflowNode], List[WorkflowEdge]]:
         """Parse workflow JSON into nodes and edges."""
         data = json.loads(workflow_data)
         
@@ -63,69 +381,6 @@ class WorkflowEngine:
         
         return nodes, edges
     
-    def validate_workflow(self, nodes: List[WorkflowNode], edges: List[WorkflowEdge]) -> tuple[bool, Optional[str]]:
-        """Validate workflow structure."""
-        # Build graph
-        G = nx.DiGraph()
-        
-        for node in nodes:
-            G.add_node(node.id)
-        
-        for edge in edges:
-            G.add_edge(edge.source, edge.target)
-        
-        # Check for cycles
-        if not nx.is_directed_acyclic_graph(G):
-            return False, "Workflow contains cycles"
-        
-        # Check for orphaned nodes (except input and output)
-        for node in nodes:
-            if node.type not in ['input', 'output']:
-                if G.in_degree(node.id) == 0 and G.out_degree(node.id) == 0:
-                    return False, f"Node {node.id} is not connected"
-        
-        # Check that there's at least one output or generative node
-        has_output = any(node.type == 'output' for node in nodes)
-        has_gen_node = any(node.type in ['replicate', 'llm_model', 'inpaint', 'remove_bg'] for node in nodes)
-        
-        if not has_output and not has_gen_node:
-            return False, "Workflow must have at least one output node or AI model node"
-        
-        return True, None
-    
-    def get_execution_generations(self, nodes: List[WorkflowNode], edges: List[WorkflowEdge], target_node_ids: Optional[List[str]] = None) -> List[List[str]]:
-        """Get topologically sorted generations of nodes for parallel execution."""
-        G = nx.DiGraph()
-        
-        for node in nodes:
-            G.add_node(node.id)
-        
-        for edge in edges:
-            G.add_edge(edge.source, edge.target)
-        
-        # Topological generations
-        try:
-            generations = list(nx.topological_generations(G))
-        except nx.NetworkXError:
-            raise ValueError("Cannot determine execution order - workflow may contain cycles")
-            
-        if not target_node_ids:
-            return generations
-            
-        # Filter layers for target nodes and their dependencies
-        nodes_to_keep = set(target_node_ids)
-        for node_id in target_node_ids:
-            if node_id in G:
-                nodes_to_keep.update(nx.ancestors(G, node_id))
-        
-        filtered_generations = []
-        for gen in generations:
-            filtered_gen = [n for n in gen if n in nodes_to_keep]
-            if filtered_gen:
-                filtered_generations.append(filtered_gen)
-                
-        return filtered_generations
-
     def calculate_total_cost(self, nodes: List[WorkflowNode], nodes_to_run: Optional[List[str]] = None) -> int:
         """Estimate total credit cost for workflow."""
         total_cost = 0
@@ -147,22 +402,26 @@ class WorkflowEngine:
         self,
         node: WorkflowNode,
         context: Dict[str, Any],
-        edges: List[WorkflowEdge]
+        plan: WorkflowPlan
     ) -> Any:
         """Execute a single node asynchronously."""
         # Get inputs from context based on edges
         node_inputs = {}
-        for edge in edges:
-            if edge.target == node.id:
-                # IMPORTANT: Since context is shared and updated concurrently by other generations,
-                # we must ensure we only access keys that are already present (from previous generations).
-                # Current generation nodes don't depend on each other, so this is safe.
-                source_output = context.get(edge.source)
-                if source_output is not None:
-                    node_inputs[edge.target_handle] = source_output
+        for edge in plan.incoming[node.id]:
+            # A node is only started once all of its sources have finished,
+            # so their results are already in the shared context.
+            source_output = context.get(edge.source)
+            if source_output is not None:
+                node_inputs[edge.target_handle] = source_output
         
         # Execute based on node type
-        if node.type in ['input', 'media_input']:
+        if node.type == 'input':
+            # Values passed to execute() take precedence over the one saved on the canvas
+            if node.id in context:
+                return context[node.id]
+            return node.data.get('value', node.data.get('default_value'))
+        
+        elif node.type == 'media_input':
             return node.data.get('value')
         
         elif node.type == 'utility':
@@ -206,25 +465,35 @@ class WorkflowEngine:
                 elif img_input is None:
                      model_inputs['image_input'] = []
             
-            # Run blocking prediction in thread pool to avoid blocking the loop
-            loop = asyncio.get_running_loop()
-            result = await loop.run_in_executor(
-                None, 
-                lambda: self.replicate_service.run_prediction(model_id, model_inputs)
+            # Same model with the same resolved inputs as an earlier run: reuse its output
+            cache_key = None
+            if (self.result_cache_user and node.id not in self.fresh_node_ids
+                    and is_cacheable(node.type, node.data)):
+                cache_key = result_key(self.result_cache_user, node.type, model_id, model_inputs)
+                cached = get_node_result_cache().get(cache_key)
+                if not is_miss(cached):
+                    self.cached_node_ids.add(instance_id(node.id))
+                    return cached
+            
+            # Awaited via webhook/polling, so a running prediction holds no thread
+            result = await self.replicate_service.predict(
+                model_id, model_inputs, owner=str(self.user_id) if self.user_id else None
             )
             
             if result['status'] == 'failed':
                 raise ValueError(f"Replicate prediction failed: {result.get('error')}")
             
-            output_data = result['output']
-            if isinstance(output_data, list):
-                if len(output_data) == 1:
-                    return output_data[0]
-                if all(isinstance(x, str) for x in output_data):
-                    if any(x.strip().startswith('http') for x in output_data):
-                         return output_data
-                    return "".join(output_data)
-            return output_data
+            output = self.unwrap_output(result['output'])
+            if cache_key:
+                get_node_result_cache().put(cache_key, output)
+            return output
+
+        elif node.type == 'map':
+            return await self.run_map(node, node_inputs.get('input'), context, plan)
+        
+        elif node.type == 'collect':
+            # The map it closes already gathered the results
+            return context.get(next(scope.map_id for scope in plan.scopes.values() if scope.collect_id == node.id))
 
         elif node.type == 'mask_editor':
             return node.data.get('mask_output')
@@ -244,40 +513,209 @@ class WorkflowEngine:
         else:
             raise ValueError(f"Unknown node type: {node.type}")
     
+    async def run_map(
+        self,
+        node: WorkflowNode,
+        items: Any,
+        context: Dict[str, Any],
+        plan: WorkflowPlan
+    ) -> List[Any]:
+        """
+        Run the map's body once per element of `items`, up to the node's `parallelism`
+        (capped at MAP_MAX_PARALLELISM) at a time, and return what reached the collect
+        node for each element, in element order. Within the body the map node's output
+        is the element. The first failing element cancels the others.
+        """
+        scope = plan.scopes[node.id]
+        if items is None:
+            items = []
+        elif not isinstance(items, list):
+            items = [items]
+        if len(items) > MAP_MAX_ITEMS:
+            raise ValueError(f"Node {node.id}: at most {MAP_MAX_ITEMS} items can be mapped, got {len(items)}")
+
+        # The up-front estimate counted the body once
+        body_cost = self.calculate_total_cost(plan.nodes, scope.body)
+        if self.check_credits and body_cost and self.user_id:
+            if not self.credit_service.has_sufficient_credits(self.session, self.user_id, body_cost * len(items)):
+                balance = self.credit_service.get_balance(self.session, self.user_id)
+                raise ValueError(
+                    f"Insufficient credits to map over {len(items)} items. "
+                    f"Required: {body_cost * len(items)}, Available: {balance}"
+                )
+
+        body = [node_id for node_id in scope.body if plan.scope_of.get(node_id) == node.id]
+        gathered_from = plan.incoming[scope.collect_id][0].source
+        parallelism = max(1, min(int(node.data.get('parallelism') or MAP_MAX_PARALLELISM), MAP_MAX_PARALLELISM))
+        limit = asyncio.Semaphore(parallelism)
+        prefix = _map_item.get()
+
+        async def run_item(index: int, item: Any) -> Any:
+            async with limit:
+                # Each element runs in its own task, so this only names the nodes of this element
+                _map_item.set(f"{prefix}[{index}]")
+                item_context = dict(context)
+                item_context[node.id] = item
+                await self.run_nodes(plan, body, item_context, **self.node_callbacks)
+                return item_context.get(gathered_from)
+
+        tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(items)]
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def load_finished_outputs(
+        self,
+        execution_id: uuid.UUID,
+        plan: WorkflowPlan,
+        node_ids_to_run: List[str]
+    ) -> Dict[str, Any]:
+        """Stored outputs of this execution's completed nodes that are still valid for `plan`."""
+        records = self.session.exec(
+            select(NodeExecution)
+            .where(NodeExecution.execution_id == execution_id)
+            .where(NodeExecution.status == "completed")
+        ).all()
+        records = {record.node_id: record for record in records if record.node_id in plan.nodes_by_id}
+        reuse = plan.reusable(node_ids_to_run, {node_id: record.fingerprint for node_id, record in records.items()})
+        return {node_id: json.loads(records[node_id].output) if records[node_id].output else None for node_id in reuse}
+
+    def record_node(self, record: NodeExecution) -> None:
+        """Persist a node's state and push it to subscribers of its execution."""
+        self.session.add(record)
+        self.session.commit()
+        self.session.refresh(record)
+        get_execution_events().publish(str(record.execution_id), node_event(record))
+
+    @staticmethod
+    def unwrap_output(output_data: Any) -> Any:
+        """Single outputs as a value, text streams joined, URL lists kept as lists."""
+        if isinstance(output_data, list):
+            if len(output_data) == 1:
+                return output_data[0]
+            if all(isinstance(x, str) for x in output_data):
+                if any(x.strip().startswith('http') for x in output_data):
+                     return output_data
+                return "".join(output_data)
+        return output_data
+
+    async def run_nodes(
+        self,
+        plan: WorkflowPlan,
+        node_ids_to_run: List[str],
+        context: Dict[str, Any],
+        on_result: Optional[Callable[[WorkflowNode, Any], None]] = None,
+        on_start: Optional[Callable[[WorkflowNode], None]] = None,
+        on_error: Optional[Callable[[WorkflowNode, BaseException], None]] = None
+    ) -> None:
+        """
+        Run nodes as soon as all of their own inputs are resolved, with at most
+        `max_in_flight` running at once, so wall time follows the critical path
+        instead of the slowest node of each topological layer.
+        Results are written to `context`. Every node that finishes is reported to
+        `on_result` or `on_error`, also when another one failed alongside it; the first
+        failure cancels running nodes, which are reported to `on_error` with a CancelledError.
+        """
+        to_run = set(node_ids_to_run)
+        waiting_on = {
+            node_id: sum(1 for dependency in plan.waits_for[node_id] if dependency in to_run)
+            for node_id in node_ids_to_run
+        }
+
+        # Topological order among nodes that become ready together
+        ready = deque(node_id for node_id in node_ids_to_run if waiting_on[node_id] == 0)
+        running: Dict[asyncio.Task, str] = {}
+        try:
+            while ready or running:
+                while ready and len(running) < self.max_in_flight:
+                    node_id = ready.popleft()
+                    if on_start:
+                        on_start(plan.nodes_by_id[node_id])
+                    task = asyncio.create_task(self.execute_node(plan.nodes_by_id[node_id], context, plan))
+                    running[task] = node_id
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                # Every finished node is recorded, successes included, before the first failure is raised
+                failure: Optional[BaseException] = None
+                for task in done:
+                    node_id = running.pop(task)
+                    try:
+                        result = task.result()
+                    except BaseException as e:
+                        if on_error:
+                            on_error(plan.nodes_by_id[node_id], e)
+                        failure = failure or e
+                        continue
+                    context[node_id] = result
+                    if on_result:
+                        on_result(plan.nodes_by_id[node_id], result)
+                    for dependent in plan.unblocks[node_id]:
+                        if dependent in waiting_on:
+                            waiting_on[dependent] -= 1
+                            if waiting_on[dependent] == 0:
+                                ready.append(dependent)
+                if failure is not None:
+                    raise failure
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+                # A node may have finished before the cancellation reached it; keep what it produced
+                for task, node_id in running.items():
+                    if not task.cancelled() and task.exception() is None:
+                        context[node_id] = task.result()
+                        if on_result:
+                            on_result(plan.nodes_by_id[node_id], task.result())
+                    elif on_error:
+                        on_error(plan.nodes_by_id[node_id], asyncio.CancelledError() if task.cancelled() else task.exception())
+
     async def execute(
         self,
         workflow_data: str,
         input_data: Dict[str, Any],
         user_id: uuid.UUID,
-        target_node_ids: Optional[List[str]] = None
+        target_node_ids: Optional[List[str]] = None,
+        use_cache: bool = True,
+        execution_id: Optional[uuid.UUID] = None,
+        check_credits: bool = True,
+        outstanding_credits: int = 0
     ) -> Dict[str, Any]:
-        """Execute the workflow asynchronously, optionally only specific nodes."""
+        """
+        Execute the workflow asynchronously, optionally only specific nodes.
+        With `use_cache`, generative nodes other than the targets reuse the user's
+        earlier output for identical inputs instead of running (and charging) again.
+        With `execution_id`, every node's progress is stored as a NodeExecution and
+        published to the execution's event subscribers. Without `check_credits` the
+        balance is not checked, for runs whose credits were reserved up front.
+        `outstanding_credits` (owed for nodes of earlier attempts) must be covered as well.
+        """
         start_time = time.time()
         
-        # Parse workflow
-        nodes, edges = self.parse_workflow(workflow_data)
-        
-        # Validate
-        is_valid, error = self.validate_workflow(nodes, edges)
-        if not is_valid:
+        # Parsed, validated and indexed once per distinct workflow_data
+        plan = get_workflow_plan(workflow_data)
+        nodes = plan.nodes
+        if plan.error:
             return {
                 "status": "failed",
-                "error": error
+                "error": plan.error
             }
         
-        # Get execution generations (layers of safe-to-parallelize nodes)
-        try:
-            generations = self.get_execution_generations(nodes, edges, target_node_ids)
-        except ValueError as e:
-            return {
-                "status": "failed",
-                "error": str(e)
-            }
-            
-        # Check credits (flatten generations to get all nodes to run)
-        all_nodes_to_run = [n_id for gen in generations for n_id in gen]
-        estimated_cost = self.calculate_total_cost(nodes, all_nodes_to_run)
-        if not self.credit_service.has_sufficient_credits(self.session, user_id, estimated_cost):
+        # Targets and their dependencies (every node without targets)
+        all_nodes_to_run = plan.nodes_to_run(target_node_ids)
+        
+        # A resumed or retried execution keeps what its earlier attempts completed
+        finished_outputs = self.load_finished_outputs(execution_id, plan, all_nodes_to_run) if execution_id else {}
+        nodes_to_execute = [node_id for node_id in all_nodes_to_run if node_id not in finished_outputs]
+        # Map bodies are run by their map node
+        top_level = [node_id for node_id in nodes_to_execute if node_id not in plan.scope_of]
+        
+        # Check credits
+        estimated_cost = self.calculate_total_cost(nodes, nodes_to_execute) + outstanding_credits
+        if check_credits and not self.credit_service.has_sufficient_credits(self.session, user_id, estimated_cost):
             balance = self.credit_service.get_balance(self.session, user_id)
             return {
                 "status": "failed",
@@ -293,38 +731,84 @@ class WorkflowEngine:
                 input_name = node.data.get('name', node.id)
                 if input_name in input_data:
                     context[node.id] = input_data[input_name]
-                else:
-                    context[node.id] = node.data.get('default_value')
+        context.update(finished_outputs)
+        
+        self.user_id = user_id
+        self.check_credits = check_credits
+        self.result_cache_user = user_id if use_cache else None
+        self.fresh_node_ids = set(target_node_ids or [])
+        self.cached_node_ids = set()
         
-        # Execute generations
+        # Execute nodes in dependency order
         credits_used = 0
-        try:
-            for generation in generations:
-                # Get node objects for this generation
-                gen_nodes = [n for n in nodes if n.id in generation]
-                
-                # Execute all nodes in this generation concurrently
-                # We create tasks for each node execution
-                tasks = [
-                    self.execute_node(node, context, edges)
-                    for node in gen_nodes
-                ]
-                
-                if not tasks:
-                    continue
+        credits_saved = 0
 
-                # Wait for all nodes in this layer to complete
-                results = await asyncio.gather(*tasks)
-                
-                # Update context with results
-                for node, result in zip(gen_nodes, results):
-                    context[node.id] = result
-                    
-                    # Track credits
-                    if node.type == 'replicate':
-                        model_id = node.data.get('model_id')
-                        cost = self.replicate_service.estimate_cost(self.session, model_id)
-                        credits_used += cost
+        node_records: Dict[str, NodeExecution] = {}
+
+        def node_started(node: WorkflowNode) -> None:
+            if execution_id is None:
+                return
+            node_instance = instance_id(node.id)
+            if node.type == 'map':
+                # Elements of an earlier attempt may no longer exist (the list can be shorter now)
+                for inner in plan.scopes[node.id].body:
+                    self.session.exec(
+                        delete(NodeExecution)
+                        .where(NodeExecution.execution_id == execution_id)
+                        .where(NodeExecution.node_id.startswith(f"{instance_id(inner)}[", autoescape=True))
+                    )
+            record = self.session.exec(
+                select(NodeExecution)
+                .where(NodeExecution.execution_id == execution_id)
+                .where(NodeExecution.node_id == node_instance)
+            ).first()
+            if record is None:
+                record = NodeExecution(execution_id=execution_id, node_id=node_instance, node_type=node.type, started_at=0)
+            # A retried execution reuses the records of its earlier attempt
+            record.status = "running"
+            record.cached = False
+            record.output = None
+            record.error_message = None
+            record.credits_used = 0
+            record.fingerprint = plan.fingerprint(node.id)
+            record.started_at = int(time.time() * 1000)
+            record.completed_at = None
+            self.record_node(record)
+            node_records[node_instance] = record
+
+        def track_credits(node: WorkflowNode, result: Any) -> None:
+            nonlocal credits_used, credits_saved
+            cost = 0
+            node_instance = instance_id(node.id)
+            if node.type == 'replicate':
+                model_id = node.data.get('model_id')
+                cost = self.replicate_service.estimate_cost(self.session, model_id)
+                if node_instance in self.cached_node_ids:
+                    credits_saved += cost
+                    cost = 0
+                else:
+                    credits_used += cost
+
+            record = node_records.get(node_instance)
+            if record:
+                record.status = "completed"
+                record.cached = node_instance in self.cached_node_ids
+                record.output = json.dumps(result, default=str)
+                record.credits_used = cost
+                record.completed_at = int(time.time() * 1000)
+                self.record_node(record)
+
+        def node_failed(node: WorkflowNode, error: BaseException) -> None:
+            record = node_records.get(instance_id(node.id))
+            if record:
+                record.status = "cancelled" if isinstance(error, asyncio.CancelledError) else "failed"
+                record.error_message = str(error) or None
+                record.completed_at = int(time.time() * 1000)
+                self.record_node(record)
+
+        self.node_callbacks = {"on_result": track_credits, "on_start": node_started, "on_error": node_failed}
+        try:
+            await self.run_nodes(plan, top_level, context, **self.node_callbacks)
             
             # Collect outputs
             outputs = {}
@@ -337,15 +821,22 @@ class WorkflowEngine:
                     if node.type == 'output':
                         output_name = node.data.get('name', node.id)
                         outputs[output_name] = context.get(node.id)
-                    elif node.type in ['replicate', 'llm_model', 'inpaint', 'remove_bg']:
+                    elif node.type in GENERATIVE_NODE_TYPES or node.type == 'collect':
                         outputs[node.id] = context.get(node.id)
             
             execution_time = int((time.time() - start_time) * 1000)
             
+            if self.cached_node_ids:
+                get_node_result_cache().record_saved(credits_saved)
+                print(f"Workflow reused {len(self.cached_node_ids)} node result(s), saving {credits_saved} credits")
+            
             return {
                 "status": "completed",
                 "outputs": outputs,
                 "credits_used": credits_used,
+                "credits_saved": credits_saved,
+                "cached_node_ids": sorted(self.cached_node_ids),
+                "resumed_node_ids": sorted(finished_outputs),
                 "execution_time_ms": execution_time
             }
         
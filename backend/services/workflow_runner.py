@@ -0,0 +1,408 @@
+"""
+Background workers for workflow executions. The WorkflowExecution table is the queue:
+rows are created as "pending", claimed with a conditional update, and kept alive by a
+heartbeat, so pending and interrupted runs survive restarts and any process can work them.
+
+Run workers outside the web process with WORKFLOW_WORKERS=0 on the API and:
+
+    python -m services.workflow_runner
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from database import engine
+from models import AIWorkflow, CreditTransaction, NodeExecution, WorkflowBatch, WorkflowExecution
+from services.credit_service import CreditService
+from services.execution_events import execution_event, get_execution_events
+from services.workflow_batches import finish_row, is_open, settle_batch
+from services.workflow_engine import WorkflowEngine
+
+# Runs mostly await predictions, so a worker is cheap; batches need several to run rows side by side
+WORKFLOW_WORKERS = int(os.getenv("WORKFLOW_WORKERS", "8"))
+# Fallback poll for work queued by other processes; local submissions wake workers at once
+WORKFLOW_POLL_INTERVAL = float(os.getenv("WORKFLOW_POLL_INTERVAL", "5"))
+HEARTBEAT_INTERVAL = 10.0
+# A running execution without a heartbeat for this long lost its worker
+STALE_AFTER = 60.0
+MAX_ATTEMPTS = 3
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _node_credits(session: Session, execution_id: uuid.UUID) -> int:
+    return session.exec(
+        select(func.coalesce(func.sum(NodeExecution.credits_used), 0))
+        .where(NodeExecution.execution_id == execution_id)
+        .where(NodeExecution.status == "completed")
+    ).one()
+
+
+def _credits_charged(session: Session, execution_id: uuid.UUID) -> int:
+    """Net credits already taken for an execution (deductions are negative, refunds positive)."""
+    return -session.exec(
+        select(func.coalesce(func.sum(CreditTransaction.amount), 0))
+        .where(CreditTransaction.workflow_execution_id == execution_id)
+    ).one()
+
+
+def _charge_nodes(session: Session, execution: WorkflowExecution, description: str, partial: bool = False) -> int:
+    """
+    Deduct what the execution's completed nodes cost beyond what was already charged,
+    so every node is paid once across attempts. With `partial` at most the balance is
+    taken (the run is over and its outputs were delivered); otherwise a short balance
+    raises ValueError.
+    """
+    due = _node_credits(session, execution.id) - _credits_charged(session, execution.id)
+    if partial:
+        due = min(due, CreditService.get_balance(session, execution.user_id))
+    if due > 0:
+        CreditService.deduct_credits(session, execution.user_id, due, description, execution_id=execution.id)
+    return max(due, 0)
+
+
+def _settle_unfinished(session: Session, execution: WorkflowExecution) -> None:
+    """
+    A failed or cancelled run still pays for the nodes it completed: their outputs were
+    already streamed to the client. Rows of an open batch are settled with the batch.
+    """
+    execution.credits_used = _node_credits(session, execution.id)
+    session.add(execution)
+    session.commit()
+    if not is_open(session.get(WorkflowBatch, execution.batch_id) if execution.batch_id else None):
+        workflow = session.get(AIWorkflow, execution.workflow_id)
+        name = workflow.name if workflow else execution.workflow_id
+        _charge_nodes(session, execution, f"Workflow execution ({execution.status}): {name}", partial=True)
+
+
+def _publish(execution: WorkflowExecution) -> None:
+    get_execution_events().publish(str(execution.id), execution_event(execution))
+
+
+class WorkflowRunner:
+    """Fixed number of asyncio workers executing queued workflow runs."""
+
+    def __init__(self, workers: int = WORKFLOW_WORKERS):
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running: Dict[uuid.UUID, asyncio.Task] = {}
+        self._counters = {"completed": 0, "failed": 0, "cancelled": 0, "requeued": 0}
+
+    def start(self) -> None:
+        if self._tasks or self.workers <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop workers; executions they were running go back to the queue."""
+        interrupted = list(self._running)
+        tasks = self._tasks + list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        if interrupted:
+            with Session(engine) as session:
+                session.exec(
+                    update(WorkflowExecution)
+                    .where(WorkflowExecution.id.in_(interrupted))
+                    .where(WorkflowExecution.status == "running")
+                    .values(status="pending", attempts=WorkflowExecution.attempts - 1)
+                )
+                session.commit()
+            print(f"Requeued {len(interrupted)} interrupted workflow executions")
+
+    def notify(self) -> None:
+        """
+        Wake an idle worker after an execution was queued by this process. Safe to call
+        from sync endpoints, which run in the threadpool rather than on the loop.
+        """
+        if self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def cancel(self, execution_id: uuid.UUID) -> bool:
+        """
+        Stop a run held by this process; others notice the status at their next heartbeat.
+        Like notify, callable from any thread.
+        """
+        task = self._running.get(execution_id)
+        if task is None:
+            return False
+        self._loop.call_soon_threadsafe(task.cancel)
+        return True
+
+    def _requeue_stale(self) -> None:
+        cutoff = _now_ms() - int(STALE_AFTER * 1000)
+        with Session(engine) as session:
+            stale = (
+                (WorkflowExecution.status == "running")
+                & (WorkflowExecution.heartbeat_at < cutoff)
+            )
+            exhausted_batches = session.exec(
+                select(WorkflowExecution.batch_id)
+                .where(stale & (WorkflowExecution.attempts >= MAX_ATTEMPTS))
+                .where(WorkflowExecution.batch_id.is_not(None))
+                .distinct()
+            ).all()
+            failed = session.exec(
+                update(WorkflowExecution)
+                .where(stale & (WorkflowExecution.attempts >= MAX_ATTEMPTS))
+                .values(status="failed", error_message="Execution was interrupted too many times", completed_at=_now_ms())
+            ).rowcount
+            requeued = session.exec(
+                update(WorkflowExecution).where(stale).values(status="pending")
+            ).rowcount
+            # Cancelled while running, but the worker that held it never reported back
+            abandoned = session.exec(
+                select(WorkflowExecution.id)
+                .where(WorkflowExecution.status == "cancelled")
+                .where(WorkflowExecution.completed_at.is_(None))
+                .where(WorkflowExecution.heartbeat_at < cutoff)
+            ).all()
+            session.commit()
+            for batch_id in exhausted_batches:
+                settle_batch(session, batch_id)
+        for execution_id in abandoned:
+            self._finish_cancelled(execution_id)
+        if failed or requeued:
+            self._counters["requeued"] += requeued
+            print(f"Workflow executions lost their worker: {requeued} requeued, {failed} failed")
+
+    def _claim(self) -> Optional[uuid.UUID]:
+        """
+        Oldest pending execution, marked running by this worker; None if the queue is empty.
+        Rows of a batch that already runs `parallelism` rows are passed over, which also
+        keeps a large batch from holding up everything queued after it.
+        """
+        with Session(engine) as session:
+            saturated_batches = (
+                select(WorkflowExecution.batch_id)
+                .join(WorkflowBatch, WorkflowBatch.id == WorkflowExecution.batch_id)
+                .where(WorkflowExecution.status == "running")
+                .group_by(WorkflowExecution.batch_id, WorkflowBatch.parallelism)
+                .having(func.count(WorkflowExecution.id) >= WorkflowBatch.parallelism)
+            )
+            candidates = session.exec(
+                select(WorkflowExecution.id, WorkflowExecution.batch_id)
+                .where(WorkflowExecution.status == "pending")
+                .where(or_(
+                    WorkflowExecution.batch_id.is_(None),
+                    WorkflowExecution.batch_id.not_in(saturated_batches)
+                ))
+                .order_by(WorkflowExecution.created_at, WorkflowExecution.batch_index)
+                .limit(5)
+            ).all()
+            running = aliased(WorkflowExecution)
+            for execution_id, batch_id in candidates:
+                now = _now_ms()
+                claim = (
+                    update(WorkflowExecution)
+                    .where(WorkflowExecution.id == execution_id)
+                    .where(WorkflowExecution.status == "pending")
+                    .values(status="running", started_at=now, heartbeat_at=now, attempts=WorkflowExecution.attempts + 1)
+                )
+                if batch_id is not None:
+                    # The candidate query may be stale; recount in the claim itself. Locking the
+                    # batch first serializes claims within it, so the count sees rows just claimed.
+                    session.exec(select(WorkflowBatch.id).where(WorkflowBatch.id == batch_id).with_for_update())
+                    claim = claim.where(
+                        select(func.count(running.id))
+                        .where(running.batch_id == batch_id)
+                        .where(running.status == "running")
+                        .scalar_subquery()
+                        < select(WorkflowBatch.parallelism).where(WorkflowBatch.id == batch_id).scalar_subquery()
+                    )
+                claimed = session.exec(claim).rowcount
+                session.commit()
+                if claimed:
+                    return execution_id
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                self._requeue_stale()
+                execution_id = self._claim()
+            except Exception as e:
+                print(f"Workflow queue poll failed: {e}")
+                execution_id = None
+
+            if execution_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=WORKFLOW_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run(execution_id))
+            self._running[execution_id] = task
+            try:
+                await self._supervise(execution_id, task)
+            except Exception as e:
+                print(f"Workflow execution {execution_id} crashed: {e}")
+                self._finish_failed(execution_id, str(e))
+            finally:
+                del self._running[execution_id]
+
+    async def _supervise(self, execution_id: uuid.UUID, task: asyncio.Task) -> None:
+        """Heartbeat while the run is going and stop it once it is cancelled through the API."""
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=HEARTBEAT_INTERVAL)
+            if done:
+                try:
+                    task.result()
+                except asyncio.CancelledError:
+                    self._counters["cancelled"] += 1
+                    self._finish_cancelled(execution_id)
+                return
+            with Session(engine) as session:
+                still_running = session.exec(
+                    update(WorkflowExecution)
+                    .where(WorkflowExecution.id == execution_id)
+                    .where(WorkflowExecution.status == "running")
+                    .values(heartbeat_at=_now_ms())
+                ).rowcount
+                session.commit()
+            if not still_running:
+                task.cancel()
+
+    async def _run(self, execution_id: uuid.UUID) -> None:
+        with Session(engine) as session:
+            execution = session.get(WorkflowExecution, execution_id)
+            workflow = session.get(AIWorkflow, execution.workflow_id)
+            if workflow is None:
+                raise ValueError("Workflow no longer exists")
+            _publish(execution)
+            # Rows of a batch are paid from the credits it reserved
+            reserved = is_open(session.get(WorkflowBatch, execution.batch_id) if execution.batch_id else None)
+            # Nodes an earlier attempt completed but could not be charged for are owed as well
+            owed = 0 if reserved else max(_node_credits(session, execution.id) - _credits_charged(session, execution.id), 0)
+
+            result = await WorkflowEngine(session).execute(
+                workflow_data=workflow.workflow_data,
+                input_data=json.loads(execution.input_data),
+                user_id=execution.user_id,
+                target_node_ids=json.loads(execution.target_node_ids) if execution.target_node_ids else None,
+                use_cache=execution.use_cache,
+                execution_id=execution.id,
+                check_credits=not reserved,
+                outstanding_credits=owed
+            )
+
+            session.refresh(execution)
+            if execution.status != "running":
+                # Cancelled while the last node was finishing
+                self._counters["cancelled"] += 1
+                if execution.status == "cancelled":
+                    self._finish_cancelled(execution_id)
+                else:
+                    _settle_unfinished(session, execution)
+                return
+
+            if result["status"] == "completed":
+                # Charged before the run is marked completed: if the balance fell short in the
+                # meantime this raises, and the worker records the run as failed instead.
+                # Nodes carried over from an earlier attempt count too; each node is paid once.
+                if not reserved:
+                    _charge_nodes(session, execution, f"Workflow execution: {workflow.name}")
+                execution.status = "completed"
+                execution.output_data = json.dumps(result["outputs"])
+                execution.credits_used = _node_credits(session, execution.id)
+                execution.execution_time_ms = result["execution_time_ms"]
+                execution.completed_at = _now_ms()
+                session.add(execution)
+                session.commit()
+                self._counters["completed"] += 1
+                _publish(execution)
+            else:
+                execution.status = "failed"
+                execution.error_message = result.get("error")
+                execution.execution_time_ms = result.get("execution_time_ms")
+                execution.completed_at = _now_ms()
+                _settle_unfinished(session, execution)
+                self._counters["failed"] += 1
+                _publish(execution)
+
+            if execution.batch_id:
+                finish_row(session, execution)
+
+    def _finish_failed(self, execution_id: uuid.UUID, error: str) -> None:
+        with Session(engine) as session:
+            session.exec(
+                update(WorkflowExecution)
+                .where(WorkflowExecution.id == execution_id)
+                .where(WorkflowExecution.status == "running")
+                .values(status="failed", error_message=error, completed_at=_now_ms())
+            )
+            session.commit()
+            execution = session.get(WorkflowExecution, execution_id)
+            _settle_unfinished(session, execution)
+            _publish(execution)
+            if execution.batch_id:
+                finish_row(session, execution)
+        self._counters["failed"] += 1
+
+    def _finish_cancelled(self, execution_id: uuid.UUID) -> None:
+        """
+        Settle a run cancelled through the API once it has actually stopped. The API leaves
+        completed_at unset on running rows; whoever sets it (the worker, or _requeue_stale
+        for a lost worker) settles the row and, for a batch row, possibly the batch.
+        """
+        with Session(engine) as session:
+            stopped = session.exec(
+                update(WorkflowExecution)
+                .where(WorkflowExecution.id == execution_id)
+                .where(WorkflowExecution.status == "cancelled")
+                .where(WorkflowExecution.completed_at.is_(None))
+                .values(completed_at=_now_ms())
+            ).rowcount
+            session.commit()
+            if not stopped:
+                return
+            execution = session.get(WorkflowExecution, execution_id)
+            _settle_unfinished(session, execution)
+            _publish(execution)
+            if execution.batch_id:
+                finish_row(session, execution)
+
+    def stats(self) -> Dict[str, int]:
+        with Session(engine) as session:
+            pending = session.exec(
+                select(func.count(WorkflowExecution.id)).where(WorkflowExecution.status == "pending")
+            ).one()
+        return dict(self._counters, workers=len(self._tasks), running=len(self._running), pending=pending)
+
+
+_runner = WorkflowRunner()
+
+
+def get_workflow_runner() -> WorkflowRunner:
+    return _runner
+
+
+async def main() -> None:
+    runner = WorkflowRunner(workers=max(WORKFLOW_WORKERS, 1))
+    runner.start()
+    print(f"Workflow runner started with {runner.workers} workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
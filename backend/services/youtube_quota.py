@@ -0,0 +1,196 @@
+"""YouTube Data API quota accounting and API key rotation."""
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+
+# Unit cost per call, see https://developers.google.com/youtube/v3/determine_quota_cost
+UNIT_COSTS = {
+    "search.list": 100,
+    "videos.list": 1,
+    "channels.list": 1,
+}
+
+# Daily quotas reset at midnight Pacific Time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+QUOTA_ERROR_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+
+
+class QuotaExhausted(Exception):
+    """Raised when no configured API key has enough budget left for a call."""
+
+
+class YouTubeQuota:
+    """Tracks daily unit spend per API key and rotates between keys."""
+
+    def __init__(self, api_keys: List[str], daily_budget: int = 10000, low_watermark: float = 0.2):
+        self.api_keys = api_keys
+        self.daily_budget = daily_budget
+        self.low_watermark = low_watermark
+        self._lock = threading.Lock()
+        self._day: Optional[str] = None
+        self._spent: Dict[str, int] = {}
+        self._calls: Dict[str, Dict[str, int]] = {}
+        self._exhausted: set = set()
+        # googleapiclient services are not thread-safe, keep one per thread and key
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> "YouTubeQuota":
+        """Build from YOUTUBE_API_KEYS (comma separated) or the single YOUTUBE_API_KEY."""
+        keys = [k.strip() for k in os.getenv("YOUTUBE_API_KEYS", "").split(",") if k.strip()]
+        if not keys and os.getenv("YOUTUBE_API_KEY"):
+            keys = [os.getenv("YOUTUBE_API_KEY")]
+        return cls(
+            api_keys=keys,
+            daily_budget=int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000")),
+            low_watermark=float(os.getenv("YOUTUBE_QUOTA_LOW_WATERMARK", "0.2")),
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_keys)
+
+    def _roll_day(self) -> None:
+        """Reset counters when the Pacific Time day changes. Caller holds the lock."""
+        today = datetime.now(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+        if today != self._day:
+            self._day = today
+            self._spent = {key: 0 for key in self.api_keys}
+            self._calls = {key: {} for key in self.api_keys}
+            self._exhausted = set()
+
+    def _key_remaining(self, key: str) -> int:
+        if key in self._exhausted:
+            return 0
+        return max(0, self.daily_budget - self._spent.get(key, 0))
+
+    def remaining(self) -> int:
+        """Units left today across all keys."""
+        with self._lock:
+            self._roll_day()
+            return sum(self._key_remaining(key) for key in self.api_keys)
+
+    def total_budget(self) -> int:
+        return self.daily_budget * len(self.api_keys)
+
+    def has_budget(self, method: str, calls: int = 1) -> bool:
+        """Whether a single key can still afford `calls` calls of `method`."""
+        cost = UNIT_COSTS[method] * calls
+        with self._lock:
+            self._roll_day()
+            return any(self._key_remaining(key) >= cost for key in self.api_keys)
+
+    def is_low(self) -> bool:
+        """True once spend crosses the low watermark; non-essential refreshes should stop."""
+        if not self.configured:
+            return True
+        return self.remaining() < self.total_budget() * self.low_watermark
+
+    def _acquire_key(self, method: str) -> Optional[str]:
+        """Pick the key with the most budget left that can afford the call."""
+        cost = UNIT_COSTS[method]
+        with self._lock:
+            self._roll_day()
+            candidates = [key for key in self.api_keys if self._key_remaining(key) >= cost]
+            if not candidates:
+                return None
+            return max(candidates, key=self._key_remaining)
+
+    def record(self, key: str, method: str) -> None:
+        """Account for one executed call (YouTube charges failed requests too)."""
+        with self._lock:
+            self._roll_day()
+            self._spent[key] = self._spent.get(key, 0) + UNIT_COSTS[method]
+            calls = self._calls.setdefault(key, {})
+            calls[method] = calls.get(method, 0) + 1
+
+    def mark_exhausted(self, key: str) -> None:
+        """Take a key out of rotation for the rest of the day."""
+        with self._lock:
+            self._roll_day()
+            self._exhausted.add(key)
+
+    def _client(self, key: str):
+        clients = getattr(self._local, "clients", None)
+        if clients is None:
+            clients = self._local.clients = {}
+        if key not in clients:
+            clients[key] = build("youtube", "v3", developerKey=key, cache_discovery=False)
+        return clients[key]
+
+    def execute(self, method: str, make_request: Callable[[Any], Any]) -> Dict[str, Any]:
+        """
+        Run a YouTube Data API call on a key with budget left.
+        `make_request` receives the service and returns the unexecuted request,
+        e.g. `lambda yt: yt.videos().list(part="statistics", id=ids)`.
+        Keys that report quotaExceeded are rotated out and the call is retried.
+        """
+        while True:
+            key = self._acquire_key(method)
+            if key is None:
+                raise QuotaExhausted(f"No YouTube API quota left for {method}")
+            try:
+                response = make_request(self._client(key)).execute()
+            except HttpError as e:
+                if _is_quota_error(e):
+                    print(f"YouTube API key ...{key[-4:]} exhausted, rotating")
+                    self.mark_exhausted(key)
+                    continue
+                self.record(key, method)
+                raise
+            self.record(key, method)
+            return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Spend and remaining budget, for the metrics endpoint. Keys are identified by position only."""
+        with self._lock:
+            self._roll_day()
+            keys = [
+                {
+                    "index": index,
+                    "spent": self._spent.get(key, 0),
+                    "remaining": self._key_remaining(key),
+                    "exhausted": key in self._exhausted,
+                    "calls": dict(self._calls.get(key, {})),
+                }
+                for index, key in enumerate(self.api_keys)
+            ]
+            remaining = sum(k["remaining"] for k in keys)
+        return {
+            "day": self._day,
+            "daily_budget_per_key": self.daily_budget,
+            "total_budget": self.total_budget(),
+            "spent": sum(k["spent"] for k in keys),
+            "remaining": remaining,
+            "low": remaining < self.total_budget() * self.low_watermark,
+            "keys": keys,
+        }
+
+
+def _is_quota_error(error: HttpError) -> bool:
+    if error.resp.status != 403:
+        return False
+    details = getattr(error, "error_details", None) or []
+    if isinstance(details, list):
+        for detail in details:
+            if isinstance(detail, dict) and detail.get("reason") in QUOTA_ERROR_REASONS:
+                return True
+    return "quota" in str(error).lower()
+
+
+_quota: Optional[YouTubeQuota] = None
+
+
+def get_youtube_quota() -> YouTubeQuota:
+    """Process-wide quota meter, created lazily so .env is loaded first."""
+    global _quota
+    if _quota is None:
+        _quota = YouTubeQuota.from_env()
+    return _quota
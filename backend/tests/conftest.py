@@ -0,0 +1,54 @@
+"""
+Shared fixtures. database.py reads DATABASE_URL at import, so it is pointed at a
+throwaway SQLite file before any backend module is imported.
+
+Run from backend/: python -m pytest
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("REPLICATE_API_TOKEN", "test")
+
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from database import engine  # noqa: E402
+from models import AIWorkflow, User  # noqa: E402
+
+engine.echo = False
+SQLModel.metadata.create_all(engine)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+@pytest.fixture
+def session():
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def user(session) -> User:
+    user = User(email=f"{uuid.uuid4()}@example.com", password_hash="x", created_at=now_ms(), credit_balance=100)
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    return user
+
+
+@pytest.fixture
+def workflow(session, user) -> AIWorkflow:
+    workflow = AIWorkflow(name="Test workflow", workflow_data="{}", user_id=user.id, created_at=now_ms(), updated_at=now_ms())
+    session.add(workflow)
+    session.commit()
+    session.refresh(workflow)
+    return workflow
@@ -0,0 +1,51 @@
+import ipaddress
+
+from services import image_derivatives
+from services.image_derivatives import decode_token, derivative_url, derivative_urls
+from services.safe_fetch import _pinned
+
+SOURCE = "https://cdn.example.com/a.png"
+
+
+def token_of(url):
+    return url.split("/")[3]
+
+
+def test_tokens_round_trip(monkeypatch):
+    monkeypatch.setattr(image_derivatives, "IMAGE_SIGNING_KEY", "test-key")
+    assert decode_token(token_of(derivative_url(SOURCE))) == SOURCE
+
+
+def test_tampered_tokens_are_rejected(monkeypatch):
+    monkeypatch.setattr(image_derivatives, "IMAGE_SIGNING_KEY", "test-key")
+    token = token_of(derivative_url(SOURCE))
+    forged = token_of(derivative_url("http://169.254.169.254/latest"))
+    assert decode_token(forged.split(".")[0] + "." + token.split(".")[1]) is None
+
+
+def test_tokens_from_another_key_are_rejected(monkeypatch):
+    monkeypatch.setattr(image_derivatives, "IMAGE_SIGNING_KEY", "other-key")
+    token = token_of(derivative_url(SOURCE))
+    monkeypatch.setattr(image_derivatives, "IMAGE_SIGNING_KEY", "test-key")
+    assert decode_token(token) is None
+
+
+def test_without_key_no_tokens_are_issued_or_accepted(monkeypatch):
+    monkeypatch.setattr(image_derivatives, "IMAGE_SIGNING_KEY", "test-key")
+    token = token_of(derivative_url(SOURCE))
+    monkeypatch.setattr(image_derivatives, "IMAGE_SIGNING_KEY", None)
+    assert derivative_url(SOURCE) == SOURCE
+    assert derivative_urls(SOURCE) is None
+    assert decode_token(token) is None
+
+
+def test_requests_go_to_the_checked_address():
+    pinned, headers, extensions = _pinned("https://cdn.example.com:8443/a.png?w=1", ipaddress.ip_address("93.184.216.34"))
+    assert pinned == "https://93.184.216.34:8443/a.png?w=1"
+    assert headers == {"Host": "cdn.example.com:8443"}
+    assert extensions == {"sni_hostname": "cdn.example.com"}
+
+    pinned, headers, extensions = _pinned("http://cdn.example.com/a.png", ipaddress.ip_address("2606:4700::1"))
+    assert pinned == "http://[2606:4700::1]/a.png"
+    assert headers == {"Host": "cdn.example.com"}
+    assert extensions == {}
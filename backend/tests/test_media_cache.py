@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+from services.media_cache import ORPHAN_AGE, MediaCache
+
+VIDEO_ID = "abcdefghijk"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    root = tmp_path / "temp"
+    root.mkdir()
+    return MediaCache(root, index_dir=tmp_path / "index", max_bytes=100, max_age=3600)
+
+
+def write(cache, name, size=10, age=0):
+    path = cache.root / name
+    path.write_bytes(b"x" * size)
+    if age:
+        then = time.time() - age
+        os.utime(path, (then, then))
+    return path
+
+
+def test_oversize_file_is_kept_but_not_cached(cache):
+    small = write(cache, "small.jpg")
+    cache.add(VIDEO_ID, "frame:1", small)
+    big = write(cache, "big.mp4", size=500)
+    cache.add(VIDEO_ID, "video", big)
+
+    # Neither evicted: the big file does not count against the budget
+    assert big.exists() and small.exists()
+    assert cache.lookup(VIDEO_ID, "video") is None
+    assert cache.lookup(VIDEO_ID, "frame:1") == small
+
+
+def test_oversize_file_expires(cache):
+    big = write(cache, "big.mp4", size=500)
+    cache.add(VIDEO_ID, "video", big)
+    cache.max_age = -1
+    cache.evict()
+    assert not big.exists()
+
+
+def test_sweep_only_deletes_the_caches_own_files(cache):
+    old = 10 * max(ORPHAN_AGE, cache.max_age)
+    scratch = write(cache, "abc.123.456.tmp.jpg", age=old)
+    download = write(cache, "Title-abcdefghijk.mp4.part", age=old)
+    foreign = write(cache, "export-report.csv", age=old)
+    foreign_tmp = write(cache, "upload.tmp", age=old)
+    fresh_scratch = write(cache, "abc.123.789.tmp.jpg")
+
+    cache.sweep()
+    assert not scratch.exists() and not download.exists()
+    assert foreign.exists() and foreign_tmp.exists() and fresh_scratch.exists()
+
+
+def test_sweep_adopts_legacy_files(cache):
+    frame = write(cache, f"{VIDEO_ID}_42.jpg")
+    cache.sweep()
+    assert cache.lookup(VIDEO_ID, "frame:42") == frame
@@ -0,0 +1,157 @@
+import random
+import uuid
+
+import numpy as np
+import pytest
+
+from conftest import now_ms
+from models import User
+from services.perceptual_hash import (
+    BAND_BITS,
+    SAMPLE_SIZE,
+    compute_hashes,
+    find_duplicates,
+    find_similar,
+    hamming,
+    phash_bands,
+    store_hashes,
+    to_signed,
+)
+
+BASE = 0xF0F0_0FF0_AA55_1234
+
+
+def flip(value, *bits):
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.fixture
+def hashed(session, user):
+    """Items of `user` at growing pHash distances from BASE: {item_id: distance}."""
+    items = {}
+    for distance in (0, 2, 5, 12, 30):
+        item_id = uuid.uuid4()
+        phash = flip(BASE, *range(0, 64, 2)[:distance])
+        store_hashes(session, "image", item_id, user.id, f"https://x/{item_id}.png", (0, 0, phash))
+        items[item_id] = distance
+    session.commit()
+    return items
+
+
+def test_find_similar_orders_by_distance(session, user, hashed):
+    results = find_similar(session, user.id, BASE, max_distance=64)
+    assert [distance for _, _, distance in results] == [0, 2, 5, 12, 30]
+    assert all(hashed[item_id] == distance for _, item_id, distance in results)
+
+
+def test_find_similar_respects_radius_and_limit(session, user, hashed):
+    assert [distance for _, _, distance in find_similar(session, user.id, BASE, max_distance=5)] == [0, 2, 5]
+    assert [distance for _, _, distance in find_similar(session, user.id, BASE, max_distance=64, limit=2)] == [0, 2]
+
+
+def test_find_similar_handles_high_bit_hashes(session, user):
+    # Stored as signed BIGINT; distances must be computed on the unsigned value
+    high = BASE
+    item_id = uuid.uuid4()
+    store_hashes(session, "clip", item_id, user.id, "https://x/high.png", (0, 0, high))
+    session.commit()
+    assert to_signed(high) < 0
+    assert find_similar(session, user.id, flip(high, 0)) == [("clip", item_id, 1)]
+    assert hamming(to_signed(high), flip(high, 0)) == 1
+
+
+def test_find_similar_excludes_item_and_other_users(session, user, hashed):
+    other = User(email=f"{uuid.uuid4()}@example.com", password_hash="x", created_at=now_ms())
+    session.add(other)
+    session.commit()
+    store_hashes(session, "image", uuid.uuid4(), other.id, "https://x/other.png", (0, 0, BASE))
+    session.commit()
+
+    exact = next(item_id for item_id, distance in hashed.items() if distance == 0)
+    results = find_similar(session, user.id, BASE, max_distance=64, exclude=("image", exact))
+    assert exact not in {item_id for _, item_id, _ in results}
+    assert len(results) == len(hashed) - 1
+
+
+def test_find_similar_without_hashes(session, user):
+    assert find_similar(session, user.id, BASE) == []
+
+
+def gradient():
+    return np.tile(np.linspace(0, 255, SAMPLE_SIZE), (SAMPLE_SIZE, 1)).astype(np.uint8)
+
+
+def scene(seed=1):
+    """Smooth random blobs, closer to a photo than a gradient (whose DCT terms are mostly zero)."""
+    coarse = np.random.default_rng(seed).integers(0, 256, (4, 4)).astype(float)
+    pixels = np.kron(coarse, np.ones((SAMPLE_SIZE // 4, SAMPLE_SIZE // 4)))
+    for _ in range(3):
+        pixels = (pixels + np.roll(pixels, 1, 0) + np.roll(pixels, -1, 0) + np.roll(pixels, 1, 1) + np.roll(pixels, -1, 1)) / 5
+    return pixels.astype(np.uint8)
+
+
+def checkerboard():
+    cells = (np.indices((SAMPLE_SIZE, SAMPLE_SIZE)) // 4).sum(axis=0) % 2
+    return (cells * 255).astype(np.uint8)
+
+
+def test_compute_hashes_of_a_gradient():
+    ahash, dhash, phash = compute_hashes(gradient())
+    # Every row brightens left to right: each dHash bit is set, the right half is above the mean
+    assert dhash == (1 << 64) - 1
+    assert ahash == int("00001111" * 8, 2)
+    assert 0 <= phash < 1 << 64
+
+
+def test_compute_hashes_survives_small_changes():
+    pixels = scene()
+    rng = np.random.default_rng(0)
+    noisy = np.clip(pixels.astype(int) + rng.integers(-6, 7, pixels.shape), 0, 255).astype(np.uint8)
+    # Brighter with less contrast: the DC term is ignored and every other term scales alike
+    relit = pixels.astype(float) * 0.8 + 20
+    phash = compute_hashes(pixels)[2]
+    assert hamming(compute_hashes(noisy)[2], phash) <= 3
+    assert compute_hashes(relit)[2] == phash
+
+
+def test_compute_hashes_tells_different_images_apart():
+    assert hamming(compute_hashes(scene(1))[2], compute_hashes(scene(2))[2]) > 12
+    assert hamming(compute_hashes(scene(1))[2], compute_hashes(checkerboard())[2]) > 12
+
+
+def test_near_hashes_share_a_band():
+    rng = random.Random(0)
+    for _ in range(200):
+        phash = rng.getrandbits(64)
+        near = flip(phash, *rng.sample(range(64), 3))
+        assert any(a == b for a, b in zip(phash_bands(phash), phash_bands(near)))
+
+
+def test_find_duplicates_uses_bands_and_distance(session, user):
+    # One flipped bit in three different bands: the fourth band still matches
+    spread = flip(BASE, 0, BAND_BITS, 2 * BAND_BITS)
+    # Four flips in one band: three bands match, but it is too far to be a duplicate
+    clustered = flip(BASE, 0, 1, 2, 3)
+    # One flip in every band: shares no band, so it is not even a candidate
+    disjoint = flip(BASE, 0, BAND_BITS, 2 * BAND_BITS, 3 * BAND_BITS)
+    items = {}
+    for name, phash in (("same", BASE), ("spread", spread), ("clustered", clustered), ("disjoint", disjoint)):
+        items[name] = uuid.uuid4()
+        store_hashes(session, "image", items[name], user.id, f"https://x/{name}.png", (0, 0, phash))
+    session.commit()
+
+    matches = find_duplicates(session, user.id, BASE)
+    assert [(row.item_id, distance) for row, distance in matches] == [(items["same"], 0), (items["spread"], 3)]
+    excluded = find_duplicates(session, user.id, BASE, exclude=("image", items["same"]))
+    assert [row.item_id for row, _ in excluded] == [items["spread"]]
+
+
+def test_find_duplicates_is_per_user(session, user):
+    other = User(email=f"{uuid.uuid4()}@example.com", password_hash="x", created_at=now_ms())
+    session.add(other)
+    session.commit()
+    store_hashes(session, "image", uuid.uuid4(), other.id, "https://x/theirs.png", (0, 0, BASE))
+    session.commit()
+    assert find_duplicates(session, user.id, BASE) == []
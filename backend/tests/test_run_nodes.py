@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from services.workflow_engine import WorkflowEdge, WorkflowEngine, WorkflowNode, compile_plan
+
+
+class FakeReplicate:
+    """Predictions named in `failing` fail, the others succeed after `delays[prompt]` seconds."""
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = set(failing)
+
+    def estimate_cost(self, session, model_id):
+        return 0
+
+    async def predict(self, model_id, inputs, owner=None):
+        await asyncio.sleep(self.delays.get(inputs["prompt"], 0))
+        if inputs["prompt"] in self.failing:
+            return {"status": "failed", "error": f"{inputs['prompt']} failed"}
+        return {"status": "succeeded", "output": [inputs["prompt"] + "!"]}
+
+
+def parallel_plan(names):
+    nodes = [WorkflowNode(id=name, type="replicate", data={"model_id": "m/x", "parameters": {"prompt": name}}, inputs={})
+             for name in names]
+    nodes.append(WorkflowNode(id="out", type="output", data={}, inputs={}))
+    edges = [WorkflowEdge(source=name, target="out", source_handle="output", target_handle=name) for name in names]
+    return compile_plan(nodes, edges)
+
+
+def run(session, plan, fake):
+    engine = WorkflowEngine(session)
+    engine.replicate_service = fake
+    results, errors = {}, {}
+    context = {}
+    with pytest.raises(ValueError):
+        asyncio.run(engine.run_nodes(
+            plan, plan.order, context,
+            on_result=lambda node, result: results.__setitem__(node.id, result),
+            on_error=lambda node, error: errors.__setitem__(node.id, type(error).__name__),
+        ))
+    return context, results, errors
+
+
+def test_nodes_finishing_with_a_failure_are_recorded(session):
+    # All three finish in the same step of the scheduler
+    context, results, errors = run(session, parallel_plan(["a", "bad", "c"]), FakeReplicate({}, failing=["bad"]))
+    assert results == {"a": "a!", "c": "c!"}
+    assert context["a"] == "a!" and context["c"] == "c!"
+    assert errors == {"bad": "ValueError"}
+
+
+def test_running_nodes_are_cancelled_after_a_failure(session):
+    context, results, errors = run(session, parallel_plan(["bad", "slow"]), FakeReplicate({"slow": 5}, failing=["bad"]))
+    assert results == {}
+    assert errors == {"bad": "ValueError", "slow": "CancelledError"}
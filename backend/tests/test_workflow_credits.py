@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from conftest import now_ms
+from models import NodeExecution, User, WorkflowBatch, WorkflowExecution
+from services.credit_service import CreditService
+from services.workflow_batches import settle_batch
+from services.workflow_runner import _charge_nodes, _credits_charged, _settle_unfinished
+
+
+@pytest.fixture
+def execution(session, user, workflow):
+    execution = WorkflowExecution(workflow_id=workflow.id, user_id=user.id, status="running",
+                                  input_data=json.dumps({}), created_at=now_ms())
+    session.add(execution)
+    session.commit()
+    session.refresh(execution)
+    return execution
+
+
+def add_nodes(session, execution, *nodes):
+    """nodes: (node_id, status, credits) tuples."""
+    for node_id, status, credits in nodes:
+        session.add(NodeExecution(execution_id=execution.id, node_id=node_id, node_type="replicate",
+                                  status=status, credits_used=credits, started_at=now_ms()))
+    session.commit()
+
+
+def balance(session, user):
+    session.expire_all()
+    return session.get(User, user.id).credit_balance
+
+
+def test_failed_run_pays_for_completed_nodes(session, user, execution):
+    add_nodes(session, execution, ("a", "completed", 3), ("b", "completed", 4), ("c", "failed", 5))
+    execution.status = "failed"
+    _settle_unfinished(session, execution)
+    assert execution.credits_used == 7
+    assert balance(session, user) == 93
+    assert _credits_charged(session, execution.id) == 7
+
+
+def test_settlement_charges_each_node_once(session, user, execution):
+    add_nodes(session, execution, ("a", "completed", 3))
+    execution.status = "cancelled"
+    _settle_unfinished(session, execution)
+    # Resumed, one more node completes, cancelled again
+    add_nodes(session, execution, ("b", "completed", 4))
+    _settle_unfinished(session, execution)
+    _settle_unfinished(session, execution)
+    assert balance(session, user) == 93
+    assert _credits_charged(session, execution.id) == 7
+
+
+def test_due_accounts_for_refunds(session, user, execution):
+    add_nodes(session, execution, ("a", "completed", 5))
+    # An earlier attempt charged 8 and was refunded in full
+    CreditService.deduct_credits(session, user.id, 8, "Earlier attempt", execution_id=execution.id)
+    execution.credits_used = 8
+    session.add(execution)
+    session.commit()
+    CreditService.refund_credits(session, execution.id)
+    assert _charge_nodes(session, execution, "Retry") == 5
+    assert balance(session, user) == 95
+
+
+def test_unfinished_run_takes_at_most_the_balance(session, user, execution):
+    add_nodes(session, execution, ("a", "completed", 60), ("b", "completed", 60))
+    execution.status = "failed"
+    _settle_unfinished(session, execution)
+    assert balance(session, user) == 0
+    assert _credits_charged(session, execution.id) == 100
+
+
+def test_completed_run_needs_the_full_amount(session, user, execution):
+    add_nodes(session, execution, ("a", "completed", 150))
+    with pytest.raises(ValueError, match="Insufficient credits"):
+        _charge_nodes(session, execution, "Workflow execution")
+    assert balance(session, user) == 100
+
+
+def test_open_batch_rows_are_settled_by_the_batch(session, user, workflow, execution):
+    batch = WorkflowBatch(workflow_id=workflow.id, user_id=user.id, row_count=1, parallelism=1,
+                          credits_reserved=10, created_at=now_ms())
+    session.add(batch)
+    session.commit()
+    execution.batch_id = batch.id
+    add_nodes(session, execution, ("a", "completed", 3))
+    execution.status = "failed"
+    _settle_unfinished(session, execution)
+    assert execution.credits_used == 3
+    assert balance(session, user) == 100
+
+
+def test_cancelled_batch_waits_for_stopping_rows(session, user, workflow, execution):
+    batch = WorkflowBatch(workflow_id=workflow.id, user_id=user.id, row_count=1, parallelism=1,
+                          credits_reserved=10, status="cancelled", created_at=now_ms())
+    session.add(batch)
+    session.commit()
+    CreditService.deduct_credits(session, user.id, 10, "Batch reservation")
+    # Cancelled through the API while running: the worker has not stopped yet
+    execution.batch_id = batch.id
+    execution.status = "cancelled"
+    session.add(execution)
+    session.commit()
+    assert not settle_batch(session, batch.id)
+
+    # A node completes before the worker notices the cancellation
+    add_nodes(session, execution, ("a", "completed", 3))
+    execution.completed_at = now_ms()
+    _settle_unfinished(session, execution)
+    assert settle_batch(session, batch.id)
+    assert session.get(WorkflowBatch, batch.id).credits_used == 3
+    assert balance(session, user) == 97
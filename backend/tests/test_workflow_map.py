@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+
+from services.workflow_batches import check_rows
+from services.workflow_engine import WorkflowEdge, WorkflowEngine, WorkflowNode, compile_plan
+
+
+def build_plan(nodes, edges):
+    """nodes: (id, type[, data]) tuples; edges: (source, target[, target_handle]) tuples."""
+    return compile_plan(
+        [WorkflowNode(id=spec[0], type=spec[1], data=spec[2] if len(spec) > 2 else {}, inputs={}) for spec in nodes],
+        [WorkflowEdge(source=edge[0], target=edge[1], source_handle="output", target_handle=edge[2] if len(edge) > 2 else "input")
+         for edge in edges],
+    )
+
+
+def map_plan(parallelism=2):
+    return build_plan(
+        [("list", "input"), ("each", "map", {"parallelism": parallelism}), ("up", "replicate", {"model_id": "m/up"}),
+         ("all", "collect"), ("out", "output")],
+        [("list", "each"), ("each", "up", "prompt"), ("up", "all"), ("all", "out")],
+    )
+
+
+def test_scope_maps_pairs_map_and_collect():
+    plan = map_plan()
+    assert plan.error is None
+    assert plan.scopes["each"].collect_id == "all"
+    assert plan.scopes["each"].body == ["up"]
+    assert plan.scope_of == {"up": "each"}
+    # The map waits for what its body needs; the collect runs right after the map
+    assert plan.waits_for["all"] == ["each"]
+
+
+def test_scope_maps_nested():
+    plan = build_plan(
+        [("list", "input"), ("outer", "map"), ("inner", "map"), ("up", "replicate", {"model_id": "m/up"}),
+         ("inner_all", "collect"), ("outer_all", "collect"), ("out", "output")],
+        [("list", "outer"), ("outer", "inner"), ("inner", "up"), ("up", "inner_all"), ("inner_all", "outer_all"),
+         ("outer_all", "out")],
+    )
+    assert plan.error is None
+    assert plan.scopes["outer"].collect_id == "outer_all"
+    assert plan.scopes["inner"].collect_id == "inner_all"
+    assert plan.scope_of == {"inner": "outer", "inner_all": "outer", "up": "inner"}
+
+
+@pytest.mark.parametrize("nodes, edges, error", [
+    ([("list", "input"), ("each", "map"), ("out", "output")],
+     [("list", "each"), ("each", "out")],
+     "Map node each has no collect node"),
+    ([("list", "input"), ("t", "transform"), ("all", "collect"), ("out", "output")],
+     [("list", "t"), ("t", "all"), ("all", "out")],
+     "Collect node all does not follow a map node"),
+    ([("list", "input"), ("each", "map"), ("a", "transform"), ("b", "transform"), ("all", "collect"), ("out", "output")],
+     [("list", "each"), ("each", "a"), ("each", "b"), ("a", "all"), ("b", "all"), ("all", "out")],
+     "Collect node all needs exactly one input"),
+    ([("list", "input"), ("each", "map"), ("a", "transform"), ("all", "collect"), ("out", "output"), ("side", "output")],
+     [("list", "each"), ("each", "a"), ("a", "all"), ("all", "out"), ("each", "side")],
+     "Node side follows map node each but does not lead to its collect node"),
+    ([("list", "input"), ("each", "map"), ("a", "transform"), ("all", "collect"), ("out", "output"),
+      ("late", "replicate", {"model_id": "m/late", "parameters": {"prompt": "$a"}})],
+     [("list", "each"), ("each", "a"), ("a", "all"), ("all", "out"), ("all", "late")],
+     "Node late reads a, which only exists inside map node each; connect it through collect node all"),
+    ([("l1", "input"), ("l2", "input"), ("m1", "map"), ("m2", "map"), ("join", "utility", {"op_type": "concat"}),
+      ("all", "collect"), ("out", "output")],
+     [("l1", "m1"), ("l2", "m2"), ("m1", "join", "a"), ("m2", "join", "b"), ("join", "all"), ("all", "out")],
+     "Collect node all follows several unrelated map nodes"),
+])
+def test_scope_maps_errors(nodes, edges, error):
+    assert build_plan(nodes, edges).error == error
+
+
+def test_map_fingerprint_covers_body():
+    plan = map_plan()
+    edited = build_plan(
+        [("list", "input"), ("each", "map", {"parallelism": 2}), ("up", "replicate", {"model_id": "m/up2"}),
+         ("all", "collect"), ("out", "output")],
+        [("list", "each"), ("each", "up", "prompt"), ("up", "all"), ("all", "out")],
+    )
+    finished = {node_id: plan.fingerprint(node_id) for node_id in plan.order}
+    # Editing the body invalidates the map's stored result and what follows
+    assert edited.reusable(edited.order, finished) == {"list"}
+
+
+class FakeReplicate:
+    """Stands in for ReplicateService: each prediction sleeps `delays[prompt]` seconds."""
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.in_flight = 0
+        self.peak = 0
+        self.cancelled = []
+
+    def estimate_cost(self, session, model_id):
+        return 0
+
+    async def predict(self, model_id, inputs, owner=None):
+        prompt = inputs["prompt"]
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(prompt, 0))
+            if prompt in self.failing:
+                return {"status": "failed", "error": f"{prompt} failed"}
+            return {"status": "succeeded", "output": [f"{prompt}!"]}
+        except asyncio.CancelledError:
+            self.cancelled.append(prompt)
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+def run_plan(session, plan, items, fake):
+    engine = WorkflowEngine(session)
+    engine.replicate_service = fake
+    context = {"list": items}
+    top_level = [node_id for node_id in plan.order if node_id not in plan.scope_of and node_id != "list"]
+    asyncio.run(engine.run_nodes(plan, top_level, context))
+    return context
+
+
+def test_run_map_keeps_element_order(session):
+    items = ["a", "b", "c", "d", "e"]
+    # Later elements finish first
+    fake = FakeReplicate({item: 0.01 * (len(items) - index) for index, item in enumerate(items)})
+    context = run_plan(session, map_plan(parallelism=2), items, fake)
+    assert context["out"] == ["a!", "b!", "c!", "d!", "e!"]
+    assert fake.peak == 2
+
+
+def test_run_map_wraps_single_value(session):
+    context = run_plan(session, map_plan(), "solo", FakeReplicate({}))
+    assert context["out"] == ["solo!"]
+
+
+def test_run_map_failure_cancels_other_elements(session):
+    fake = FakeReplicate({"slow1": 5, "slow2": 5, "bad": 0.01}, failing=["bad"])
+    started = time.monotonic()
+    with pytest.raises(ValueError, match="bad failed"):
+        run_plan(session, map_plan(parallelism=3), ["slow1", "bad", "slow2"], fake)
+    assert time.monotonic() - started < 2
+    assert sorted(fake.cancelled) == ["slow1", "slow2"]
+    assert fake.in_flight == 0
+
+
+def test_batches_reject_maps():
+    plan = map_plan()
+    assert check_rows(plan, [{"list": "a"}]) == "Workflows with For Each nodes cannot run as a batch (each)"
+    # Fine when the nodes to run stop before the map
+    assert check_rows(plan, [{"list": "a"}], ["list"]) is None
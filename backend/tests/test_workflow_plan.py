@@ -0,0 +1,69 @@
+from services.workflow_engine import WorkflowEdge, WorkflowNode, compile_plan
+
+
+def build_plan(nodes, edges):
+    """nodes: (id, type[, data]) tuples; edges: (source, target) pairs."""
+    return compile_plan(
+        [WorkflowNode(id=spec[0], type=spec[1], data=spec[2] if len(spec) > 2 else {}, inputs={}) for spec in nodes],
+        [WorkflowEdge(source=source, target=target, source_handle="output", target_handle="input") for source, target in edges],
+    )
+
+
+CHAIN = [("in", "input"), ("gen", "replicate", {"model_id": "m/gen"}), ("up", "replicate", {"model_id": "m/up"}), ("out", "output")]
+CHAIN_EDGES = [("in", "gen"), ("gen", "up"), ("up", "out")]
+
+
+def test_compile_plan_orders_nodes_topologically():
+    plan = build_plan(list(reversed(CHAIN)), CHAIN_EDGES)
+    assert plan.error is None
+    assert plan.order == ["in", "gen", "up", "out"]
+    assert plan.nodes_to_run(["gen"]) == ["in", "gen"]
+
+
+def test_compile_plan_rejects_cycles():
+    plan = build_plan(CHAIN, CHAIN_EDGES + [("up", "gen")])
+    assert plan.error == "Workflow contains cycles"
+
+
+def test_compile_plan_rejects_cycles_through_references():
+    nodes = [("a", "replicate", {"model_id": "m/a", "parameters": {"prompt": "$b"}}), ("b", "replicate", {"model_id": "m/b"})]
+    plan = build_plan(nodes, [("a", "b")])
+    assert plan.error == "Workflow contains cycles"
+
+
+def test_compile_plan_rejects_unconnected_nodes():
+    plan = build_plan(CHAIN + [("loose", "transform")], CHAIN_EDGES)
+    assert plan.error == "Node loose is not connected"
+
+
+def test_compile_plan_requires_an_output():
+    plan = build_plan([("in", "input"), ("t", "transform")], [("in", "t")])
+    assert plan.error == "Workflow must have at least one output node or AI model node"
+
+
+def test_reusable_keeps_unchanged_prefix():
+    plan = build_plan(CHAIN, CHAIN_EDGES)
+    finished = {node_id: plan.fingerprint(node_id) for node_id in plan.order}
+    assert plan.reusable(plan.order, finished) == set(plan.order)
+
+
+def test_reusable_reruns_edited_node_and_everything_after_it():
+    finished = {node_id: build_plan(CHAIN, CHAIN_EDGES).fingerprint(node_id) for node_id in ("in", "gen", "up", "out")}
+    edited = [spec if spec[0] != "gen" else ("gen", "replicate", {"model_id": "m/gen", "parameters": {"seed": 2}}) for spec in CHAIN]
+    plan = build_plan(edited, CHAIN_EDGES)
+    assert plan.reusable(plan.order, finished) == {"in"}
+
+
+def test_reusable_ignores_canvas_state():
+    finished = {node_id: build_plan(CHAIN, CHAIN_EDGES).fingerprint(node_id) for node_id in ("in", "gen", "up", "out")}
+    # Outputs the editor saves into node data do not change what the node computes
+    shown = [spec if spec[0] != "gen" else ("gen", "replicate", {"model_id": "m/gen", "output": "https://x/1.png"}) for spec in CHAIN]
+    plan = build_plan(shown, CHAIN_EDGES)
+    assert plan.reusable(plan.order, finished) == set(plan.order)
+
+
+def test_reusable_needs_dependencies_reused():
+    plan = build_plan(CHAIN, CHAIN_EDGES)
+    # "gen" never finished, so "up" cannot be reused even though its own fingerprint matches
+    finished = {node_id: plan.fingerprint(node_id) for node_id in ("in", "up", "out")}
+    assert plan.reusable(plan.order, finished) == {"in"}
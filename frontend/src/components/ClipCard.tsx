@@ -87,7 +87,7 @@ export function ClipCard({ clip, originalVideo, tags = [], onDelete, onUpdate }:
             >
                 <div className="absolute inset-0 bg-black/20 group-hover:bg-black/0 transition-colors z-10" />
                 <img
-                    src={clip.thumbnail}
+                    src={clip.thumbnailVariants?.md ?? clip.thumbnail}
                     alt={displayTitle}
                     className="object-cover w-full h-full transform group-hover:scale-105 transition-transform duration-500 ease-out"
                     loading="lazy"
@@ -23,7 +23,7 @@ export function ClipListRow({ clip, tags, onDelete }: ClipListRowProps) {
                 onClick={() => navigate(`/clip/${clip.id}`)}
             >
                 <img
-                    src={clip.thumbnail}
+                    src={clip.thumbnailVariants?.sm ?? clip.thumbnail}
                     alt={clip.title}
                     className="w-full h-full object-cover rounded-md"
                 />
@@ -23,7 +23,7 @@ export function ImageCard({ image, onDelete, onClick }: ImageCardProps) {
             <div className="aspect-square bg-muted relative overflow-hidden">
                 {!imageError ? (
                     <img
-                        src={image.thumbnail_url || image.image_url}
+                        src={image.variants?.md ?? (image.thumbnail_url || image.image_url)}
                         alt={image.title}
                         className="w-full h-full object-cover transition-transform group-hover:scale-105"
                         onError={() => setImageError(true)}
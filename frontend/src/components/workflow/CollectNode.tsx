@@ -0,0 +1,24 @@
+import type { NodeProps } from 'reactflow';
+import { NodeWrapper } from './NodeWrapper';
+import { ListChecks } from 'lucide-react';
+
+export function CollectNode({ id, data, selected }: NodeProps) {
+    // Gathers the per-item results of the For Each node it closes, in item order
+    const results = Array.isArray(data.output) ? data.output : [];
+
+    return (
+        <NodeWrapper
+            id={id}
+            selected={selected}
+            title={data.label || "Collect"}
+            icon={ListChecks}
+            color="bg-gray-600"
+            inputs={[{ id: 'input', label: 'Item result' }]}
+            outputs={[{ id: 'output', label: 'List' }]}
+        >
+            <div className="text-[10px] text-gray-500">
+                {results.length > 0 ? `${results.length} results` : 'Results of every item, as a list'}
+            </div>
+        </NodeWrapper>
+    );
+}
@@ -0,0 +1,40 @@
+import type { NodeProps } from 'reactflow';
+import { NodeWrapper } from './NodeWrapper';
+import { Repeat } from 'lucide-react';
+
+// Matches MAP_MAX_PARALLELISM on the server, which caps whatever is entered here
+const MAX_PARALLELISM = 4;
+
+export function MapNode({ id, data, selected }: NodeProps) {
+    // Everything between this node and its Collect node runs once per list item
+    const items = Array.isArray(data.output) ? data.output : [];
+
+    return (
+        <NodeWrapper
+            id={id}
+            selected={selected}
+            title={data.label || "For Each"}
+            icon={Repeat}
+            color="bg-gray-600"
+            inputs={[{ id: 'input', label: 'List' }]}
+            outputs={[{ id: 'output', label: 'Item' }]}
+        >
+            <div className="flex flex-col gap-2">
+                <label className="text-xs font-medium text-muted-foreground">Run at once (max {MAX_PARALLELISM})</label>
+                <input
+                    type="number"
+                    min={1}
+                    max={MAX_PARALLELISM}
+                    defaultValue={Math.min(data.parallelism || MAX_PARALLELISM, MAX_PARALLELISM)}
+                    onChange={(e) => { data.parallelism = Math.min(Number(e.target.value), MAX_PARALLELISM) || undefined; }}
+                    className="nodrag w-full bg-black/30 border border-white/10 rounded-md px-2 py-1 text-xs text-gray-200"
+                />
+                <p className="text-[10px] text-gray-500">
+                    {items.length > 0
+                        ? `Ran the steps up to Collect for ${items.length} items`
+                        : 'Connect the steps to run per item, ending in a Collect node'}
+                </p>
+            </div>
+        </NodeWrapper>
+    );
+}
@@ -8,10 +8,12 @@ import {
     Film, // Video
     Music, // Audio
     Layers, // Utils
-    Lightbulb // Ideation
+    Lightbulb, // Ideation
+    Repeat, // Map
+    ListChecks // Collect
 } from 'lucide-react';
 
-export type NodeType = 'input' | 'llm_model' | 'output' | 'utility' | 'media_input' | 'ideation_source';
+export type NodeType = 'input' | 'llm_model' | 'output' | 'utility' | 'media_input' | 'ideation_source' | 'map' | 'collect';
 
 export interface NodeParam {
     name: string;
@@ -684,6 +686,32 @@ export const NODE_DEFINITIONS: NodeDefinition[] = [
         inputs: [{ name: 'text', type: 'string' }],
         outputs: [{ name: 'output', type: 'audio' }],
         parameters: []
+    },
+
+    // --- UTILITIES ---
+    {
+        id: 'map',
+        type: 'map',
+        label: 'For Each',
+        description: 'Run the following steps once per list item',
+        icon: Repeat,
+        category: 'utils',
+        inputs: [{ name: 'input', type: 'list', label: 'List' }],
+        outputs: [{ name: 'output', type: 'any', label: 'Item' }],
+        parameters: [
+            { name: 'parallelism', label: 'Run at once', type: 'number', defaultValue: 4 }
+        ]
+    },
+    {
+        id: 'collect',
+        type: 'collect',
+        label: 'Collect',
+        description: 'Gather the results of a For Each into a list',
+        icon: ListChecks,
+        category: 'utils',
+        inputs: [{ name: 'input', type: 'any', label: 'Item result' }],
+        outputs: [{ name: 'output', type: 'list', label: 'List' }],
+        parameters: []
     }
 ];
 
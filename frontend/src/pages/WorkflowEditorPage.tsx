@@ -38,6 +38,8 @@ import { InpaintNode } from '../components/workflow/InpaintNode';
 import { MaskEditorNode } from '../components/workflow/MaskEditorNode';
 import { LLMNode } from '../components/workflow/LLMNode';
 import { MediaInputNode } from '../components/workflow/MediaInputNode';
+import { MapNode } from '../components/workflow/MapNode';
+import { CollectNode } from '../components/workflow/CollectNode';
 import { MediaPickerModal } from '../components/workflow/MediaPickerModal';
 import { NodeDetailModal } from '../components/workflow/NodeDetailModal';
 import { ConfirmModal } from '../components/ConfirmModal';
@@ -57,6 +59,8 @@ const nodeTypes: NodeTypes = {
     llm_model: LLMNode,
     media_input: MediaInputNode,
     ideation_source: VideoIdeationNode,
+    map: MapNode,
+    collect: CollectNode,
 };
 
 function ZoomIndicator() {
@@ -380,6 +384,23 @@ function WorkflowEditor() {
             const eventSource = workflowApi.streamExecution(
                 execution.id,
                 (data) => {
+                    // Per-node progress: light up each node as soon as it finishes
+                    if (data.type === 'node') {
+                        setNodes((nds) => nds.map(node => {
+                            if (node.id !== data.node_id) return node;
+                            return {
+                                ...node,
+                                data: {
+                                    ...node.data,
+                                    loading: data.node_status === 'running',
+                                    ...(data.node_status === 'completed' ? { output: data.output } : {}),
+                                    ...(data.node_status === 'failed' ? { error: data.error_message } : {})
+                                }
+                            };
+                        }));
+                        return;
+                    }
+
                     if (data.status === 'running') {
                     }
 
@@ -6,6 +6,8 @@ export interface Clip {
     end?: number;
     title: string;
     thumbnail: string;
+    // Resized WebP versions of `thumbnail` (sm/md/lg), when the backend can produce them
+    thumbnailVariants?: { sm: string; md: string; lg: string } | null;
     createdAt: number;
 
     tagIds?: string[];
@@ -9,6 +9,7 @@ export interface Image {
     source_url?: string;
     source_domain?: string;
     thumbnail_url?: string;
+    variants?: { sm: string; md: string; lg: string } | null;
     width?: number;
     height?: number;
     notes?: string;
@@ -32,6 +32,19 @@ export interface WorkflowExecution {
   completed_at?: number;
 }
 
+// Streamed for every node state change of an execution
+export interface NodeExecutionEvent {
+  type: 'node';
+  node_id: string;
+  node_status: 'running' | 'completed' | 'failed' | 'cancelled';
+  cached: boolean;
+  output?: any;
+  error_message?: string;
+  credits_used: number;
+  started_at: number;
+  completed_at?: number;
+}
+
 const getAuthHeaders = () => {
   const token = localStorage.getItem('clipcoba_token');
   return {
@@ -189,6 +202,18 @@ export const workflowApi = {
     return eventSource;
   },
 
+  // Per-node state of an execution
+  async getNodeExecutions(executionId: string): Promise<NodeExecutionEvent[]> {
+    const response = await fetch(
+      `${API_BASE_URL}/api/executions/${executionId}/nodes`,
+      {
+        headers: getAuthHeaders(),
+      }
+    );
+    if (!response.ok) throw new Error('Failed to fetch node executions');
+    return response.json();
+  },
+
   // List executions for a workflow
   async listExecutions(
     workflowId: string,